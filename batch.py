@@ -0,0 +1,84 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from incremental import build_report, prune_segment_cache, SEGMENT_CACHE_DIR
+from pdf_compiler import compile_pdfs, reader_pool, CompilePlan
+from pdf_index import get_index
+from reports import Report, load_reports
+
+def load_report_specs(path):
+    """Reports from a reports.json file, or from every .json file in a directory.
+
+    Each file holds one report object or a list of them, in the format the
+    GUI saves.
+    """
+    if not os.path.isdir(path):
+        return load_reports(path)
+    reports = []
+    for name in sorted(os.listdir(path)):
+        if not name.endswith('.json'):
+            continue
+        with open(os.path.join(path, name)) as f:
+            data = json.load(f)
+        reports.extend(Report(**item) for item in (data if isinstance(data, list) else [data]))
+    return reports
+
+def _safe_filename(name):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in name) or "report"
+
+def _compile_one(report, output_dir, incremental, cache_dir):
+    output_file = os.path.join(output_dir, f"{_safe_filename(report.name)}.pdf")
+    start = time.perf_counter()
+    result = {'name': report.name, 'output': output_file, 'thread': threading.current_thread().name}
+    try:
+        if incremental:
+            manifest = build_report(report, output_file, cache_dir=cache_dir, prune=False)
+            result.update(pages=manifest['pages'], bytes_written=manifest['bytes_written'],
+                          segments_reused=manifest['reused'], segments_rebuilt=manifest['rebuilt'])
+        else:
+            # Page counts come from the shared metadata index, so a source
+            # is parsed for them at most once across the batch.
+            index = get_index()
+            plan = CompilePlan.from_selections(report.file_paths, report.page_selections,
+                                               report.cover_pages if report.use_cover_pages else None,
+                                               page_count=lambda path: index.lookup(path)['num_pages'])
+            stats = compile_pdfs(plan, output_file, use_cover_pages=report.use_cover_pages)
+            result.update(pages=stats['pages'], bytes_written=stats['bytes_written'])
+        result['status'] = 'ok'
+    except Exception as e:
+        result.update(status='failed', error=str(e))
+    result['seconds'] = round(time.perf_counter() - start, 4)
+    return result
+
+def run_batch(reports, output_dir, workers=4, incremental=False, cache_dir=SEGMENT_CACHE_DIR):
+    """Compile ``reports`` concurrently and return a machine-readable summary.
+
+    Jobs run on threads of one process so they share the reader pool and
+    the metadata index: a source used by many reports is parsed once (as
+    long as the pool is large enough to hold the working set).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    index = get_index()
+    parses_before = index.parses
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as executor:
+        results = list(executor.map(lambda report: _compile_one(report, output_dir, incremental, cache_dir), reports))
+    if incremental:
+        # Pruned once all builds are done, so no build loses a segment it
+        # has yet to splice.
+        prune_segment_cache(cache_dir)
+    return {
+        'reports': results,
+        'succeeded': sum(1 for r in results if r['status'] == 'ok'),
+        'failed': sum(1 for r in results if r['status'] != 'ok'),
+        'total_pages': sum(r.get('pages', 0) for r in results),
+        'total_bytes': sum(r.get('bytes_written', 0) for r in results),
+        'seconds': round(time.perf_counter() - start, 4),
+        'workers': workers,
+        'reader_pool': reader_pool.stats(),
+        'metadata_index_parses': index.parses - parses_before,
+    }
+
+__all__ = ['run_batch', 'load_report_specs']
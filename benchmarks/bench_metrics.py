@@ -0,0 +1,81 @@
+# Cost of the always-on instrumentation: the per-call price of a stage
+# timer times the number a real compile makes, and serializing a merged
+# document through the metered output file versus a plain file.
+# Run from the repository root:
+#   python -m benchmarks.bench_metrics --pages 2000
+import argparse
+import io
+import os
+import tempfile
+import time
+from PyPDF2 import PdfReader, PdfWriter
+
+import metrics
+import pdf_compiler
+from benchmarks.bench_plan import make_text_pdf
+from pdf_compiler import compile_pdfs
+
+def per_call(func, calls=200000):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    def timed_stage():
+        with metrics.stage('bench'):
+            pass
+
+    trace = metrics.Trace()
+
+    def traced_stage():
+        with metrics.tracing(trace), metrics.stage('bench'):
+            pass
+
+    stage_cost = per_call(timed_stage)
+    traced_cost = per_call(traced_stage, calls=min(200000, metrics.MAX_TRACE_SPANS))
+    print(f"stage timer           {stage_cost * 1e6:6.2f} us/call ({traced_cost * 1e6:.2f} us inside a trace)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sources = []
+        for i in range(args.files):
+            path = os.path.join(tmp, f"in{i}.pdf")
+            make_text_pdf(path, args.pages // args.files)
+            sources.append(path)
+
+        start = time.perf_counter()
+        stats = compile_pdfs(sources, os.path.join(tmp, "out.pdf"), trace=True)
+        elapsed = time.perf_counter() - start
+        stages = sum(totals['count'] for totals in stats['trace']['stages'].values())
+        print(f"compile of {stats['pages']} pages from {args.files} files: {elapsed * 1000:.1f} ms, "
+              f"{stages} stage timers ({stages * traced_cost / elapsed:.4%} of the compile)")
+
+        # Serializing the same document to a plain file and through the
+        # metered wrapper that counts bytes and times the writes.
+        writer = PdfWriter()
+        for path in sources:
+            writer.append(PdfReader(path))
+        best = {}
+        for _ in range(args.repeat):
+            for label in ("plain file", "metered file"):
+                with open(os.path.join(tmp, "serialized.pdf"), "wb") as f:
+                    start = time.perf_counter()
+                    if label == "plain file":
+                        writer.write(f)
+                    else:
+                        target = io.BufferedWriter(pdf_compiler._MeteredFile(f), pdf_compiler.STREAM_CHUNK_BYTES)
+                        writer.write(target)
+                        target.flush()
+                    best[label] = min(best.get(label, float("inf")), time.perf_counter() - start)
+        for label, seconds in best.items():
+            print(f"serialize to {label:<12} {seconds * 1000:8.1f} ms")
+        print(f"metering overhead {(best['metered file'] / best['plain file'] - 1):+.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# Reading large sources through a memory map (PDF_MMAP=1, the default)
+# versus into memory (PDF_MMAP=0): wall time, throughput and peak memory of
+# get_pdf_info, a plain and a streaming compile, a repeated compile through
+# the reader pool and a PyMuPDF render, each in a fresh process. Memory is
+# sampled from /proc: RssAnon is process memory, RssFile is page cache that
+# is mapped in and can be dropped by the kernel at any time.
+# Run from the repository root:
+#   python -m benchmarks.bench_mmap --size-mb 2048
+import argparse
+import gc
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from io import BytesIO
+from PIL import Image
+
+SCENARIOS = ('pdf_info', 'compile', 'compile_streaming', 'compile_twice', 'render_path', 'render_stream')
+
+def make_big_pdf(path, size_mb, image_mb=8):
+    """A PDF of one large JPEG (DCTDecode) image per page, written directly."""
+    rng = random.Random(0)
+    side = 1500
+    while True:
+        buf = BytesIO()
+        Image.frombytes("RGB", (side, side), rng.randbytes(side * side * 3)).save(buf, "JPEG", quality=95)
+        if buf.tell() >= image_mb * 2 ** 20:
+            break
+        side += 500
+    jpeg = buf.getvalue()
+    pages = max(1, size_mb * 2 ** 20 // len(jpeg))
+    offsets = []
+    with open(path, "wb") as f:
+        def obj(body, data=None):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % len(offsets) + body)
+            if data is not None:
+                f.write(b"\nstream\n" + data + b"\nendstream")
+            f.write(b"\nendobj\n")
+
+        f.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+        obj(b"<< /Type /Catalog /Pages 2 0 R >>")
+        kids = b" ".join(b"%d 0 R" % (3 + 3 * i + 2) for i in range(pages))
+        obj(b"<< /Type /Pages /Count %d /Kids [%s] >>" % (pages, kids))
+        content = b"q 612 0 0 792 0 0 cm /Im0 Do Q"
+        for i in range(pages):
+            image = 3 + 3 * i
+            obj(b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB "
+                b"/BitsPerComponent 8 /Filter /DCTDecode /Length %d >>" % (side, side, len(jpeg)), jpeg)
+            obj(b"<< /Length %d >>" % len(content), content)
+            obj(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+                b"/Resources << /XObject << /Im0 %d 0 R >> >> >>" % (image + 1, image))
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(offsets) + 1))
+        f.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(offsets) + 1, xref))
+    return pages
+
+class MemorySampler(threading.Thread):
+    def __init__(self, interval=0.02):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = {'RssAnon': 0, 'RssFile': 0}
+        self.stop = threading.Event()
+
+    def sample(self):
+        with open("/proc/self/status") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in self.peak:
+                    self.peak[name] = max(self.peak[name], int(value.split()[0]) * 1024)
+
+    def run(self):
+        while not self.stop.wait(self.interval):
+            self.sample()
+
+def child(scenario, source, workdir):
+    import fitz
+    import pdf_compiler
+    output = os.path.join(workdir, "out.pdf")
+    sampler = MemorySampler()
+    sampler.sample()
+    sampler.start()
+    start = time.perf_counter()
+    if scenario == 'pdf_info':
+        pdf_compiler.get_pdf_info(source)
+    elif scenario in ('compile', 'compile_streaming'):
+        pdf_compiler.compile_pdfs([source], output, streaming=scenario == 'compile_streaming')
+    elif scenario == 'compile_twice':
+        # The second compile gets the pooled reader, whose parsed streams
+        # were dropped after the first one. The first writer is garbage in
+        # reference cycles until the collector runs.
+        pdf_compiler.compile_pdfs([source], output)
+        gc.collect()
+        pdf_compiler.compile_pdfs([source], output)
+    elif scenario == 'render_path':
+        with fitz.open(source) as doc:
+            doc[len(doc) // 2].get_pixmap(dpi=36)
+    elif scenario == 'render_stream':
+        import mmap
+        with open(source, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            with fitz.open(stream=view, filetype="pdf") as doc:
+                doc[len(doc) // 2].get_pixmap(dpi=36)
+            view.release()
+    seconds = time.perf_counter() - start
+    sampler.stop.set()
+    sampler.join()
+    sampler.sample()
+    print(json.dumps({'seconds': seconds, 'anon': sampler.peak['RssAnon'], 'file': sampler.peak['RssFile'],
+                      'maxrss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=2048)
+    parser.add_argument("--source", help="existing PDF to use instead of a generated one")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as tmp:
+        source = args.source
+        if source is None:
+            source = os.path.join(tmp, "big.pdf")
+            start = time.perf_counter()
+            pages = make_big_pdf(source, args.size_mb)
+            print(f"generated {os.path.getsize(source) / 2 ** 20:.0f} MiB, {pages} pages "
+                  f"in {time.perf_counter() - start:.1f} s")
+        size = os.path.getsize(source)
+        for scenario in args.scenarios.split(","):
+            for mmap_enabled in ("0", "1"):
+                if scenario.startswith("render") and mmap_enabled == "0":
+                    continue
+                env = dict(os.environ, PDF_MMAP=mmap_enabled, PYTHONPATH=root)
+                result = subprocess.run([sys.executable, "-m", "benchmarks.bench_mmap", "--child", scenario,
+                                         source, tmp], cwd=root, env=env, capture_output=True, text=True)
+                if result.returncode != 0:
+                    print(f"{scenario} PDF_MMAP={mmap_enabled} failed (exit {result.returncode}): "
+                          f"{result.stderr.strip().splitlines()[-1:] or ''}")
+                    continue
+                r = json.loads(result.stdout.strip().splitlines()[-1])
+                label = scenario if scenario.startswith("render") else f"{scenario} PDF_MMAP={mmap_enabled}"
+                print(f"{label:<28} {r['seconds']:7.2f} s  {size / 2 ** 20 / r['seconds']:8.0f} MiB/s  "
+                      f"anon {r['anon'] / 2 ** 20:7.0f} MiB  file-backed {r['file'] / 2 ** 20:6.0f} MiB")
+
+if __name__ == "__main__":
+    main()
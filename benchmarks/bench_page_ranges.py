@@ -0,0 +1,129 @@
+# PageRangeSet against the two parsers it replaced (parse_page_range from
+# pdf_compiler.py and parse_page_selection from gui.py): a randomized
+# cross-check of results, then parse timings. Run from the repository root:
+#   python -m benchmarks.bench_page_ranges --cases 20000
+import argparse
+import random
+import time
+import tracemalloc
+
+from page_ranges import PageRangeSet, PageRangeError, np
+
+def legacy_parse_page_range(page_range_str, max_pages):
+    pages = set()
+    ranges = page_range_str.split(',')
+    for r in ranges:
+        if '-' in r:
+            start, end = map(int, r.split('-'))
+            pages.update(range(start, min(end + 1, max_pages + 1)))
+        else:
+            page = int(r)
+            if page <= max_pages:
+                pages.add(page)
+    return sorted(pages)
+
+def legacy_parse_page_selection(pages_str, max_pages):
+    pages = set()
+    for part in pages_str.split(','):
+        part = part.strip()
+        try:
+            if '-' in part:
+                start, end = map(int, part.split('-'))
+                if start > end:
+                    raise ValueError(f"Invalid range: {start}-{end}")
+                pages.update(range(start, end + 1))
+            else:
+                pages.add(int(part))
+        except ValueError:
+            raise ValueError(f"Invalid input: {part}")
+    return sorted([p for p in pages if 1 <= p <= max_pages])
+
+def reference(items, num_pages):
+    # Brute force over explicit sets: the specification of the new syntax.
+    def resolve(n):
+        return n if n > 0 else num_pages + 1 + n
+    include, exclude = set(), set()
+    for negate, start, stop, step in items:
+        start = resolve(start)
+        stop = num_pages if stop == "open" else resolve(stop)
+        pages = {p for p in range(start, stop + 1, step) if 1 <= p <= num_pages}
+        (exclude if negate else include).update(pages)
+    if all(negate for negate, *_ in items):
+        include = set(range(1, num_pages + 1))
+    return sorted(include - exclude)
+
+def random_legacy_case(rng, num_pages):
+    items = []
+    for _ in range(rng.randint(1, 6)):
+        start = rng.randint(1, num_pages + 5)
+        if rng.random() < 0.5:
+            items.append(str(start))
+        else:
+            items.append(f"{start}-{start + rng.randint(0, num_pages)}")
+    return ",".join(items)
+
+def random_extended_case(rng, num_pages):
+    items, text = [], []
+    for _ in range(rng.randint(1, 6)):
+        negate = rng.random() < 0.3
+        step = rng.choice([1, 1, 2, 3, 7])
+        start = rng.choice([rng.randint(1, num_pages + 3), -rng.randint(1, num_pages + 3)])
+        stop = rng.choice(["open", start + rng.randint(0, num_pages), -rng.randint(1, 3)])
+        if stop == 0:
+            stop = -1
+        items.append((negate, start, stop, step))
+        body = f"{start}-" if stop == "open" else f"{start}-{stop}"
+        text.append(("!" if negate else "") + body + (f":{step}" if step != 1 else ""))
+    return items, ",".join(text)
+
+def cross_check(cases, seed):
+    rng = random.Random(seed)
+    for _ in range(cases):
+        num_pages = rng.randint(1, 60)
+        text = random_legacy_case(rng, num_pages)
+        new = PageRangeSet.parse(text, num_pages).to_list()
+        assert new == legacy_parse_page_range(text, num_pages), text
+        assert new == legacy_parse_page_selection(text, num_pages), text
+
+        items, text = random_extended_case(rng, num_pages)
+        try:
+            ranges = PageRangeSet.parse(text, num_pages)
+        except PageRangeError:
+            # Only ranges that end before they start (after resolving negatives) are rejected.
+            resolve = lambda n: n if n > 0 else num_pages + 1 + n
+            assert any(stop != "open" and resolve(stop) < resolve(start) for _, start, stop, _ in items), text
+            continue
+        expected = reference(items, num_pages)
+        assert ranges.to_list() == expected, (text, ranges.to_list(), expected)
+        assert len(ranges) == len(expected), text
+        assert all(page in ranges for page in expected), text
+        if np is not None:
+            assert ranges.to_numpy(zero_based=True).tolist() == [p - 1 for p in expected], text
+    print(f"{cases} random cases agree with the legacy parsers and the reference model")
+
+def timed(label, func, text, num_pages, repeat):
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(text, num_pages)
+    elapsed = (time.perf_counter() - start) / repeat
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"  {label:<28} {elapsed * 1e6:12.1f} us  peak {peak / 1024:10.1f} KB")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cross_check(args.cases, args.seed)
+    for text, num_pages in [("1,3,5-7,10-12", 50), ("1-100000", 100000), ("1-1000000", 1000000)]:
+        print(f"{text!r} of {num_pages} pages")
+        timed("legacy parse_page_range", legacy_parse_page_range, text, num_pages, args.repeat)
+        timed("legacy parse_page_selection", legacy_parse_page_selection, text, num_pages, args.repeat)
+        timed("PageRangeSet.parse", PageRangeSet.parse, text, num_pages, args.repeat)
+
+if __name__ == "__main__":
+    main()
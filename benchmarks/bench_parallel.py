@@ -0,0 +1,72 @@
+# Scaling of compile_pdfs(workers=N) against the serial compile, with a
+# page-for-page check of the output. Run from the repository root:
+# python -m benchmarks.bench_parallel
+#
+# "wall" is measured. "projected" is serial time / (slowest chunk + join),
+# with each chunk timed on its own: the wall time a machine with N free
+# cores would see. The two agree only when that many cores are available.
+import argparse
+import os
+import tempfile
+import time
+from PyPDF2 import PdfReader
+
+import pdf_compiler
+from compile_plan import CompilePlan
+from benchmarks.bench_reader_pool import make_corpus
+from stream_writer import StreamingPdfWriter
+
+def page_signature(path):
+    reader = PdfReader(path)
+    return [(tuple(page.mediabox), page.get_contents().get_data() if page.get_contents() else b"")
+            for page in reader.pages]
+
+def critical_path(inputs, workers, tmp):
+    """(slowest chunk seconds, join seconds) for ``workers`` chunks, timed one at a time."""
+    runs = list(CompilePlan.from_files(inputs))
+    chunks = pdf_compiler._split_chunks(runs, [len(indices) for _, indices in runs], min(workers, len(runs)))
+    paths = [os.path.join(tmp, f"chunk_{workers}_{i}.pdf") for i in range(len(chunks))]
+    chunk_seconds = []
+    for chunk, path in zip(chunks, paths):
+        start = time.perf_counter()
+        pdf_compiler._compile_chunk(chunk, path)
+        chunk_seconds.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    with open(os.path.join(tmp, f"joined_{workers}.pdf"), "wb") as f:
+        writer = StreamingPdfWriter(f)
+        for path in paths:
+            writer.splice(path, path + ".splice")
+        writer.close()
+    return max(chunk_seconds), time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=64)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, 8, 16])
+    args = parser.parse_args()
+
+    print(f"cpus={os.cpu_count()}")
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs = make_corpus(tmp, args.files, args.pages)
+        pdf_compiler.reader_pool.clear()
+        serial_output = os.path.join(tmp, "out_serial.pdf")
+        start = time.perf_counter()
+        pdf_compiler.compile_pdfs(inputs, serial_output)
+        serial = time.perf_counter() - start
+        reference = page_signature(serial_output)
+        print(f"serial     wall={serial:.3f}s pages={len(reference)}")
+        for workers in args.workers:
+            pdf_compiler.reader_pool.clear()
+            output = os.path.join(tmp, f"out_{workers}.pdf")
+            start = time.perf_counter()
+            stats = pdf_compiler.compile_pdfs(inputs, output, workers=workers)
+            elapsed = time.perf_counter() - start
+            join = stats['timings']['stages'].get('join_chunk', {}).get('seconds', 0.0)
+            slowest, join_alone = critical_path(inputs, workers, tmp)
+            identical = "identical" if page_signature(output) == reference else "MISMATCH"
+            print(f"workers={workers:<3} wall={elapsed:.3f}s speedup={serial / elapsed:.2f}x join={join:.3f}s "
+                  f"slowest_chunk={slowest:.3f}s projected={serial / (slowest + join_alone):.2f}x {identical}")
+
+if __name__ == "__main__":
+    main()
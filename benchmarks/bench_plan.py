@@ -0,0 +1,120 @@
+# Selecting a few pages from a large PDF: page-tree lookup through a
+# CompilePlan versus flattening the whole tree with reader.pages.
+# Run from the repository root:
+#   python -m benchmarks.bench_plan --pages 5000 --select 10
+import argparse
+import os
+import tempfile
+import time
+from PyPDF2 import PdfReader, PdfWriter
+from reportlab.pdfgen import canvas
+
+from page_tree import page_at
+from pdf_compiler import compile_pdfs, CompilePlan
+
+def make_text_pdf(path, pages):
+    c = canvas.Canvas(path)
+    for i in range(pages):
+        c.drawString(100, 700, f"page {i + 1}")
+        c.showPage()
+    c.save()
+
+def make_nested_tree_pdf(path):
+    """Three pages behind an empty /Pages node and kids of mixed depth.
+
+    Root /Count 3 with kids [empty /Pages, Page, /Pages [Page, /Pages [Page]]];
+    page N's content stream is "% page N". Returns the expected contents.
+    """
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        2: b"<< /Type /Pages /Kids [3 0 R 4 0 R 5 0 R] /Count 3 /MediaBox [0 0 200 200] >>",
+        3: b"<< /Type /Pages /Kids [] /Count 0 /Parent 2 0 R >>",
+        4: b"<< /Type /Page /Parent 2 0 R /Contents 8 0 R >>",
+        5: b"<< /Type /Pages /Kids [6 0 R 7 0 R] /Count 2 /Parent 2 0 R >>",
+        6: b"<< /Type /Page /Parent 5 0 R /Contents 9 0 R >>",
+        7: b"<< /Type /Pages /Kids [11 0 R] /Count 1 /Parent 5 0 R >>",
+        11: b"<< /Type /Page /Parent 7 0 R /Contents 10 0 R >>",
+    }
+    expected = []
+    for page, num in enumerate((8, 9, 10), 1):
+        data = b"%% page %d" % page
+        expected.append(data)
+        objects[num] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(data), data)
+    out = bytearray(b"%PDF-1.7\n")
+    offsets = {}
+    for num in sorted(objects):
+        offsets[num] = len(out)
+        out += b"%d 0 obj\n%s\nendobj\n" % (num, objects[num])
+    xref = len(out)
+    size = max(objects) + 1
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % size
+    for num in range(1, size):
+        out += b"%010d 00000 n \n" % offsets[num] if num in offsets else b"0000000000 65535 f \n"
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+    return expected
+
+def check_nested_tree(tmp):
+    source = os.path.join(tmp, "nested.pdf")
+    expected = make_nested_tree_pdf(source)
+    reader = PdfReader(source)
+    found = [page_at(reader, i).get_contents().get_data().strip() for i in range(len(expected))]
+    print("nested page tree: page_at matches" if found == expected else f"nested page tree: page_at mismatch {found}")
+    output = os.path.join(tmp, "nested_selected.pdf")
+    compile_pdfs([source], output, cover_pages="2")
+    selected = [page.get_contents().get_data().strip() for page in PdfReader(output).pages]
+    print("nested page tree: cover_pages='2' matches" if selected == expected[1:2]
+          else f"nested page tree: cover_pages='2' mismatch {selected}")
+
+def legacy_select(path, indices, output_path):
+    reader = PdfReader(path)
+    writer = PdfWriter()
+    for i in indices:
+        writer.add_page(reader.pages[i])
+    with open(output_path, "wb") as f:
+        writer.write(f)
+    return reader
+
+def resolved(reader):
+    return sum(len(objects) for objects in reader.resolved_objects.values())
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=5000)
+    parser.add_argument("--select", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "large.pdf")
+        make_text_pdf(source, args.pages)
+        step = max(1, args.pages // args.select)
+        indices = list(range(0, args.pages, step))[:args.select]
+        print(f"{args.pages}-page source, selecting {len(indices)} pages")
+
+        start = time.perf_counter()
+        reader = legacy_select(source, indices, os.path.join(tmp, "legacy.pdf"))
+        print(f"{'reader.pages':<16} {(time.perf_counter() - start) * 1000:9.1f} ms, "
+              f"{resolved(reader)} objects parsed")
+
+        for streaming in (False, True):
+            plan = CompilePlan()
+            plan.add(source, indices)
+            output = os.path.join(tmp, f"plan_{streaming}.pdf")
+            start = time.perf_counter()
+            compile_pdfs(plan, output, streaming=streaming)
+            label = "plan (streaming)" if streaming else "plan"
+            print(f"{label:<16} {(time.perf_counter() - start) * 1000:9.1f} ms")
+            texts = [page.extract_text().strip() for page in PdfReader(output).pages]
+            expected = [f"page {i + 1}" for i in indices]
+            print("  selected pages match" if texts == expected else f"  mismatch: {texts}")
+
+        reader = PdfReader(source)
+        for i in indices:
+            page_at(reader, i)
+        print(f"page_at touched {resolved(reader)} objects for {len(indices)} pages")
+
+        check_nested_tree(tmp)
+
+if __name__ == "__main__":
+    main()
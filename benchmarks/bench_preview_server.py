@@ -0,0 +1,160 @@
+# Previews from the Flask route on request threads (what the dev server
+# does) versus preview_server's ASGI app with its renderer processes:
+# throughput of hundreds of concurrent uncached renders, and the latency of
+# a cheap request (the document list) sent every 50 ms while those
+# renders are running. The ASGI app is driven in-process, so no server or
+# sockets are involved on either side. Run from the repository root:
+#   python -m benchmarks.bench_preview_server --requests 400 --workers 4
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.corpus import build_corpus
+
+TOKEN = "bench"
+# Seconds between cheap requests sent while the renders run
+CHEAP_INTERVAL = 0.05
+
+def _summary(label, latencies, elapsed=None):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    rate = f"  {len(latencies) / elapsed:7.1f} req/s" if elapsed else ""
+    print(f"  {label:<30} n={len(latencies):<4} p50 {statistics.median(latencies) * 1000:8.1f} ms  "
+          f"p99 {p99 * 1000:8.1f} ms{rate}")
+
+def _requests(names, pages, count, width):
+    # Distinct (document, page, width) triples, so every request is a render.
+    per_width = len(names) * pages
+    return [(names[i % len(names)], 1 + (i // len(names)) % pages, width + i // per_width) for i in range(count)]
+
+def run_flask(heavy, cheap_path, concurrency):
+    import main
+    client = main.app.test_client()
+    headers = {'X-API-Token': TOKEN}
+
+    def get(path, start=None):
+        start = start or time.perf_counter()
+        response = client.get(path, headers=headers)
+        assert response.status_code == 200, response.get_data()[:200]
+        return time.perf_counter() - start
+
+    cheap = []
+    finished = threading.Event()
+
+    def probe():
+        # A thread of its own, as the dev server gives every connection; it
+        # still needs the GIL the renders hold. Latency counts from when each
+        # request was due, so time spent starved shows up.
+        due = time.perf_counter()
+        while not finished.is_set():
+            due += CHEAP_INTERVAL
+            time.sleep(max(0, due - time.perf_counter()))
+            cheap.append(get(cheap_path, due))
+
+    prober = threading.Thread(target=probe)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        prober.start()
+        futures = [pool.submit(get, f"/preview_pdf/{name}?pages={page}&width={width}") for name, page, width in heavy]
+        renders = [future.result() for future in futures]
+        elapsed = time.perf_counter() - start
+    finished.set()
+    prober.join()
+    return renders, elapsed, cheap
+
+async def _asgi_get(app, path, query, start=None):
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode(), 'root_path': '',
+             'headers': [(b'x-api-token', TOKEN.encode())], 'http_version': '1.1', 'scheme': 'http'}
+    start = start or time.perf_counter()
+    await app(scope, receive, send)
+    assert sent[0]['status'] == 200, sent[-1].get('body', b'')[:200]
+    return time.perf_counter() - start
+
+async def run_asgi(heavy, cheap_path, workers):
+    from preview_server import PreviewServer
+    app = PreviewServer(workers=workers, timeout=3600)
+    path, _, query = cheap_path.partition('?')
+    # Start the renderers before timing anything.
+    await asyncio.gather(*(_asgi_get(app, f"/preview_pdf/{name}", "pages=1&width=32")
+                           for name, _, _ in heavy[:workers * 4]))
+    start = time.perf_counter()
+    tasks = [asyncio.ensure_future(_asgi_get(app, f"/preview_pdf/{name}", f"pages={page}&width={width}"))
+             for name, page, width in heavy]
+    cheap = []
+    due = time.perf_counter()
+    while not all(task.done() for task in tasks):
+        due += CHEAP_INTERVAL
+        await asyncio.sleep(max(0, due - time.perf_counter()))
+        cheap.append(await _asgi_get(app, path, query, due))
+    renders = [task.result() for task in tasks]
+    elapsed = time.perf_counter() - start
+    app.renderers.shutdown()
+    return renders, elapsed, cheap
+
+def child(args):
+    names = sorted(name for name in os.listdir(".") if name.endswith(".pdf"))
+    from thumbnails import page_count
+    from workspaces import workspace_store
+    workspace = workspace_store.get(workspace_store.key_for(TOKEN))
+    for name in names:
+        workspace.add(name)
+    workspace_store.save(workspace)
+    heavy = _requests(names, min(map(page_count, names)), args.requests, args.width)
+    if args.mode == "flask":
+        renders, elapsed, cheap = run_flask(heavy, "/get_pdfs", args.threads)
+        print(f"Flask route, {args.threads} request threads")
+    else:
+        renders, elapsed, cheap = asyncio.run(run_asgi(heavy, "/get_pdfs", args.workers))
+        print(f"preview_server, {args.workers} renderer process(es)")
+    _summary("renders", renders, elapsed)
+    _summary("/get_pdfs during renders", cheap)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400, help="concurrent preview renders")
+    parser.add_argument("--width", type=int, default=800)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="renderer processes")
+    parser.add_argument("--threads", type=int, default=64, help="request threads on the Flask side")
+    parser.add_argument("--scale", type=float, default=1.0, help="scale of the scanned corpus (see benchmarks.corpus)")
+    parser.add_argument("--mode", choices=("flask", "asgi"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.mode:
+        child(args)
+        return
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sources = build_corpus('scanned', args.scale)
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("flask", "asgi"):
+            # Each side runs in a fresh process with empty caches.
+            workdir = os.path.join(tmp, mode)
+            os.makedirs(workdir)
+            for source in sources:
+                os.symlink(source, os.path.join(workdir, os.path.basename(source)))
+            env = dict(os.environ, PYTHONPATH=root,
+                       THUMBNAIL_CACHE_DIR=os.path.join(workdir, "thumbnails"),
+                       WORKSPACE_DIR=os.path.join(workdir, "workspaces"),
+                       PDF_INDEX_PATH=os.path.join(workdir, "pdf_index.sqlite3"),
+                       SEARCH_INDEX_PATH=os.path.join(workdir, "search_index.sqlite3"))
+            result = subprocess.run([sys.executable, "-m", "benchmarks.bench_preview_server", "--mode", mode]
+                                    + sys.argv[1:], cwd=workdir, env=env)
+            if result.returncode != 0:
+                print(f"{mode} failed (exit {result.returncode})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# Lazy page-count probe versus a full PdfReader parse on scanned-style PDFs
+# (one large image per page). Run from the repository root:
+#   python -m benchmarks.bench_probe --files 5 --pages 200
+import argparse
+import os
+import tempfile
+import time
+from PyPDF2 import PdfReader
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+from PIL import Image
+
+import pdf_compiler
+
+def make_scanned_pdf(path, pages, image_size=1200):
+    noise = Image.effect_noise((image_size, int(image_size * 1.3)), 64).convert("RGB")
+    image = ImageReader(noise)
+    c = canvas.Canvas(path, pagesize=letter)
+    width, height = letter
+    for _ in range(pages):
+        # reportlab embeds the image once and references it from every page,
+        # so vary a label to keep page content streams distinct.
+        c.drawImage(image, 0, 0, width, height)
+        c.drawString(20, 20, f"scan {_}")
+        c.showPage()
+    c.save()
+
+def legacy_get_pdf_info(file_path):
+    with open(file_path, 'rb') as file:
+        pdf = PdfReader(file)
+        return len(pdf.pages), pdf.metadata
+
+def timed(label, func, paths, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = [func(path) for path in paths]
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<22} {elapsed * 1000:9.1f} ms per corpus pass")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--corpus", help="Directory of existing PDFs to use instead of generating one")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.corpus:
+            paths = sorted(os.path.join(args.corpus, name) for name in os.listdir(args.corpus)
+                           if name.lower().endswith(".pdf"))
+        else:
+            paths = [os.path.join(tmp, f"scan_{i}.pdf") for i in range(args.files)]
+            for path in paths:
+                make_scanned_pdf(path, args.pages)
+        total_mb = sum(os.path.getsize(path) for path in paths) / 1e6
+        print(f"{len(paths)} files, {total_mb:.1f} MB")
+        legacy = timed("legacy get_pdf_info", legacy_get_pdf_info, paths, args.repeat)
+        probed = timed("probe_pdf", pdf_compiler.probe_pdf, paths, args.repeat)
+        mismatches = [path for path, old, new in zip(paths, legacy, probed) if old[0] != new['num_pages']]
+        print("page counts match" if not mismatches else f"page count mismatch: {mismatches}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# Pass-through of compressed streams: compiles FlateDecode-heavy and
+# DCTDecode-heavy inputs, checks that the output holds exactly the input
+# streams byte for byte and that no stream was decoded on the way, and
+# times raw copy against the default writer and a decode/re-encode round
+# trip. Run from the repository root:
+#   python -m benchmarks.bench_raw_copy --files 10 --pages 50
+import argparse
+import hashlib
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from PIL import Image
+from PyPDF2 import PdfReader
+from PyPDF2.generic import StreamObject
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+import fitz  # PyMuPDF
+import PyPDF2.filters
+import PyPDF2.generic._data_structures
+
+from benchmarks.corpus import build_corpus
+from pdf_compiler import compile_pdfs
+
+# PyPDF2 decodes every stream through this function; counting its calls
+# shows whether a compile inflated anything.
+decode_calls = Counter()
+_decode = PyPDF2.filters.decode_stream_data
+
+def _counting_decode(stream):
+    decode_calls['decode'] += 1
+    return _decode(stream)
+
+PyPDF2.filters.decode_stream_data = _counting_decode
+PyPDF2.generic._data_structures.decode_stream_data = _counting_decode
+
+def make_flate_pdf(path, pages, rng):
+    """Pages of dense vector text and a lossless (FlateDecode) image."""
+    c = canvas.Canvas(path, invariant=1)
+    for _ in range(pages):
+        for line in range(60):
+            c.drawString(40, 800 - line * 12, " ".join(f"{rng.random():.6f}" for _ in range(10)))
+        image = Image.frombytes("RGB", (64, 64), rng.randbytes(64 * 64 * 3)).resize((400, 400))
+        c.drawImage(ImageReader(image), 100, 100, width=200, height=200)
+        c.showPage()
+    c.save()
+
+def stream_digests(path):
+    """Multiset of the SHA-1s of every stream's encoded bytes in ``path``."""
+    reader = PdfReader(path)
+    numbers = ({num for objects in reader.xref.values() for num in objects} | set(reader.xref_objStm)) - {0}
+    digests = Counter()
+    for num in numbers:
+        obj = reader.get_object(num)
+        if isinstance(obj, StreamObject) and obj.get("/Type") not in ("/ObjStm", "/XRef"):
+            digests[hashlib.sha1(obj._data).hexdigest()] += 1
+    return digests
+
+def round_trip(paths, output):
+    # What a merger that decodes and re-encodes does: every stream inflated
+    # (images too) and deflated again.
+    with fitz.open() as doc:
+        for path in paths:
+            with fitz.open(path) as source:
+                doc.insert_pdf(source)
+        doc.save(output, expand=255, deflate=True)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--scale", type=float, default=1.0, help="scale of the DCT corpora (see benchmarks.corpus)")
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        flate = []
+        for i in range(args.files):
+            path = os.path.join(tmp, f"flate{i:03}.pdf")
+            make_flate_pdf(path, args.pages, rng)
+            flate.append(path)
+        inputs = {
+            'FlateDecode-heavy': flate,
+            'DCTDecode images': build_corpus('images', args.scale),
+            'DCTDecode scans': build_corpus('scanned', args.scale),
+        }
+
+        # The decode counter works: reading a stream's data does call it.
+        decode_calls.clear()
+        sample = PdfReader(flate[0])
+        sample.pages[0].get_contents().get_data()
+        assert decode_calls['decode'] > 0
+
+        output = os.path.join(tmp, "out.pdf")
+        for label, paths in inputs.items():
+            size = sum(os.path.getsize(path) for path in paths)
+            expected = sum((stream_digests(path) for path in paths), Counter())
+            print(f"{label}: {len(paths)} files, {size / 2 ** 20:.1f} MiB, {sum(expected.values())} streams")
+            for mode, options in (("raw copy", {'raw_copy': True}), ("default", {})):
+                decode_calls.clear()
+                start = time.perf_counter()
+                stats = compile_pdfs(paths, output, **options)
+                elapsed = time.perf_counter() - start
+                # Every input stream is in the output, byte for byte, and nothing else is.
+                assert stream_digests(output) == expected, f"{label} {mode}: output streams differ from input"
+                assert decode_calls['decode'] == 0, f"{label} {mode}: {decode_calls['decode']} stream(s) decoded"
+                copied = f", {stats['streams_copied']} streams copied" if 'streams_copied' in stats else ""
+                print(f"  {mode:<22} {elapsed * 1000:8.1f} ms  {size / 2 ** 20 / elapsed:7.0f} MiB/s  "
+                      f"byte-identical, 0 decodes{copied}")
+            start = time.perf_counter()
+            round_trip(paths, output)
+            elapsed = time.perf_counter() - start
+            print(f"  {'decode + re-encode':<22} {elapsed * 1000:8.1f} ms  {size / 2 ** 20 / elapsed:7.0f} MiB/s  "
+                  f"output {os.path.getsize(output) / size:.2f}x the input size")
+
+if __name__ == "__main__":
+    main()
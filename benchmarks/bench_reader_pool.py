@@ -0,0 +1,79 @@
+# Compare the old double-parse compile loop with the pooled single-parse one.
+# Run from the repository root: python -m benchmarks.bench_reader_pool
+import argparse
+import os
+import tempfile
+import time
+from PyPDF2 import PdfReader, PdfWriter
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import letter
+
+import pdf_compiler
+
+def make_corpus(directory, num_files, pages_per_file):
+    paths = []
+    for i in range(num_files):
+        path = os.path.join(directory, f"input_{i:04d}.pdf")
+        c = canvas.Canvas(path, pagesize=letter)
+        for page in range(pages_per_file):
+            c.setFont("Helvetica", 12)
+            c.drawString(100, 750, f"File {i} page {page + 1}")
+            c.showPage()
+        c.save()
+        paths.append(path)
+    return paths
+
+def legacy_compile(input_files, output_file):
+    writer = PdfWriter()
+    for input_file in input_files:
+        reader = PdfReader(input_file)
+        len(reader.pages)
+        writer.append(input_file)
+    with open(output_file, "wb") as f:
+        writer.write(f)
+
+class ParseCounter:
+    def __init__(self):
+        self.count = 0
+        self._original = PdfReader.read
+
+    def __enter__(self):
+        original = self._original
+        counter = self
+
+        def counting_read(reader, stream):
+            counter.count += 1
+            return original(reader, stream)
+
+        PdfReader.read = counting_read
+        return self
+
+    def __exit__(self, *exc):
+        PdfReader.read = self._original
+
+def run(label, func):
+    with ParseCounter() as counter:
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+    print(f"{label:<28} parses={counter.count:<6} wall={elapsed:.3f}s")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs = make_corpus(tmp, args.files, args.pages)
+        output = os.path.join(tmp, "out.pdf")
+        pdf_compiler.reader_pool.max_size = max(pdf_compiler.reader_pool.max_size, args.files)
+
+        run("legacy compile", lambda: legacy_compile(inputs, output))
+        pdf_compiler.reader_pool.clear()
+        run("pooled compile (cold)", lambda: pdf_compiler.compile_pdfs(inputs, output))
+        run("pooled info + compile (warm)", lambda: ([pdf_compiler.get_pdf_info(p) for p in inputs],
+                                                     pdf_compiler.compile_pdfs(inputs, output)))
+
+if __name__ == "__main__":
+    main()
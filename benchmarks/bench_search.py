@@ -0,0 +1,84 @@
+# Full-text search over a generated corpus: parallel extraction into the
+# FTS index, an incremental re-index after one file changes, and query
+# latency. Run from the repository root:
+#   python -m benchmarks.bench_search --files 50 --pages 1000
+import argparse
+import os
+import random
+import tempfile
+import time
+from reportlab.pdfgen import canvas
+
+from search_index import SearchIndex
+
+WORDS = ("binder exhibit invoice contract witness schedule appendix deposition summary ledger "
+         "warranty tenant lease payment survey drawing permit easement boundary affidavit").split()
+
+def make_corpus_pdf(path, pages, rng, marker=None):
+    c = canvas.Canvas(path)
+    for i in range(pages):
+        for line in range(8):
+            c.drawString(72, 700 - line * 14, " ".join(rng.choice(WORDS) for _ in range(12)))
+        if marker and i == pages // 2:
+            c.drawString(72, 500, marker)
+        c.showPage()
+    c.save()
+
+def search_timings(index, order, rng, count):
+    for label, queries in [("rare term", ["zanzibar"] * count),
+                           ("common term", [rng.choice(WORDS) for _ in range(count)]),
+                           ("two-word AND", [f"{rng.choice(WORDS)} {rng.choice(WORDS)}" for _ in range(count)]),
+                           ("prefix", [rng.choice(WORDS)[:3] + "*" for _ in range(count)])]:
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query, limit=20, order=order)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        print(f"  {label:<14} p50 {timings[len(timings) // 2] * 1000:7.2f} ms  "
+              f"p95 {timings[int(len(timings) * 0.95)] * 1000:7.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for n in range(args.files):
+            path = os.path.join(tmp, f"doc{n:03}.pdf")
+            make_corpus_pdf(path, args.pages, rng, marker="zanzibar" if n == 7 else None)
+            paths.append(path)
+        index = SearchIndex(os.path.join(tmp, "search.sqlite3"), workers=args.workers)
+
+        start = time.perf_counter()
+        indexed, failed = index.index_paths(paths)
+        elapsed = time.perf_counter() - start
+        print(f"indexed {indexed} files / {index.stats()['pages']} pages in {elapsed:.2f} s "
+              f"({index.pages_indexed / elapsed:.0f} pages/s), {len(failed)} failed")
+
+        start = time.perf_counter()
+        assert index.index_paths(paths) == (0, {})
+        print(f"unchanged re-index        {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+        make_corpus_pdf(paths[3], args.pages, rng, marker="quokka")
+        start = time.perf_counter()
+        assert index.index_paths(paths)[0] == 1
+        print(f"one changed file          {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+        hits = index.search("zanzibar")
+        assert [(h['file'], h['page']) for h in hits] == [(paths[7], args.pages // 2 + 1)], hits
+        assert [(h['file'], h['page']) for h in index.search("quokka")] == [(paths[3], args.pages // 2 + 1)]
+        assert index.search("zanzibar", paths[:5]) == []
+        print(f"rare-term hits correct: {hits[0]['snippet'][:60]!r}")
+
+        for order in ("page", "rank"):
+            print(f"order={order}")
+            search_timings(index, order, rng, args.queries)
+
+if __name__ == "__main__":
+    main()
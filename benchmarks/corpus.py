@@ -0,0 +1,66 @@
+# Synthetic PDF corpora for the benchmark suite, generated with
+# create_test_pdf and cached under .cache/bench_corpus so repeated runs
+# reuse the same bytes. List them with: python -m benchmarks.corpus
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from create_test_pdf import create_test_pdf
+
+CORPUS_DIR = os.environ.get("BENCH_CORPUS_DIR", os.path.join(".cache", "bench_corpus"))
+
+# name: [(number of files, create_test_pdf options)]
+CORPORA = {
+    'pages_1': [(1, {'pages': 1})],
+    'pages_100': [(1, {'pages': 100})],
+    'pages_1000': [(1, {'pages': 1000})],
+    'pages_10000': [(1, {'pages': 10000})],
+    'many_small': [(200, {'pages': 5})],
+    'few_huge': [(2, {'pages': 5000})],
+    'embedded_fonts': [(20, {'pages': 50, 'embed_fonts': True})],
+    'images': [(10, {'pages': 20, 'images_per_page': 3})],
+    'scanned': [(4, {'pages': 50, 'scanned': True})],
+}
+
+def scaled(groups, scale):
+    """Shrink (or grow) file counts and page counts by ``scale``, keeping at least one of each."""
+    return [(max(1, round(count * scale)), dict(options, pages=max(1, round(options['pages'] * scale))))
+            for count, options in groups]
+
+def _spec_hash(groups):
+    return hashlib.sha1(json.dumps(groups, sort_keys=True).encode()).hexdigest()[:12]
+
+def build_corpus(name, scale=1.0, root=CORPUS_DIR):
+    """Paths of the files of corpus ``name`` at ``scale``, generating them on first use."""
+    groups = scaled(CORPORA[name], scale)
+    directory = os.path.join(root, f"{name}-{_spec_hash(groups)}")
+    manifest_path = os.path.join(directory, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            return [os.path.join(directory, file) for file in json.load(f)['files']]
+    tmp = directory + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    start = time.perf_counter()
+    files = []
+    for group, (count, options) in enumerate(groups):
+        for i in range(count):
+            file = f"{name}_{group}_{i:04d}.pdf"
+            # Each file gets its own seed so images differ between files.
+            create_test_pdf(os.path.join(tmp, file), seed=len(files), **options)
+            files.append(file)
+    with open(os.path.join(tmp, "manifest.json"), "w") as f:
+        json.dump({'name': name, 'scale': scale, 'groups': groups, 'files': files,
+                   'generated_seconds': time.perf_counter() - start}, f, indent=2)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.rename(tmp, directory)
+    return [os.path.join(directory, file) for file in files]
+
+def describe(paths):
+    return {'files': len(paths), 'bytes': sum(os.path.getsize(path) for path in paths)}
+
+if __name__ == "__main__":
+    for name, groups in CORPORA.items():
+        print(f"{name:<16} " + ", ".join(f"{count} x {options}" for count, options in groups))
@@ -0,0 +1,263 @@
+# Standard scenarios over the synthetic corpora in benchmarks/corpus.py:
+# compile_pdfs, get_pdf_info, parse_page_range and the Flask preview and
+# compile routes. Every run happens in a fresh interpreter so peak RSS is
+# per scenario. Results go to JSON and can be checked against a baseline.
+# Run from the repository root:
+#   python -m benchmarks.suite --save-baseline .cache/bench_baseline.json
+#   python -m benchmarks.suite --baseline .cache/bench_baseline.json --threshold 0.25
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.corpus import build_corpus, describe
+
+# Differences smaller than this many seconds are noise, whatever the ratio.
+NOISE_FLOOR = 0.02
+# A scenario run taking longer than this is reported as failed
+RUN_TIMEOUT = 1800
+
+def _peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+# A scenario is set up untimed with setup(paths, workdir), which returns
+# the timed callable; that returns the output size in bytes, if any.
+def _compile(**options):
+    def setup(paths, workdir):
+        from pdf_compiler import compile_pdfs
+        output = os.path.join(workdir, "out.pdf")
+
+        def run():
+            compile_pdfs(paths, output, **options)
+            return os.path.getsize(output)
+        return run
+    return setup
+
+def _compile_selection(paths, workdir):
+    from compile_plan import CompilePlan
+    from pdf_compiler import compile_pdfs
+    output = os.path.join(workdir, "out.pdf")
+
+    def run():
+        # Every other page of every file
+        plan = CompilePlan.from_files(paths, page_selections={path: "1-:2" for path in paths})
+        compile_pdfs(plan, output)
+        return os.path.getsize(output)
+    return run
+
+def _pdf_info(paths, workdir):
+    from pdf_compiler import get_pdf_info
+
+    def run():
+        for path in paths:
+            get_pdf_info(path)
+    return run
+
+def _page_ranges(paths, workdir):
+    from page_ranges import parse_page_range
+    pages = 1000000
+    specs = [f"1-{pages}", f"1-{pages}:3", ",".join(str(n) for n in range(1, pages, 997)), "2-500000,250000-999999"]
+
+    def run():
+        for spec in specs:
+            parse_page_range(spec, pages)
+    return run
+
+def _client(paths):
+    from main import app
+    from workspaces import workspace_store
+    # Fill the workspace directly: /add_pdf would also start background text
+    # indexing, which is not what these scenarios measure.
+    workspace = workspace_store.get(workspace_store.key_for('bench'))
+    for path in paths:
+        workspace.add(os.path.basename(path))
+    workspace_store.save(workspace)
+    return app.test_client(), {'X-API-Token': 'bench'}
+
+def _flask_preview(paths, workdir):
+    client, headers = _client(paths)
+
+    def run():
+        size = 0
+        for path in paths:
+            response = client.get(f'/preview_pdf/{os.path.basename(path)}?pages=1-20&width=200', headers=headers)
+            assert response.status_code == 200, response.data[:200]
+            size += len(response.data)
+        return size
+    return run
+
+def _flask_compile_stream(paths, workdir):
+    client, headers = _client(paths)
+
+    def run():
+        response = client.post('/compile_pdf', json={'stream': True}, headers=headers)
+        assert response.status_code == 200, response.data[:200]
+        return len(response.data)
+    return run
+
+def _flask_compile_job(paths, workdir):
+    client, headers = _client(paths)
+
+    def run():
+        response = client.post('/compile_pdf', json={}, headers=headers)
+        assert response.status_code == 202, response.data[:200]
+        status_url = response.json['statusUrl']
+        while True:
+            job = client.get(status_url, headers=headers).json['job']
+            if job['status'] not in ('queued', 'running'):
+                break
+            time.sleep(0.01)
+        assert job['status'] == 'done', job
+        return len(client.get(f"{status_url}/result", headers=headers).data)
+    return run
+
+# name: (corpus, setup)
+SCENARIOS = {
+    'compile_pages_1': ('pages_1', _compile()),
+    'compile_pages_100': ('pages_100', _compile()),
+    'compile_many_small': ('many_small', _compile()),
+    'compile_few_huge': ('few_huge', _compile()),
+    'compile_few_huge_streaming': ('few_huge', _compile(streaming=True)),
+    'compile_pages_10000': ('pages_10000', _compile()),
+    'compile_embedded_fonts_dedup': ('embedded_fonts', _compile(dedup=True)),
+    'compile_images': ('images', _compile()),
+    'compile_scanned': ('scanned', _compile()),
+    'compile_selection': ('pages_1000', _compile_selection),
+    'pdf_info_many_small': ('many_small', _pdf_info),
+    'pdf_info_scanned': ('scanned', _pdf_info),
+    'pdf_info_pages_10000': ('pages_10000', _pdf_info),
+    'parse_page_range_1m': (None, _page_ranges),
+    'flask_preview_images': ('images', _flask_preview),
+    'flask_compile_stream': ('many_small', _flask_compile_stream),
+    'flask_compile_job': ('pages_1000', _flask_compile_job),
+}
+
+def run_child(name, scale):
+    """Run one scenario in this (fresh) process and print its result as JSON."""
+    corpus, setup = SCENARIOS[name]
+    paths = [os.path.abspath(path) for path in build_corpus(corpus, scale)] if corpus else []
+    with tempfile.TemporaryDirectory() as workdir:
+        # Keep caches and indexes out of the repository, and run where the
+        # web app expects its files: by name in the working directory.
+        for var, value in (("THUMBNAIL_CACHE_DIR", "thumbnails"), ("PDF_INDEX_PATH", "index.sqlite3"),
+                           ("SEARCH_INDEX_PATH", "search.sqlite3"), ("WORKSPACE_DIR", "")):
+            os.environ[var] = os.path.join(workdir, value) if value else value
+        links = []
+        for path in paths:
+            link = os.path.join(workdir, os.path.basename(path))
+            os.symlink(path, link)
+            links.append(link)
+        os.makedirs(os.path.join(workdir, "output"))
+        os.chdir(workdir)
+        run = setup(links, workdir)
+        startup_rss = _peak_rss()
+        start = time.perf_counter()
+        output_bytes = run()
+        seconds = time.perf_counter() - start
+    print(json.dumps({'seconds': seconds, 'peak_rss': _peak_rss(), 'startup_rss': startup_rss,
+                      'output_bytes': output_bytes}))
+
+def run_scenario(name, scale, repeat):
+    corpus = SCENARIOS[name][0]
+    if corpus:
+        # Generate outside the timed runs
+        build_corpus(corpus, scale)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-m", "benchmarks.suite", "--child", name, "--scale", str(scale)],
+                                cwd=root, env=env, capture_output=True, text=True, timeout=RUN_TIMEOUT)
+        if result.returncode != 0:
+            raise RuntimeError(f"{name} failed:\n{result.stderr}")
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    result = {
+        'seconds': statistics.median(run['seconds'] for run in runs),
+        'runs': [run['seconds'] for run in runs],
+        'peak_rss': max(run['peak_rss'] for run in runs),
+        'startup_rss': min(run['startup_rss'] for run in runs),
+        'output_bytes': runs[-1]['output_bytes'],
+    }
+    if corpus:
+        result['corpus'] = dict(describe(build_corpus(corpus, scale)), name=corpus)
+    return result
+
+def compare(results, baseline, threshold):
+    """Scenarios slower than ``baseline`` by more than ``threshold`` (0.25 = 25%)."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before is None:
+            continue
+        for metric, floor in (('seconds', NOISE_FLOOR), ('peak_rss', 0)):
+            old, new = before[metric], result[metric]
+            if new > old * (1 + threshold) and new - old > floor:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+def _format(metric, value):
+    if metric == 'seconds':
+        return f"{value * 1000:.1f} ms"
+    return f"{value / 2 ** 20:.1f} MiB" if value >= 2 ** 20 else f"{value / 1024:.1f} KiB"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", help="comma-separated scenario names (default: all)")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies corpus file and page counts")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario; the median is reported")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown before failing")
+    parser.add_argument("--save-baseline", help="also write the results to this file")
+    parser.add_argument("--list", action="store_true")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.scale)
+        return 0
+    if args.list:
+        for name, (corpus, _) in SCENARIOS.items():
+            print(f"{name:<30} {corpus or ''}")
+        return 0
+    names = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario: {unknown[0]}")
+
+    results = {}
+    for name in names:
+        results[name] = run_scenario(name, args.scale, args.repeat)
+        result = results[name]
+        print(f"{name:<30} {_format('seconds', result['seconds']):>12}  peak {_format('peak_rss', result['peak_rss']):>11}"
+              + (f"  output {_format('bytes', result['output_bytes'])}" if result['output_bytes'] else ""))
+    report = {'scale': args.scale, 'repeat': args.repeat, 'python': platform.python_version(),
+              'platform': platform.platform(), 'created': time.strftime("%Y-%m-%dT%H:%M:%S"), 'scenarios': results}
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('scale') != args.scale:
+            print(f"Baseline was recorded at scale {baseline.get('scale')}, not {args.scale}; skipping comparison")
+            return 0
+        regressions = compare(results, baseline, args.threshold)
+        for name, metric, old, new in regressions:
+            print(f"REGRESSION {name} {metric}: {_format(metric, old)} -> {_format(metric, new)} ({new / old - 1:+.0%})")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import sys
+from pdf_compiler import compile_pdfs, reader_pool, CompilePlan
+from image_optimizer import DEFAULT_TARGET_DPI, DEFAULT_JPEG_QUALITY
+from pdf_index import get_index
+from search_index import get_search_index
+from metrics import write_trace
+from incremental import build_report, SEGMENT_CACHE_DIR
+from reports import load_reports, find_report, REPORTS_FILE
+from batch import run_batch, load_report_specs
+
+def _split_selection(arg):
+    # "file.pdf#1-3,7" selects pages of one input; an existing path is taken literally.
+    if '#' in arg and not os.path.exists(arg):
+        path, pages = arg.rsplit('#', 1)
+        return path, pages
+    return arg, None
+
+def cmd_compile(args):
+    inputs = [_split_selection(arg) for arg in args.inputs]
+    args.inputs = [path for path, _ in inputs]
+    page_selections = {path: pages for path, pages in inputs if pages}
+    missing = [path for path in args.inputs if not os.path.exists(path)]
+    if missing:
+        print(f"Input file(s) not found: {', '.join(missing)}", file=sys.stderr)
+        return 1
+
+    def report(pages_written, files_done, files_total):
+        if args.verbose:
+            print(f"{files_done}/{files_total} runs, {pages_written} pages")
+
+    if args.raw_copy and args.optimize_images:
+        print("--raw-copy cannot be combined with --optimize-images", file=sys.stderr)
+        return 1
+    if args.optimize_images and (args.target_dpi <= 0 or not 1 <= args.jpeg_quality <= 100):
+        print("--target-dpi must be positive and --jpeg-quality between 1 and 100", file=sys.stderr)
+        return 1
+    optimize_images = None
+    if args.optimize_images:
+        optimize_images = {'target_dpi': args.target_dpi, 'jpeg_quality': args.jpeg_quality,
+                           'fmt': args.image_format, 'detect_grayscale': not args.keep_color}
+    cover_template = None
+    if args.cover_title or args.toc:
+        cover_template = {'title': args.cover_title, 'date': True, 'toc': args.toc}
+    plan = CompilePlan.from_files(args.inputs, args.cover_pages, page_selections)
+    stats = compile_pdfs(plan, args.output, args.cover, progress=report,
+                         workers=args.workers, streaming=args.streaming, dedup=args.dedup,
+                         optimize_images=optimize_images, cover_template=cover_template, trace=bool(args.trace),
+                         raw_copy=args.raw_copy)
+    if args.trace:
+        write_trace(stats.pop('trace'), args.trace)
+    print(f"PDFs compiled successfully as {args.output} ({stats['pages']} pages, {stats['bytes_written']} bytes)")
+    if args.dedup:
+        print(f"Deduplicated {stats['dedup_objects']} shared object(s), saving {stats['dedup_bytes_saved']} bytes")
+    if args.raw_copy:
+        print(f"Copied {stats['streams_copied']} stream(s), {stats['stream_bytes_copied']} bytes, without decoding")
+    if optimize_images:
+        images = stats['image_optimization']
+        print(f"Recompressed {images['images_recompressed']} of {images['images_found']} image(s): "
+              f"{images['bytes_before']} -> {images['bytes_after']} bytes")
+    if args.verbose:
+        timings = dict(stats['timings'], **stats.get('image_optimization', {}).get('timings', {}))
+        stages = timings.pop('stages')
+        print(", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in timings.items()))
+        print("stages: " + ", ".join(f"{stage} {totals['seconds']:.3f}s ({totals['count']}x)"
+                                     for stage, totals in stages.items()))
+    return 0
+
+def _collect_pdfs(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.lower().endswith(".pdf"):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+def cmd_index(args):
+    index = get_index()
+    paths = list(_collect_pdfs(args.paths))
+    indexed, failed = index.index_paths(paths, workers=args.workers)
+    for path, error in failed.items():
+        print(f"Failed to index {path}: {error}", file=sys.stderr)
+    pruned = index.prune() if args.prune else 0
+    print(f"Indexed {indexed} new or changed file(s), pruned {pruned} missing file(s) in {index.db_path}")
+    if args.text:
+        search_index = get_search_index()
+        indexed, text_failed = search_index.index_paths(paths, workers=args.workers)
+        for path, error in text_failed.items():
+            print(f"Failed to extract text from {path}: {error}", file=sys.stderr)
+        failed = failed or text_failed
+        pruned = search_index.prune() if args.prune else 0
+        print(f"Extracted text of {indexed} new or changed file(s), pruned {pruned} missing file(s) in {search_index.db_path}")
+    return 1 if failed else 0
+
+def cmd_build_report(args):
+    report = find_report(load_reports(args.reports), args.name)
+    if report is None:
+        print(f"Report not found: {args.name}", file=sys.stderr)
+        return 1
+    manifest = build_report(report, args.output, cache_dir=args.cache_dir, force=args.force)
+    print(f"Built {args.output}: {manifest['pages']} pages, {manifest['reused']} segment(s) reused, "
+          f"{manifest['rebuilt']} rebuilt in {manifest['timings']['total']:.2f}s")
+    return 0
+
+def cmd_batch(args):
+    reports = load_report_specs(args.reports)
+    if args.only:
+        reports = [report for report in reports if report.name in set(args.only)]
+    if args.reader_pool_size:
+        reader_pool.max_size = args.reader_pool_size
+    summary = run_batch(reports, args.output_dir, workers=args.workers, incremental=args.incremental,
+                        cache_dir=args.cache_dir)
+    text = json.dumps(summary, indent=2)
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    return 1 if summary['failed'] else 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="pdfcompilator", description="The Binder command line interface")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    compile_parser = subparsers.add_parser("compile", help="Merge PDF files into one document")
+    compile_parser.add_argument("output", help="Path of the compiled PDF")
+    compile_parser.add_argument("inputs", nargs="+",
+                                help="Input PDF files, in order; append #RANGE to take only some pages (a.pdf#1-3,7)")
+    compile_parser.add_argument("--cover", action="store_true", help="Prepend a generated cover page")
+    compile_parser.add_argument("--cover-pages", help="Pages to take from the first input (e.g. 1,3-5)")
+    compile_parser.add_argument("--cover-title", help="Prepend a dated cover page with this title")
+    compile_parser.add_argument("--toc", action="store_true", help="List the inputs and their page numbers on the cover")
+    compile_parser.add_argument("-w", "--workers", type=int, default=1,
+                                help="Merge chunks of the input list in this many processes")
+    compile_parser.add_argument("--streaming", action="store_true",
+                                help="Write objects incrementally to keep memory bounded by the largest input")
+    compile_parser.add_argument("--dedup", action="store_true",
+                                help="Write identical fonts, images and other streams only once")
+    compile_parser.add_argument("--raw-copy", action="store_true",
+                                help="Copy every stream as its original encoded bytes, never decoding it")
+    compile_parser.add_argument("--optimize-images", action="store_true",
+                                help="Downsample and recompress images after merging")
+    compile_parser.add_argument("--target-dpi", type=int, default=DEFAULT_TARGET_DPI)
+    compile_parser.add_argument("--jpeg-quality", type=int, default=DEFAULT_JPEG_QUALITY)
+    compile_parser.add_argument("--image-format", choices=("jpeg", "jpx"), default="jpeg")
+    compile_parser.add_argument("--keep-color", action="store_true", help="Do not convert colourless images to grayscale")
+    compile_parser.add_argument("--trace", metavar="FILE", help="Write per-stage timings of this compile as JSON")
+    compile_parser.add_argument("-v", "--verbose", action="store_true", help="Print progress")
+    compile_parser.set_defaults(func=cmd_compile)
+
+    index_parser = subparsers.add_parser("index", help="Fill the PDF metadata index")
+    index_parser.add_argument("paths", nargs="+", help="PDF files or directories to scan")
+    index_parser.add_argument("-w", "--workers", type=int, default=None, help="Parser processes (default: CPU count)")
+    index_parser.add_argument("--prune", action="store_true", help="Drop entries for files that no longer exist")
+    index_parser.add_argument("--text", action="store_true", help="Also fill the full-text search index")
+    index_parser.set_defaults(func=cmd_index)
+
+    build_parser_ = subparsers.add_parser("build-report", help="Incrementally compile a saved report")
+    build_parser_.add_argument("name", help="Report name from the reports file")
+    build_parser_.add_argument("output", help="Path of the compiled PDF")
+    build_parser_.add_argument("--reports", default=REPORTS_FILE, help="Reports file (default: reports.json)")
+    build_parser_.add_argument("--cache-dir", default=SEGMENT_CACHE_DIR, help="Compiled segment cache")
+    build_parser_.add_argument("--force", action="store_true", help="Rebuild every segment")
+    build_parser_.set_defaults(func=cmd_build_report)
+
+    batch_parser = subparsers.add_parser("batch", help="Compile many saved reports concurrently")
+    batch_parser.add_argument("reports", nargs="?", default=REPORTS_FILE,
+                              help="reports.json or a directory of report spec files (default: reports.json)")
+    batch_parser.add_argument("-o", "--output-dir", default="output", help="Where compiled reports are written")
+    batch_parser.add_argument("-w", "--workers", type=int, default=4, help="Reports compiled at the same time")
+    batch_parser.add_argument("--only", nargs="+", help="Compile only these report names")
+    batch_parser.add_argument("--incremental", action="store_true", help="Reuse cached segments (see build-report)")
+    batch_parser.add_argument("--cache-dir", default=SEGMENT_CACHE_DIR, help="Compiled segment cache")
+    batch_parser.add_argument("--reader-pool-size", type=int, help="Open readers shared across reports")
+    batch_parser.add_argument("--summary", help="Write the JSON summary here instead of stdout")
+    batch_parser.set_defaults(func=cmd_batch)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+import os
+from array import array
+from page_ranges import PageRangeSet
+
+class CompilePlan:
+    """What to compile: ordered runs of (source id, page-index array).
+
+    Sources are stored once and referenced by id; page indices are 0-based
+    and kept in compact ``array('i')`` buffers. Adding pages from the same
+    source as the previous run extends that run, so the engine opens each
+    source once per run and copies its pages in a single pass.
+    """
+
+    def __init__(self):
+        self.sources = []
+        self.runs = []
+        self._source_ids = {}
+
+    def source_id(self, path):
+        if path not in self._source_ids:
+            self._source_ids[path] = len(self.sources)
+            self.sources.append(path)
+        return self._source_ids[path]
+
+    def add(self, path, indices):
+        """Append ``indices`` (0-based) of ``path``; empty selections are ignored."""
+        indices = array('i', indices)
+        if not indices:
+            return
+        source = self.source_id(path)
+        if self.runs and self.runs[-1][0] == source:
+            self.runs[-1][1].extend(indices)
+        else:
+            self.runs.append((source, indices))
+
+    def __iter__(self):
+        """(path, page-index array) for every run, in output order."""
+        for source, indices in self.runs:
+            yield self.sources[source], indices
+
+    def __len__(self):
+        return len(self.runs)
+
+    @property
+    def total_pages(self):
+        return sum(len(indices) for _, indices in self.runs)
+
+    def to_dict(self):
+        return {'sources': list(self.sources), 'runs': [[source, indices.tolist()] for source, indices in self.runs]}
+
+    @classmethod
+    def from_dict(cls, data):
+        plan = cls()
+        for source, indices in data['runs']:
+            plan.add(data['sources'][source], indices)
+        return plan
+
+    @classmethod
+    def from_files(cls, input_files, cover_pages=None, page_selections=None, page_count=None):
+        """Plan used by ``compile_pdfs``, the web API and the CLI.
+
+        Every input contributes all its pages, except that the first input
+        contributes only ``cover_pages`` when they are given, and a file
+        listed in ``page_selections`` contributes only the selected pages.
+        Selections and cover pages are range strings ("1,3-5") or lists of
+        1-based page numbers.
+        """
+        from pdf_compiler import pooled_page_count
+        page_count = page_count or pooled_page_count
+        page_selections = page_selections or {}
+        plan = cls()
+        for path in input_files:
+            num_pages = page_count(path)
+            pages = page_selections.get(path)
+            if pages is None and cover_pages and path == input_files[0]:
+                pages = cover_pages
+            if pages is None:
+                plan.add(path, range(num_pages))
+                continue
+            if isinstance(pages, str):
+                plan.add(path, PageRangeSet.parse(pages, num_pages).indices())
+            else:
+                plan.add(path, [p - 1 for p in pages if 1 <= p <= num_pages])
+        return plan
+
+    @classmethod
+    def from_selections(cls, file_paths, page_selections, cover_pages=None, page_count=None):
+        """Plan for the GUI and saved reports.
+
+        Cover pages come from the first file, followed by the selected pages
+        (1-based) of every file in order; a file without a selection
+        contributes all its pages.
+        """
+        from pdf_compiler import pooled_page_count
+        page_count = page_count or pooled_page_count
+        plan = cls()
+        if cover_pages and file_paths:
+            num_pages = page_count(file_paths[0])
+            plan.add(file_paths[0], [p - 1 for p in cover_pages if 1 <= p <= num_pages])
+        for path in file_paths:
+            num_pages = page_count(path)
+            pages = page_selections.get(path)
+            if pages is None:
+                plan.add(path, range(num_pages))
+            else:
+                plan.add(path, [p - 1 for p in pages if 1 <= p <= num_pages])
+        return plan
+
+    def describe(self):
+        return [{'file': os.path.basename(path), 'pages': len(indices)} for path, indices in self]
+
+__all__ = ['CompilePlan']
@@ -0,0 +1,126 @@
+import os
+import time
+from functools import lru_cache
+from io import BytesIO
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+import metrics
+
+COVER_CACHE_SIZE = int(os.environ.get("COVER_CACHE_SIZE", "64"))
+COVER_TITLE = "Compiled PDF"
+COVER_FONT = "Helvetica-Bold"
+COVER_FONT_SIZE = 24
+TOC_FONT = "Helvetica"
+TOC_FONT_SIZE = 11
+TOC_LINE_HEIGHT = 16
+MARGIN = 72
+# Space taken by the title, date and "Contents" heading on the first page
+TOC_HEADER_HEIGHT = 120
+
+@lru_cache(maxsize=COVER_CACHE_SIZE)
+def render_cover(title=COVER_TITLE, pagesize=letter, font=COVER_FONT, font_size=COVER_FONT_SIZE):
+    """A one-page cover with ``title`` centred, as PDF bytes.
+
+    Rendered in memory and memoized; ``invariant`` output makes identical
+    covers byte-identical, so they also deduplicate in streaming writers.
+    """
+    buf = BytesIO()
+    c = canvas.Canvas(buf, pagesize=pagesize, invariant=1)
+    width, height = pagesize
+    c.setFont(font, font_size)
+    c.drawCentredString(width / 2, height / 2, title)
+    c.save()
+    return buf.getvalue()
+
+def toc_layout(num_entries, pagesize=letter):
+    """(entries on the first page, entries per following page, cover page count)."""
+    width, height = pagesize
+    first = max(1, int((height - 2 * MARGIN - TOC_HEADER_HEIGHT) // TOC_LINE_HEIGHT))
+    rest = max(1, int((height - 2 * MARGIN) // TOC_LINE_HEIGHT))
+    extra = max(0, num_entries - first)
+    return first, rest, 1 + (extra + rest - 1) // rest
+
+def _fit(text, font, font_size, max_width):
+    if stringWidth(text, font, font_size) <= max_width:
+        return text
+    while text and stringWidth(text + "...", font, font_size) > max_width:
+        text = text[:-1]
+    return text + "..."
+
+@lru_cache(maxsize=COVER_CACHE_SIZE)
+def render_toc_cover(title, entries, date=None, pagesize=letter, font=COVER_FONT, font_size=COVER_FONT_SIZE):
+    """A cover with title, optional date and a table of contents, as PDF bytes.
+
+    ``entries`` is a tuple of (label, page count) pairs in output order.
+    Page numbers include the cover itself: its length is worked out from
+    the layout first, so contents and numbering are drawn in one pass.
+    """
+    width, height = pagesize
+    first, rest, cover_pages = toc_layout(len(entries), pagesize)
+    buf = BytesIO()
+    c = canvas.Canvas(buf, pagesize=pagesize, invariant=1)
+    c.setTitle(title)
+
+    y = height - MARGIN - font_size
+    c.setFont(font, font_size)
+    c.drawCentredString(width / 2, y, title)
+    if date:
+        c.setFont(TOC_FONT, TOC_FONT_SIZE + 1)
+        c.drawCentredString(width / 2, y - 28, date)
+    if entries:
+        c.setFont(font, TOC_FONT_SIZE + 3)
+        c.drawString(MARGIN, height - MARGIN - TOC_HEADER_HEIGHT + 8, "Contents")
+    y = height - MARGIN - TOC_HEADER_HEIGHT - TOC_LINE_HEIGHT
+
+    page_number = cover_pages + 1
+    on_page = 0
+    capacity = first
+    label_width = width - 2 * MARGIN - 48
+    for label, num_pages in entries:
+        if on_page == capacity:
+            c.showPage()
+            y = height - MARGIN - TOC_LINE_HEIGHT
+            on_page, capacity = 0, rest
+        c.setFont(TOC_FONT, TOC_FONT_SIZE)
+        c.drawString(MARGIN, y, _fit(label, TOC_FONT, TOC_FONT_SIZE, label_width))
+        c.drawRightString(width - MARGIN, y, str(page_number))
+        page_number += num_pages
+        y -= TOC_LINE_HEIGHT
+        on_page += 1
+    c.showPage()
+    c.save()
+    return buf.getvalue()
+
+def cover_from_template(template, entries=()):
+    """PDF bytes for a cover template: True or {"title", "date", "toc"}.
+
+    ``date`` may be a string or True for today's date; ``toc`` (default
+    True) lists ``entries``.
+    """
+    options = template if isinstance(template, dict) else {}
+    title = options.get('title') or COVER_TITLE
+    date = options.get('date')
+    if date is True:
+        date = time.strftime('%Y-%m-%d')
+    if not options.get('toc', True):
+        if not date:
+            return render_cover(title)
+        entries = ()
+    return render_toc_cover(title, tuple(entries), date or None)
+
+def template_page_count(template, num_entries):
+    """Pages in ``cover_from_template(template, entries)`` for ``num_entries`` entries."""
+    options = template if isinstance(template, dict) else {}
+    if not options.get('toc', True):
+        return 1
+    return toc_layout(num_entries)[2]
+
+def cache_stats():
+    infos = [render_cover.cache_info(), render_toc_cover.cache_info()]
+    return {'hits': sum(info.hits for info in infos), 'misses': sum(info.misses for info in infos),
+            'size': sum(info.currsize for info in infos)}
+
+metrics.register_cache('covers', cache_stats)
+
+__all__ = ['render_cover', 'render_toc_cover', 'cover_from_template', 'toc_layout', 'template_page_count', 'cache_stats', 'COVER_TITLE']
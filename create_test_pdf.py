@@ -1,14 +1,58 @@
+import os
+import random
+from io import BytesIO
+import reportlab
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from PIL import Image
 
-def create_test_pdf(filename):
-    c = canvas.Canvas(filename, pagesize=letter)
-    c.setFont("Helvetica", 12)
-    c.drawString(100, 750, "This is a test PDF file")
-    c.drawString(100, 730, "Page 1")
-    c.showPage()
-    c.drawString(100, 750, "This is page 2 of the test PDF file")
-    c.drawString(100, 730, "Page 2")
+# TrueType font shipped with reportlab; it is subset and embedded when used
+EMBEDDED_FONT = "Vera"
+EMBEDDED_FONT_PATH = os.path.join(os.path.dirname(reportlab.__file__), "fonts", "Vera.ttf")
+
+def _random_image(rng, size, detail=16, grayscale=False):
+    # Upscaled random pixels saved as JPEG: smooth like a photo and
+    # embedded as-is (DCTDecode), like camera and scanner output.
+    mode, channels = ("L", 1) if grayscale else ("RGB", 3)
+    small = Image.frombytes(mode, (detail, detail), rng.randbytes(detail * detail * channels))
+    buf = BytesIO()
+    small.resize(size, Image.BILINEAR).save(buf, "JPEG", quality=75)
+    buf.seek(0)
+    return buf
+
+def create_test_pdf(filename, pages=2, embed_fonts=False, images_per_page=0, scanned=False, seed=0):
+    """Write a test PDF; the defaults give the original two-page file.
+
+    ``embed_fonts`` sets the text in an embedded TrueType font instead of
+    Helvetica, ``images_per_page`` adds that many photo-like images to
+    each page and ``scanned`` makes every page one full-page grayscale
+    image without text, like a scanner's output. Output is byte-for-byte
+    reproducible for the same arguments.
+    """
+    rng = random.Random(seed)
+    c = canvas.Canvas(filename, pagesize=letter, invariant=1)
+    width, height = letter
+    font = "Helvetica"
+    if embed_fonts:
+        if EMBEDDED_FONT not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont(EMBEDDED_FONT, EMBEDDED_FONT_PATH))
+        font = EMBEDDED_FONT
+    for number in range(1, pages + 1):
+        if scanned:
+            scan = _random_image(rng, (850, 1100), detail=48, grayscale=True)
+            c.drawImage(ImageReader(scan), 0, 0, width=width, height=height)
+            c.showPage()
+            continue
+        c.setFont(font, 12)
+        c.drawString(100, 750, "This is a test PDF file" if number == 1 else f"This is page {number} of the test PDF file")
+        c.drawString(100, 730, f"Page {number}")
+        for i in range(images_per_page):
+            image = _random_image(rng, (600, 400))
+            c.drawImage(ImageReader(image), 100 + (i % 2) * 220, 480 - (i // 2) * 160, width=200, height=133)
+        c.showPage()
     c.save()
 
 if __name__ == "__main__":
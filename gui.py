@@ -3,37 +3,27 @@ import tkinter as tk
 from tkinter import filedialog, messagebox, simpledialog, ttk
 from tkinter.font import Font
 from pdf_compiler import PDFCompiler
+from page_ranges import parse_page_range
 from name_generator import generate_space_name
-import json
 from PIL import Image, ImageTk
 import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
 import http.server
 import socketserver
-import fitz  # PyMuPDF
-
-def parse_page_selection(pages_str, max_pages):
-    pages = set()
-    for part in pages_str.split(','):
-        part = part.strip()
-        try:
-            if '-' in part:
-                start, end = map(int, part.split('-'))
-                if start > end:
-                    raise ValueError(f"Invalid range: {start}-{end}")
-                pages.update(range(start, end + 1))
-            else:
-                pages.add(int(part))
-        except ValueError:
-            raise ValueError(f"Invalid input: {part}")
-    return sorted([p for p in pages if 1 <= p <= max_pages])
-
-class Report:
-    def __init__(self, name, file_paths, page_selections, use_cover_pages=False, cover_pages=None):
-        self.name = name
-        self.file_paths = file_paths
-        self.page_selections = page_selections
-        self.use_cover_pages = use_cover_pages
-        self.cover_pages = cover_pages
+from io import BytesIO
+from thumbnails import thumbnail_cache, page_count
+from pdf_index import cached_pdf_info
+from search_index import get_search_index
+from reports import Report, load_reports, save_reports
+from image_optimizer import DEFAULT_TARGET_DPI, DEFAULT_JPEG_QUALITY
+from metrics import render_metrics, record_error
+
+PREVIEW_WIDTH = 400
+# Background threads for renders, probes and compiles, and how often (ms)
+# the Tk main loop picks up their results
+GUI_WORKERS = int(os.environ.get("GUI_WORKERS", "4"))
+TASK_POLL_MS = 50
 
 class BubblyStyle(ttk.Style):
     def __init__(self):
@@ -65,6 +55,94 @@ class BubblyStyle(ttk.Style):
         self.configure("TCheckbutton", background=self.bg_color, foreground=self.fg_color, font=("Comic Sans MS", 12))
         self.configure("Listbox", background="#FFE5EC", foreground=self.fg_color, font=("Comic Sans MS", 12), borderwidth=0)
 
+class TaskRunner:
+    """Runs blocking work off the Tk main loop.
+
+    Workers never touch widgets: results, errors and ``call_soon`` calls are
+    queued and run on the main loop by a poll scheduled with ``after()``.
+    Submitting to a ``channel`` supersedes earlier work on that channel:
+    tasks that have not started are cancelled and results of ones already
+    running are dropped, so only the latest request is shown.
+    """
+
+    def __init__(self, master, workers=GUI_WORKERS):
+        self.master = master
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gui-task")
+        self._calls = queue.SimpleQueue()
+        self._latest = {}
+        self._closed = False
+        self.master.after(TASK_POLL_MS, self._poll)
+
+    def submit(self, func, *args, on_done=None, on_error=None, channel=None, **kwargs):
+        token = object()
+        if channel is not None:
+            previous = self._latest.get(channel)
+            if previous is not None:
+                previous[1].cancel()
+
+        def run():
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self.call_soon(self._finish, channel, token, on_error or _report_task_error, e)
+            else:
+                if on_done is not None:
+                    self.call_soon(self._finish, channel, token, on_done, result)
+                else:
+                    self.call_soon(self._finish, channel, token, None, None)
+
+        future = self._executor.submit(run)
+        if channel is not None:
+            self._latest[channel] = (token, future)
+        return future
+
+    def _finish(self, channel, token, callback, value):
+        if channel is not None:
+            latest = self._latest.get(channel)
+            if latest is None or latest[0] is not token:
+                return
+            del self._latest[channel]
+        if callback is not None:
+            callback(value)
+
+    def call_soon(self, func, *args):
+        """Run ``func(*args)`` on the Tk main loop; safe to call from any thread."""
+        self._calls.put((func, args))
+
+    def _poll(self):
+        while True:
+            try:
+                func, args = self._calls.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"Error in GUI callback: {str(e)}")
+        if not self._closed:
+            self.master.after(TASK_POLL_MS, self._poll)
+
+    def shutdown(self):
+        self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+def _report_task_error(error):
+    record_error('gui_task')
+    print(f"Error in background task: {str(error)}")
+
+def _render_preview(file_path, page):
+    return thumbnail_cache.render(file_path, page, width=PREVIEW_WIDTH), page_count(file_path)
+
+def _probe_files(file_paths):
+    return [(file_path, cached_pdf_info(file_path)) for file_path in file_paths]
+
+def _search(query, paths):
+    # Scheduling and searching take the index lock, which is held while a
+    # large file's text is stored, so neither may run on the main loop.
+    index = get_search_index()
+    pending = index.schedule(paths)
+    return index.search(query, paths), pending
+
 class PDFCompilerGUI:
     def __init__(self, master):
         self.master = master
@@ -84,6 +162,7 @@ class PDFCompilerGUI:
         else:
             print(f'Icon file not found: {icon_path}')
         
+        self.tasks = TaskRunner(self.master)
         self.selected_files = []
         self.output_folder = None
         self.reports = []
@@ -140,6 +219,25 @@ class PDFCompilerGUI:
         self.cover_source_label = ttk.Label(cover_frame, text="Cover Source: None (0 pages)")
         self.cover_source_label.pack(side=tk.BOTTOM, pady=5)
 
+        image_frame = ttk.Frame(left_frame, padding=10)
+        image_frame.pack(fill=tk.X, pady=10)
+
+        self.optimize_images_var = tk.BooleanVar()
+        ttk.Checkbutton(image_frame, text="Optimize images", variable=self.optimize_images_var).pack(side=tk.LEFT)
+
+        ttk.Label(image_frame, text="Target DPI:").pack(side=tk.LEFT, padx=(10, 0))
+        self.target_dpi_entry = ttk.Entry(image_frame, width=6, font=("Comic Sans MS", 12))
+        self.target_dpi_entry.insert(0, str(DEFAULT_TARGET_DPI))
+        self.target_dpi_entry.pack(side=tk.LEFT, padx=5)
+
+        ttk.Label(image_frame, text="JPEG quality:").pack(side=tk.LEFT, padx=(10, 0))
+        self.jpeg_quality_entry = ttk.Entry(image_frame, width=4, font=("Comic Sans MS", 12))
+        self.jpeg_quality_entry.insert(0, str(DEFAULT_JPEG_QUALITY))
+        self.jpeg_quality_entry.pack(side=tk.LEFT, padx=5)
+
+        self.grayscale_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(image_frame, text="Detect grayscale", variable=self.grayscale_var).pack(side=tk.LEFT, padx=(10, 0))
+
         # New page selection frame
         page_selection_frame = ttk.Frame(left_frame, padding=10)
         page_selection_frame.pack(fill=tk.BOTH, expand=True, pady=10)
@@ -152,11 +250,17 @@ class PDFCompilerGUI:
         pdf_info_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.pdf_info_text.config(yscrollcommand=pdf_info_scrollbar.set)
 
-        ttk.Label(page_selection_frame, text="Enter page numbers or ranges (e.g., 1,3,5-7,10-12):", font=("Comic Sans MS", 12)).pack(anchor=tk.W, pady=(10, 0))
+        ttk.Label(page_selection_frame, text="Enter page numbers or ranges (e.g., 1,3,5-7,10-, -2--1, 1-:2, !4):", font=("Comic Sans MS", 12)).pack(anchor=tk.W, pady=(10, 0))
         self.page_selection_entry = ttk.Entry(page_selection_frame, width=50, font=("Comic Sans MS", 12))
         self.page_selection_entry.pack(fill=tk.X, pady=5)
 
-        self.create_bubbly_button(left_frame, "🚀 Compile PDFs", self.compile_pdfs).pack(pady=10)
+        self.compile_button = self.create_bubbly_button(left_frame, "🚀 Compile PDFs", self.compile_pdfs)
+        self.compile_button.pack(pady=10)
+
+        self.compile_progress = ttk.Progressbar(left_frame, orient=tk.HORIZONTAL, mode='determinate')
+        self.compile_progress.pack(fill=tk.X)
+        self.compile_status_label = ttk.Label(left_frame, text="")
+        self.compile_status_label.pack(pady=5)
 
         self.output_folder_label = ttk.Label(left_frame, text="Output Folder: none", wraplength=600)
         self.output_folder_label.pack(pady=5)
@@ -196,9 +300,26 @@ class PDFCompilerGUI:
         self.page_label = ttk.Label(preview_controls, text="Page: 0 / 0")
         self.page_label.pack(side=tk.LEFT, expand=True)
 
+        search_frame = ttk.Frame(right_frame, padding=10)
+        search_frame.pack(fill=tk.BOTH, expand=True)
+
+        ttk.Label(search_frame, text="Search Selected PDFs:", font=("Comic Sans MS", 14, "bold")).pack(anchor=tk.W)
+
+        search_controls = ttk.Frame(search_frame)
+        search_controls.pack(fill=tk.X, pady=5)
+        self.search_entry = ttk.Entry(search_controls, width=30, font=("Comic Sans MS", 12))
+        self.search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.search_entry.bind('<Return>', lambda e: self.search_pdfs())
+        self.create_bubbly_button(search_controls, "🔍 Search", self.search_pdfs).pack(side=tk.LEFT, padx=5)
+
+        self.search_listbox = tk.Listbox(search_frame, width=50, height=6, bg="#FFE5EC", fg=self.style.fg_color, font=("Comic Sans MS", 10))
+        self.search_listbox.pack(fill=tk.BOTH, expand=True)
+        self.search_listbox.bind('<Double-Button-1>', self.on_search_hit_select)
+        self.search_hits = []
+
         self.current_preview_file = None
         self.current_preview_page = 0
-        self.current_preview_doc = None
+        self.current_preview_page_count = 0
 
         self.update_report_listbox()
 
@@ -210,12 +331,15 @@ class PDFCompilerGUI:
 
     def add_pdf(self):
         files = filedialog.askopenfilenames(filetypes=[("PDF Files", "*.pdf")])
-        
-        for file_path in files:
-            pdf_info = PDFCompiler.get_pdf_info(file_path)
+        if files:
+            self.tasks.submit(_probe_files, list(files), on_done=self.on_files_probed)
+
+    def on_files_probed(self, probed):
+        for file_path, pdf_info in probed:
             if pdf_info:
                 self.selected_files.append((file_path, pdf_info))
-                self.file_listbox.insert(tk.END, f"{pdf_info['file_name']} ({pdf_info['num_pages']} pages)")
+                self.file_listbox.insert(tk.END, f"{pdf_info['filename']} ({pdf_info['num_pages']} pages)")
+        get_search_index().schedule([file_path for file_path, _ in probed])
         self.update_cover_source_label()
         self.update_pdf_info_display()
 
@@ -259,14 +383,14 @@ class PDFCompilerGUI:
         self.pdf_info_text.delete('1.0', tk.END)
         for _, pdf_info in self.selected_files:
             if pdf_info:
-                self.pdf_info_text.insert(tk.END, f"{pdf_info['file_name']} ({pdf_info['num_pages']} pages)\n")
+                self.pdf_info_text.insert(tk.END, f"{pdf_info['filename']} ({pdf_info['num_pages']} pages)\n")
 
     def save_report(self):
         name = generate_space_name()
         page_selections = self.get_page_selections()
         if page_selections:
             use_cover_pages = self.use_cover_pages_var.get()
-            cover_pages = parse_page_selection(self.cover_pages_entry.get(), max(info['num_pages'] for _, info in self.selected_files if info)) if use_cover_pages else None
+            cover_pages = parse_page_range(self.cover_pages_entry.get(), max(info['num_pages'] for _, info in self.selected_files if info)) if use_cover_pages else None
             report = Report(name, [file_path for file_path, _ in self.selected_files], page_selections, use_cover_pages, cover_pages)
             self.reports.append(report)
             self.save_reports_to_file()
@@ -287,30 +411,30 @@ class PDFCompilerGUI:
         if selected_name:
             selected_report = next((report for report in self.reports if report.name == selected_name), None)
             if selected_report:
-                self.selected_files = [(path, PDFCompiler.get_pdf_info(path)) for path in selected_report.file_paths]
-                self.update_file_listbox()
+                self.tasks.submit(_probe_files, selected_report.file_paths, on_done=self.on_report_files_probed)
                 self.use_cover_pages_var.set(selected_report.use_cover_pages)
                 self.cover_pages_entry.delete(0, tk.END)
                 if selected_report.cover_pages:
                     self.cover_pages_entry.insert(0, ','.join(map(str, selected_report.cover_pages)))
-                self.update_cover_source_label()
-                self.update_pdf_info_display()
                 self.page_selection_entry.delete(0, tk.END)
                 self.page_selection_entry.insert(0, ','.join(str(page) for pages in selected_report.page_selections.values() for page in pages))
                 print(f"Debug: Report loaded - {selected_name}")
             else:
                 messagebox.showerror("Error", "Selected report not found.")
 
+    def on_report_files_probed(self, probed):
+        self.selected_files = probed
+        self.update_file_listbox()
+        self.update_cover_source_label()
+        self.update_pdf_info_display()
+
     def save_reports_to_file(self):
-        with open('reports.json', 'w') as f:
-            json.dump([report.__dict__ for report in self.reports], f)
+        save_reports(self.reports)
         print(f"Debug: Reports saved to file - {len(self.reports)} reports")
 
     def load_reports_from_file(self):
         try:
-            with open('reports.json', 'r') as f:
-                report_data = json.load(f)
-                self.reports = [Report(**data) for data in report_data]
+            self.reports = load_reports()
             print(f"Debug: Reports loaded from file - {len(self.reports)} reports")
         except FileNotFoundError:
             self.reports = []
@@ -320,7 +444,7 @@ class PDFCompilerGUI:
         self.file_listbox.delete(0, tk.END)
         for _, pdf_info in self.selected_files:
             if pdf_info:
-                self.file_listbox.insert(tk.END, f"{pdf_info['file_name']} ({pdf_info['num_pages']} pages)")
+                self.file_listbox.insert(tk.END, f"{pdf_info['filename']} ({pdf_info['num_pages']} pages)")
 
     def update_report_listbox(self):
         self.report_listbox.delete(0, tk.END)
@@ -334,7 +458,7 @@ class PDFCompilerGUI:
         if self.use_cover_pages_var.get() and self.selected_files:
             _, file_info = self.selected_files[0]
             if file_info:
-                self.cover_source_label.config(text=f"Cover Source: {file_info['file_name']} ({file_info['num_pages']} pages)")
+                self.cover_source_label.config(text=f"Cover Source: {file_info['filename']} ({file_info['num_pages']} pages)")
             else:
                 self.cover_source_label.config(text="Cover Source: None (0 pages)")
         else:
@@ -350,11 +474,11 @@ class PDFCompilerGUI:
         for file_path, pdf_info in self.selected_files:
             if pdf_info:
                 try:
-                    page_list = parse_page_selection(page_input, pdf_info['num_pages'])
+                    page_list = parse_page_range(page_input, pdf_info['num_pages'])
                     if page_list:
                         selected_pages[file_path] = page_list
                 except ValueError as e:
-                    messagebox.showwarning("Invalid Input", f"Error parsing pages for {pdf_info['file_name']}: {str(e)}")
+                    messagebox.showwarning("Invalid Input", f"Error parsing pages for {pdf_info['filename']}: {str(e)}")
                     return None
             else:
                 messagebox.showwarning("Invalid PDF", f"Error: Could not read PDF information for {file_path}")
@@ -390,31 +514,73 @@ class PDFCompilerGUI:
         cover_pages = None
         if use_cover_pages:
             try:
-                cover_pages = parse_page_selection(self.cover_pages_entry.get(), max(info['num_pages'] for _, info in self.selected_files if info))
+                cover_pages = parse_page_range(self.cover_pages_entry.get(), max(info['num_pages'] for _, info in self.selected_files if info))
             except ValueError as e:
                 messagebox.showwarning("Invalid Input", f"Error parsing cover pages: {str(e)}")
                 return
 
+        optimize_images = None
+        if self.optimize_images_var.get():
+            try:
+                optimize_images = {'target_dpi': int(self.target_dpi_entry.get()),
+                                   'jpeg_quality': int(self.jpeg_quality_entry.get()),
+                                   'detect_grayscale': self.grayscale_var.get()}
+            except ValueError:
+                messagebox.showwarning("Invalid Input", "Target DPI and JPEG quality must be whole numbers.")
+                return
+            if optimize_images['target_dpi'] <= 0 or not 1 <= optimize_images['jpeg_quality'] <= 100:
+                messagebox.showwarning("Invalid Input",
+                                       "Target DPI must be positive and JPEG quality between 1 and 100.")
+                return
+
         output_filename = f"{generate_space_name()}.pdf"
         output_file = os.path.join(self.output_folder, output_filename)
 
         input_files = [file_path for file_path, _ in self.selected_files]
-        if PDFCompiler.compile_pdfs(input_files, page_selections, output_file, use_cover_pages, cover_pages):
+        self.compile_button.state(['disabled'])
+        self.compile_progress.config(value=0, maximum=1)
+        self.compile_status_label.config(text="Compiling...")
+        self.tasks.submit(PDFCompiler.compile_pdfs, input_files, page_selections, output_file, use_cover_pages,
+                          cover_pages, optimize_images=optimize_images,
+                          progress=lambda pages_written, pages_total: self.tasks.call_soon(
+                              self.on_compile_progress, pages_written, pages_total),
+                          on_done=lambda success: self.on_compile_done(success, output_file),
+                          on_error=lambda error: self.on_compile_done(False, output_file))
+
+    def on_compile_progress(self, pages_written, pages_total):
+        self.compile_progress.config(maximum=max(pages_total, 1), value=min(pages_written, pages_total))
+        self.compile_status_label.config(text=f"Compiling... {pages_written} / {pages_total} pages")
+
+    def on_compile_done(self, success, output_file):
+        self.compile_button.state(['!disabled'])
+        if success:
+            self.compile_progress.config(value=self.compile_progress['maximum'])
+            self.compile_status_label.config(text="Done")
             messagebox.showinfo("Success", f"PDFs compiled successfully.\nOutput file: {output_file}")
         else:
+            self.compile_status_label.config(text="Failed")
             messagebox.showerror("Error", "Failed to compile PDFs. Please try again.")
 
     def start_http_server(self):
         class Handler(http.server.SimpleHTTPRequestHandler):
             def do_GET(self):
+                if self.path == '/metrics':
+                    body, content_type = render_metrics().encode(), 'text/plain; version=0.0.4'
+                else:
+                    body, content_type = b"PDF Compiler is running!", 'text/html'
                 self.send_response(200)
-                self.send_header('Content-type', 'text/html')
+                self.send_header('Content-type', content_type)
                 self.end_headers()
-                self.wfile.write(b"PDF Compiler is running!")
+                self.wfile.write(body)
 
         port = 8080
         handler = Handler
-        with socketserver.TCPServer(("", port), handler) as httpd:
+        # One thread per connection, so a slow client cannot hold up the others.
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        with Server(("", port), handler) as httpd:
             print(f"Serving at port {port}")
             httpd.serve_forever()
 
@@ -425,40 +591,77 @@ class PDFCompilerGUI:
             file_path, _ = self.selected_files[index]
             self.load_preview(file_path)
 
-    def load_preview(self, file_path):
+    def load_preview(self, file_path, page=0):
         self.current_preview_file = file_path
-        self.current_preview_page = 0
-        self.current_preview_doc = fitz.open(file_path)
+        self.current_preview_page = page
+        self.current_preview_page_count = 0
         self.update_preview()
 
     def update_preview(self):
-        if self.current_preview_doc:
-            page = self.current_preview_doc[self.current_preview_page]
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-            img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
-            img = img.resize((400, int(400 * img.height / img.width)))
-            photo = ImageTk.PhotoImage(img)
-            
-            self.preview_canvas.delete("all")
-            self.preview_canvas.config(width=img.width, height=img.height)
-            self.preview_canvas.create_image(0, 0, anchor=tk.NW, image=photo)
-            self.preview_canvas.photo = photo  # Keep a reference to avoid garbage collection
-
-            self.page_label.config(text=f"Page: {self.current_preview_page + 1} / {len(self.current_preview_doc)}")
+        if self.current_preview_file:
+            # Paging quickly supersedes renders that are queued or still running.
+            file_path, page = self.current_preview_file, self.current_preview_page
+            self.page_label.config(text=f"Page: {page + 1} / {self.current_preview_page_count or '...'}")
+            self.tasks.submit(_render_preview, file_path, page, channel='preview',
+                              on_done=lambda result: self.show_preview(file_path, page, *result))
+
+    def show_preview(self, file_path, page, data, count):
+        self.current_preview_page_count = count
+        img = Image.open(BytesIO(data))
+        photo = ImageTk.PhotoImage(img)
+
+        self.preview_canvas.delete("all")
+        self.preview_canvas.config(width=img.width, height=img.height)
+        self.preview_canvas.create_image(0, 0, anchor=tk.NW, image=photo)
+        self.preview_canvas.photo = photo  # Keep a reference to avoid garbage collection
+
+        self.page_label.config(text=f"Page: {page + 1} / {count}")
+
+        # Render the neighbouring pages in the background so paging is instant
+        neighbours = [page + 1, page - 1, page + 2]
+        thumbnail_cache.prefetch(file_path, [p for p in neighbours if 0 <= p < count], width=PREVIEW_WIDTH)
+
+    def search_pdfs(self):
+        query = self.search_entry.get().strip()
+        if not query:
+            return
+        paths = [file_path for file_path, _ in self.selected_files]
+        self.search_hits = []
+        self.search_listbox.delete(0, tk.END)
+        self.search_listbox.insert(tk.END, "Searching...")
+        self.tasks.submit(_search, query, paths, channel='search',
+                          on_done=lambda result: self.show_search_results(*result))
+
+    def show_search_results(self, hits, pending):
+        self.search_hits = hits
+        self.search_listbox.delete(0, tk.END)
+        for hit in self.search_hits:
+            self.search_listbox.insert(tk.END, f"{os.path.basename(hit['file'])} p.{hit['page']}: {' '.join(hit['snippet'].split())}")
+        if pending:
+            self.search_listbox.insert(tk.END, f"Still indexing {len(pending)} file(s); search again shortly")
+        elif not self.search_hits:
+            self.search_listbox.insert(tk.END, "No matches")
+
+    def on_search_hit_select(self, event):
+        selection = self.search_listbox.curselection()
+        if selection and selection[0] < len(self.search_hits):
+            hit = self.search_hits[selection[0]]
+            self.load_preview(hit['file'], hit['page'] - 1)
 
     def show_previous_page(self):
-        if self.current_preview_doc and self.current_preview_page > 0:
+        if self.current_preview_file and self.current_preview_page > 0:
             self.current_preview_page -= 1
             self.update_preview()
 
     def show_next_page(self):
-        if self.current_preview_doc and self.current_preview_page < len(self.current_preview_doc) - 1:
+        if self.current_preview_file and self.current_preview_page < self.current_preview_page_count - 1:
             self.current_preview_page += 1
             self.update_preview()
 
 def main():
     root = tk.Tk()
     app = PDFCompilerGUI(root)
+    root.protocol("WM_DELETE_WINDOW", lambda: (app.tasks.shutdown(), root.destroy()))
     
     server_thread = threading.Thread(target=app.start_http_server)
     server_thread.daemon = True
@@ -0,0 +1,147 @@
+import os
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from io import BytesIO
+import fitz  # PyMuPDF
+from PIL import Image, ImageChops
+
+DEFAULT_TARGET_DPI = 150
+DEFAULT_JPEG_QUALITY = 75
+# Channel differences at or below this are treated as a grayscale scan.
+GRAYSCALE_TOLERANCE = 8
+# Images are only downsampled when they exceed the target by this factor.
+DOWNSAMPLE_THRESHOLD = 1.2
+# Images extracted ahead of the workers, per worker. Only this many decoded
+# originals and recompressed results are held in memory at a time.
+PENDING_PER_WORKER = 4
+
+def _is_grayscale(img):
+    r, g, b = img.split()
+    return (ImageChops.difference(r, g).getextrema()[1] <= GRAYSCALE_TOLERANCE and
+            ImageChops.difference(g, b).getextrema()[1] <= GRAYSCALE_TOLERANCE)
+
+def _recompress(job):
+    """Decode, resample and re-encode one image; runs in a worker process."""
+    xref, data, scale, fmt, quality, detect_grayscale = job
+    img = Image.open(BytesIO(data))
+    img = img.convert("L") if img.mode in ("1", "L", "LA", "I", "I;16") else img.convert("RGB")
+    if img.mode == "RGB" and detect_grayscale and _is_grayscale(img):
+        img = img.convert("L")
+    if scale < 1:
+        size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        img = img.resize(size, Image.LANCZOS)
+    buf = BytesIO()
+    if fmt == "jpx":
+        img.save(buf, "JPEG2000", quality_mode="dB", quality_layers=[quality / 2])
+        pdf_filter = "/JPXDecode"
+    else:
+        img.save(buf, "JPEG", quality=quality, optimize=True)
+        pdf_filter = "/DCTDecode"
+    return xref, buf.getvalue(), img.width, img.height, img.mode, pdf_filter
+
+def _effective_dpi(doc):
+    # Highest resolution each image is placed at; an image drawn on several
+    # pages or at several sizes is never downsampled below what any use needs.
+    dpi = {}
+    for page in doc:
+        for info in page.get_image_info(xrefs=True):
+            xref = info.get('xref')
+            x0, y0, x1, y1 = info['bbox']
+            width_in = abs(x1 - x0) / 72
+            height_in = abs(y1 - y0) / 72
+            if not xref or width_in == 0 or height_in == 0:
+                continue
+            placed = max(info['width'] / width_in, info['height'] / height_in)
+            dpi[xref] = max(dpi.get(xref, 0), placed)
+    return dpi
+
+def _candidates(doc, dpi, target_dpi, fmt, quality, detect_grayscale):
+    for xref, placed_dpi in dpi.items():
+        keys = {key: doc.xref_get_key(xref, key)[1] for key in doc.xref_get_keys(xref)}
+        # Masks, inverted decodes, bilevel scans and CMYK are left untouched.
+        if 'Decode' in keys or keys.get('ImageMask') == 'true' or keys.get('BitsPerComponent') == '1':
+            continue
+        image = doc.extract_image(xref)
+        if not image or image['ext'] in ('jb2', 'jbig2') or image['colorspace'] not in (1, 3):
+            continue
+        scale = target_dpi / placed_dpi if placed_dpi > target_dpi * DOWNSAMPLE_THRESHOLD else 1.0
+        already_lossy = image['ext'] in ('jpeg', 'jpg', 'jpx')
+        if scale == 1.0 and already_lossy:
+            continue
+        yield xref, image['image'], scale, fmt, quality, detect_grayscale
+
+def _apply(doc, result):
+    # Returns whether the replacement was smaller and has been written.
+    xref, data, width, height, mode, pdf_filter = result
+    if len(data) >= len(doc.xref_stream_raw(xref)):
+        return False
+    doc.update_stream(xref, data, compress=0)
+    doc.xref_set_key(xref, "Filter", pdf_filter)
+    doc.xref_set_key(xref, "DecodeParms", "null")
+    doc.xref_set_key(xref, "Width", str(width))
+    doc.xref_set_key(xref, "Height", str(height))
+    doc.xref_set_key(xref, "BitsPerComponent", "8")
+    doc.xref_set_key(xref, "ColorSpace", "/DeviceGray" if mode == "L" else "/DeviceRGB")
+    return True
+
+def optimize_pdf_images(input_path, output_path=None, target_dpi=DEFAULT_TARGET_DPI, jpeg_quality=DEFAULT_JPEG_QUALITY,
+                        fmt="jpeg", detect_grayscale=True, workers=None):
+    """Downsample and recompress the images of a finished PDF.
+
+    Images placed above ``target_dpi`` are resampled to it, lossless images
+    are re-encoded as JPEG (or JPEG 2000 with ``fmt="jpx"``) and colour
+    images with no colour content become grayscale. Replacements that are
+    not smaller than the original are discarded. Writes ``output_path``
+    (default: replace ``input_path``) and returns size and timing stats.
+    """
+    if fmt not in ("jpeg", "jpx"):
+        raise ValueError(f"Unsupported image format: {fmt}")
+    # A non-positive target would scale every image down to a single pixel.
+    if target_dpi <= 0:
+        raise ValueError("target_dpi must be positive")
+    if not 1 <= jpeg_quality <= 100:
+        raise ValueError("jpeg_quality must be between 1 and 100")
+    output_path = output_path or input_path
+    stats = {'bytes_before': os.path.getsize(input_path), 'images_found': 0, 'images_recompressed': 0,
+             'timings': {}}
+
+    start = time.perf_counter()
+    doc = fitz.open(input_path)
+    try:
+        dpi = _effective_dpi(doc)
+        stats['images_found'] = len(dpi)
+        stats['timings']['analyze'] = time.perf_counter() - start
+
+        # Images are extracted as workers free up and each result is written
+        # back as soon as it arrives, instead of loading every image first.
+        start = time.perf_counter()
+        max_pending = (workers or os.cpu_count() or 1) * PENDING_PER_WORKER
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            for job in _candidates(doc, dpi, target_dpi, fmt, jpeg_quality, detect_grayscale):
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    stats['images_recompressed'] += sum(_apply(doc, future.result()) for future in done)
+                pending.add(executor.submit(_recompress, job))
+            for future in pending:
+                stats['images_recompressed'] += _apply(doc, future.result())
+        stats['timings']['recompress'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        # fitz cannot overwrite the file it has open, so write next to it and swap.
+        fd, tmp_path = tempfile.mkstemp(suffix=".pdf", dir=os.path.dirname(os.path.abspath(output_path)))
+        os.close(fd)
+        try:
+            doc.save(tmp_path, garbage=3, deflate=True)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+    finally:
+        doc.close()
+    os.replace(tmp_path, output_path)
+    stats['timings']['write'] = time.perf_counter() - start
+    stats['bytes_after'] = os.path.getsize(output_path)
+    return stats
+
+__all__ = ['optimize_pdf_images', 'DEFAULT_TARGET_DPI', 'DEFAULT_JPEG_QUALITY']
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from io import BytesIO
+from PyPDF2 import PdfReader
+from covers import render_cover
+from pdf_compiler import reader_pool, tree_page_count
+from pdf_index import get_index
+from stream_writer import StreamingPdfWriter
+
+SEGMENT_CACHE_DIR = os.environ.get("SEGMENT_CACHE_DIR", os.path.join(".cache", "segments"))
+SEGMENT_CACHE_BYTES = int(os.environ.get("SEGMENT_CACHE_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+def report_segments(report):
+    """(source, pages) pairs for a saved report; pages are 1-based, None means every page.
+
+    A source of None is the generated title page. Cover pages come from the
+    first file and are followed by the selected pages of every file, as in
+    the GUI.
+    """
+    segments = []
+    if report.use_cover_pages:
+        segments.append((None, None))
+    if report.use_cover_pages and report.cover_pages and report.file_paths:
+        segments.append((report.file_paths[0], list(report.cover_pages)))
+    for path in report.file_paths:
+        pages = report.page_selections.get(path)
+        if pages is None or pages:
+            segments.append((path, list(pages) if pages is not None else None))
+    return segments
+
+def segment_fingerprint(path, pages):
+    # The content hash comes from the metadata index, so an unchanged file
+    # is not re-read; a touched-but-identical file still matches.
+    if path is None:
+        content_hash = hashlib.sha256(render_cover()).hexdigest()
+    else:
+        content_hash = get_index().lookup(path)['content_hash']
+    raw = json.dumps([content_hash, pages], separators=(',', ':')).encode()
+    return hashlib.sha256(raw).hexdigest()
+
+def write_segments(segments, stream, splice_index=None):
+    """Stream the pages of ``segments`` from pooled readers into ``stream``; returns writer stats."""
+    writer = StreamingPdfWriter(stream, splice_index=splice_index)
+    for path, pages in segments:
+        if path is None:
+            writer.append(PdfReader(BytesIO(render_cover())))
+            continue
+        with reader_pool.open(path) as reader:
+            if pages is None:
+                # The whole file, with its outline and named destinations.
+                writer.append(reader)
+                continue
+            num_pages = tree_page_count(reader)
+            writer.append(reader, [p - 1 for p in pages if 1 <= p <= num_pages])
+    writer.close()
+    return writer.stats()
+
+def _splice_index_path(segment_path):
+    return segment_path + ".splice"
+
+def _build_segment(path, pages, segment_path):
+    # The splice index goes in place after the segment: a segment without
+    # one is rebuilt rather than spliced.
+    tmp_path = f"{segment_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    tmp_index = tmp_path + ".splice"
+    with open(tmp_path, 'wb') as f:
+        write_segments([(path, pages)], f, splice_index=tmp_index)
+    os.replace(tmp_path, segment_path)
+    os.replace(tmp_index, _splice_index_path(segment_path))
+
+def prune_segment_cache(cache_dir=SEGMENT_CACHE_DIR, max_bytes=SEGMENT_CACHE_BYTES, keep=()):
+    """Remove least recently used segments (and their splice indexes) until the cache fits ``max_bytes``.
+
+    Segments being written (``.tmp`` files) are neither counted nor removed.
+    """
+    if not os.path.isdir(cache_dir):
+        return 0
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith('.pdf'):
+            continue
+        path = os.path.join(cache_dir, name)
+        st = os.stat(path)
+        size = st.st_size
+        if os.path.exists(_splice_index_path(path)):
+            size += os.path.getsize(_splice_index_path(path))
+        entries.append((st.st_mtime, path, size))
+    total = sum(size for _, _, size in entries)
+    removed = 0
+    for _, path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path in keep:
+            continue
+        for victim in (path, _splice_index_path(path)):
+            try:
+                os.remove(victim)
+            except FileNotFoundError:
+                pass
+        total -= size
+        removed += 1
+    return removed
+
+def build_report(report, output_file, cache_dir=SEGMENT_CACHE_DIR, manifest_path=None, force=False, prune=True):
+    """Compile ``report`` reusing cached segments whose source and pages are unchanged.
+
+    Each (source file, page selection) segment, and the title page, is
+    compiled to its own PDF in ``cache_dir`` keyed by a fingerprint; only
+    segments without a cached artifact are rebuilt. All segments are then
+    spliced in order into ``output_file`` as raw bytes, without being
+    parsed. A JSON manifest of what was reused versus rebuilt is written
+    next to the output (or to ``manifest_path``) and returned.
+
+    ``prune=False`` leaves the cache size alone; callers building several
+    reports at once prune once they are all done, so one build cannot
+    remove a segment another is about to splice.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    start = time.perf_counter()
+    manifest = {'report': report.name, 'output': os.path.abspath(output_file), 'segments': []}
+    segment_paths = []
+    for source, pages in report_segments(report):
+        fingerprint = segment_fingerprint(source, pages)
+        segment_path = os.path.join(cache_dir, f"{fingerprint}.pdf")
+        segment_start = time.perf_counter()
+        if os.path.exists(segment_path) and os.path.exists(_splice_index_path(segment_path)) and not force:
+            status = 'reused'
+            os.utime(segment_path)
+        else:
+            status = 'rebuilt'
+            _build_segment(source, pages, segment_path)
+        manifest['segments'].append({
+            'source': os.path.abspath(source) if source is not None else None,
+            'pages': pages,
+            'fingerprint': fingerprint,
+            'status': status,
+            'seconds': round(time.perf_counter() - segment_start, 4),
+        })
+        segment_paths.append(segment_path)
+
+    splice_start = time.perf_counter()
+    with open(output_file, 'wb') as f:
+        writer = StreamingPdfWriter(f)
+        for segment, segment_path in zip(manifest['segments'], segment_paths):
+            segment['num_pages'] = writer.splice(segment_path, _splice_index_path(segment_path))
+        writer.close()
+
+    manifest['reused'] = sum(1 for s in manifest['segments'] if s['status'] == 'reused')
+    manifest['rebuilt'] = len(manifest['segments']) - manifest['reused']
+    manifest['pages'] = len(writer.pages)
+    manifest['bytes_written'] = os.path.getsize(output_file)
+    manifest['timings'] = {'splice': time.perf_counter() - splice_start, 'total': time.perf_counter() - start}
+    if prune:
+        prune_segment_cache(cache_dir, keep=set(segment_paths))
+
+    manifest_path = manifest_path or f"{os.path.splitext(output_file)[0]}.manifest.json"
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+__all__ = ['build_report', 'report_segments', 'write_segments', 'segment_fingerprint', 'prune_segment_cache']
@@ -0,0 +1,203 @@
+import os
+import threading
+import time
+import uuid
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, CancelledError
+from pdf_compiler import compile_pdfs, cover_page_count, CompilePlan, CompileCancelled
+import metrics
+
+COMPILE_WORKERS = int(os.environ.get("COMPILE_WORKERS", "2"))
+COMPILE_WORKER_MODE = os.environ.get("COMPILE_WORKER_MODE", "thread")
+COMPILE_QUEUE_DEPTH = int(os.environ.get("COMPILE_QUEUE_DEPTH", "16"))
+FINISHED_JOBS_KEPT = 100
+# Retention for compiled results in the output directory
+OUTPUT_MAX_BYTES = int(os.environ.get("OUTPUT_MAX_BYTES", str(5 * 1024 * 1024 * 1024)))
+OUTPUT_MAX_AGE = float(os.environ.get("OUTPUT_MAX_AGE", str(24 * 3600)))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+class JobQueueFull(Exception):
+    pass
+
+def _run_compile(input_files, output_path, options, progress, cancel_event):
+    progress['status'] = RUNNING
+    # Planning uses the lazy probe, which only reads each file's trailer and page tree root.
+    options = dict(options)
+    plan = CompilePlan.from_files(input_files, options.pop('cover_pages', None), options.pop('page_selections', None))
+    progress['pages_total'] = plan.total_pages + cover_page_count(plan, options.get('use_cover_pages'),
+                                                                 options.get('cover_template'))
+
+    def report(pages_written, files_done, files_total):
+        progress.update(pages_written=pages_written, files_done=files_done, files_total=files_total)
+
+    return compile_pdfs(plan, output_path, progress=report, cancel_event=cancel_event, **options)
+
+def prune_outputs(output_dir, max_bytes=OUTPUT_MAX_BYTES, max_age=OUTPUT_MAX_AGE, keep=()):
+    """Delete compiled PDFs older than ``max_age``, then the oldest until the directory fits ``max_bytes``."""
+    if not os.path.isdir(output_dir):
+        return 0
+    entries = []
+    for name in os.listdir(output_dir):
+        path = os.path.join(output_dir, name)
+        if not name.endswith('.pdf') or not os.path.isfile(path):
+            continue
+        st = os.stat(path)
+        entries.append((st.st_mtime, path, st.st_size))
+    total = sum(size for _, _, size in entries)
+    cutoff = time.time() - max_age
+    removed = 0
+    for mtime, path, size in sorted(entries):
+        if mtime >= cutoff and total <= max_bytes:
+            break
+        if path in keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+class Job:
+    def __init__(self, input_files, output_path, progress, cancel_event):
+        self.id = uuid.uuid4().hex
+        self.input_files = list(input_files)
+        self.output_path = output_path
+        self.created_at = time.time()
+        self.finished_at = None
+        self.error = None
+        self.stats = None
+        self.trace = None
+        self._status = QUEUED
+        self._progress = progress
+        self._cancel_event = cancel_event
+        self._future = None
+        self._progress.update(pages_written=0, files_done=0, files_total=len(self.input_files))
+
+    @property
+    def status(self):
+        if self._status == QUEUED and self._progress.get('status') == RUNNING:
+            return RUNNING
+        return self._status
+
+    @property
+    def finished(self):
+        return self._status in (DONE, FAILED, CANCELLED)
+
+    def to_dict(self):
+        progress = dict(self._progress)
+        return {
+            'id': self.id,
+            'status': self.status,
+            'pages_written': progress.get('pages_written', 0),
+            'pages_total': progress.get('pages_total'),
+            'files_done': progress.get('files_done', 0),
+            'files_total': progress.get('files_total', len(self.input_files)),
+            'output_file': os.path.basename(self.output_path) if self._status == DONE else None,
+            'error': self.error,
+            'stats': self.stats,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+
+class JobManager:
+    def __init__(self, max_workers=COMPILE_WORKERS, mode=COMPILE_WORKER_MODE, max_queued=COMPILE_QUEUE_DEPTH):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown worker mode: {mode}")
+        self.mode = mode
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._manager = None
+        if mode == "process":
+            # Progress and cancellation have to cross the process boundary.
+            self._manager = multiprocessing.Manager()
+            self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="compile")
+
+    def _new_shared_state(self):
+        if self._manager is not None:
+            return self._manager.dict(), self._manager.Event()
+        return {}, threading.Event()
+
+    def submit(self, input_files, output_path, **options):
+        with self._lock:
+            active = sum(1 for job in self._jobs.values() if not job.finished)
+            if active >= self.max_workers + self.max_queued:
+                raise JobQueueFull(f"Compile queue is full ({active} jobs pending)")
+            progress, cancel_event = self._new_shared_state()
+            job = Job(input_files, output_path, progress, cancel_event)
+            job.trace_requested = bool(options.get('trace'))
+            self._jobs[job.id] = job
+            self._prune()
+            running = {os.path.abspath(j.output_path) for j in self._jobs.values() if not j.finished}
+        output_dir = os.path.dirname(os.path.abspath(output_path))
+        os.makedirs(output_dir, exist_ok=True)
+        prune_outputs(output_dir, keep=running)
+        if self.mode == "process":
+            # Metrics recorded in a worker process stay there; the trace brings them back.
+            options = dict(options, trace=True)
+        job._future = self._executor.submit(_run_compile, job.input_files, output_path, options, progress, cancel_event)
+        job._future.add_done_callback(lambda future: self._finish(job, future))
+        # The job was listed before it had a future; a cancel() in between
+        # could only set the event.
+        if cancel_event.is_set():
+            job._future.cancel()
+        return job
+
+    def _finish(self, job, future):
+        try:
+            job.stats = future.result()
+            job._status = DONE
+        except (CancelledError, CompileCancelled):
+            job._status = CANCELLED
+        except Exception as e:
+            job.error = str(e)
+            job._status = FAILED
+        job.finished_at = time.time()
+        if job.stats is not None:
+            trace = job.stats.pop('trace', None)
+            if self.mode == "process":
+                metrics.record_trace(trace, job.stats['pages'])
+            if job.trace_requested:
+                job.trace = trace
+        elif self.mode == "process" and job._status in (FAILED, CANCELLED):
+            metrics.COMPILES.inc(status=job._status)
+        if job._status != DONE and os.path.exists(job.output_path):
+            os.remove(job.output_path)
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if job.finished]
+        finished.sort(key=lambda job: job.finished_at)
+        for job in finished[:max(0, len(finished) - FINISHED_JOBS_KEPT)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        job._cancel_event.set()
+        # Not yet submitted: submit() cancels the future once it exists.
+        future = job._future
+        if future is not None:
+            future.cancel()
+        return True
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        if self._manager is not None:
+            self._manager.shutdown()
+
+__all__ = ['JobManager', 'Job', 'JobQueueFull', 'prune_outputs']
@@ -1,20 +1,39 @@
-from flask import Flask, render_template, jsonify, request, send_from_directory, send_file
+from flask import Flask, Response, render_template, jsonify, request, send_from_directory, send_file, session
 import os
-import json
-from pdf_compiler import compile_pdfs, get_pdf_info, parse_page_range
+import threading
+import uuid
+from pdf_compiler import iter_compiled_pdf, CompilePlan
+from page_ranges import PageRangeSet, PageRangeError
 from name_generator import generate_space_name
-from PyPDF2 import PdfReader
-from io import BytesIO
-import fitz  # PyMuPDF
+from jobs import JobManager, JobQueueFull
+from pdf_index import cached_pdf_info
+from search_index import get_search_index
+from thumbnails import (thumbnail_cache, thumbnail_key, last_modified, page_count, preview_batch, batch_etag,
+                        MIMETYPES)
+from uploads import upload_store, UploadRejected
+from werkzeug.formparser import parse_form_data
+from workspaces import workspace_store
+from metrics import render_metrics, metrics_json, record_error
 
 app = Flask(__name__)
+# Signs the session cookie that identifies a browser's workspace; set
+# SECRET_KEY so sessions survive restarts.
+app.secret_key = os.environ.get("SECRET_KEY") or os.urandom(32)
 
-# Initialize an empty list to store PDF file names
-pdf_files = []
+# Compilations run in a bounded worker pool instead of on the request thread
+job_manager = JobManager()
+
+# Compilations streamed straight into a response run outside the job pool
+STREAMING_COMPILES = int(os.environ.get("STREAMING_COMPILES", "4"))
+stream_slots = threading.BoundedSemaphore(STREAMING_COMPILES)
 
 # Add a version number for cache busting
 STATIC_VERSION = "3"
 
+# Upper bounds for one multi-page preview request
+PREVIEW_MAX_PAGES = 100
+PREVIEW_MAX_WIDTH = 2000
+
 @app.route('/')
 def index():
     return render_template('index.html', static_version=STATIC_VERSION)
@@ -23,86 +42,325 @@ def index():
 def send_static(path):
     return send_from_directory('static', path)
 
+def _workspace():
+    # API clients send X-API-Token; browsers get a random workspace id in their session.
+    token = request.headers.get('X-API-Token')
+    if not token:
+        if 'workspace' not in session:
+            session['workspace'] = uuid.uuid4().hex
+        token = session['workspace']
+    return workspace_store.get(workspace_store.key_for(token))
+
 @app.route('/add_pdf', methods=['POST'])
 def add_pdf():
     pdf_name = request.json.get('name')
-    if pdf_name and pdf_name not in pdf_files:
-        pdf_files.append(pdf_name)
+    workspace = _workspace()
+    if pdf_name and workspace.add(pdf_name):
+        workspace_store.save(workspace)
+        get_search_index().schedule([pdf_name])
         return jsonify(success=True, message=f"Added {pdf_name}")
     return jsonify(success=False, message="Invalid PDF name or already exists")
 
 @app.route('/remove_pdf', methods=['POST'])
 def remove_pdf():
     pdf_name = request.json.get('name')
-    if pdf_name in pdf_files:
-        pdf_files.remove(pdf_name)
+    workspace = _workspace()
+    if workspace.remove(pdf_name):
+        workspace_store.save(workspace)
         return jsonify(success=True, message=f"Removed {pdf_name}")
     return jsonify(success=False, message="PDF not found")
 
+def _image_options(payload):
+    # Accepts true for the defaults, or {"targetDpi", "jpegQuality", "format", "grayscale"}
+    if not payload:
+        return None
+    if payload is True:
+        return True
+    options = {}
+    if 'targetDpi' in payload:
+        options['target_dpi'] = int(payload['targetDpi'])
+        if options['target_dpi'] <= 0:
+            raise ValueError("targetDpi must be positive")
+    if 'jpegQuality' in payload:
+        options['jpeg_quality'] = int(payload['jpegQuality'])
+        if not 1 <= options['jpeg_quality'] <= 100:
+            raise ValueError("jpegQuality must be between 1 and 100")
+    if 'format' in payload:
+        if payload['format'] not in ('jpeg', 'jpx'):
+            raise ValueError("format must be 'jpeg' or 'jpx'")
+        options['fmt'] = payload['format']
+    if 'grayscale' in payload:
+        options['detect_grayscale'] = bool(payload['grayscale'])
+    return options or True
+
+def _cover_template(payload):
+    # Accepts true for the defaults, or {"title", "date", "toc"}
+    if not payload:
+        return None
+    if payload is True:
+        return True
+    if not isinstance(payload, dict):
+        raise ValueError("expected true or an object")
+    template = {}
+    if 'title' in payload:
+        template['title'] = str(payload['title'])[:200]
+    if 'date' in payload:
+        template['date'] = payload['date'] if payload['date'] is True else str(payload['date'])[:100]
+    if 'toc' in payload:
+        template['toc'] = bool(payload['toc'])
+    return template or True
+
+@app.route('/uploads', methods=['POST', 'PUT'])
+def upload_pdfs():
+    # multipart/form-data bodies may carry several files; any other body
+    # (e.g. application/pdf via PUT) is a single raw file.
+    if request.mimetype != 'multipart/form-data':
+        filename = request.headers.get('X-Filename') or request.args.get('filename')
+        try:
+            upload = upload_store.store_stream(request.stream, filename)
+        except UploadRejected as e:
+            return jsonify(success=False, message=str(e)), 400
+        return jsonify(success=True, uploads=[upload]), 201
+
+    spools = []
+    def stream_factory(*args, **kwargs):
+        spools.append(upload_store.stream_factory(*args, **kwargs))
+        return spools[-1]
+    try:
+        _, _, files = parse_form_data(request.environ, stream_factory=stream_factory, silent=False)
+        uploads = [upload_store.commit(storage.stream, storage.filename) for storage in files.values()]
+    except UploadRejected as e:
+        return jsonify(success=False, message=str(e)), 400
+    finally:
+        for spool in spools:
+            spool.discard()
+    if not uploads:
+        return jsonify(success=False, message="No files in upload"), 400
+    return jsonify(success=True, uploads=uploads), 201
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def upload_info(upload_id):
+    try:
+        return jsonify(success=True, upload=upload_store.info(upload_id))
+    except KeyError:
+        return jsonify(success=False, message="Upload not found"), 404
+
 @app.route('/compile_pdf', methods=['POST'])
 def compile_pdf():
+    names = _workspace().names()
+    input_files = names
+    if request.json.get('uploads'):
+        names = request.json['uploads']
+        try:
+            input_files = [upload_store.path(upload_id) for upload_id in names]
+        except KeyError as e:
+            return jsonify(success=False, message=f"Upload not found: {e.args[0]}"), 404
+    # {"name or upload id": "1-3,7"} limits a file to those pages
+    selections = request.json.get('pageSelections') or {}
+    unknown = [name for name in selections if name not in names]
+    if unknown:
+        return jsonify(success=False, message=f"PDF not found: {unknown[0]}"), 404
+    page_selections = {path: selections[name] for name, path in zip(names, input_files) if name in selections}
     use_cover_pages = request.json.get('useCoverPages', False)
     cover_pages = request.json.get('coverPages', '')
+    dedup = bool(request.json.get('dedup', False))
+    raw_copy = bool(request.json.get('rawCopy', False))
+    try:
+        optimize_images = _image_options(request.json.get('optimizeImages'))
+    except (TypeError, ValueError) as e:
+        return jsonify(success=False, message=f"Invalid optimizeImages options: {str(e)}"), 400
+    if raw_copy and optimize_images:
+        return jsonify(success=False, message="rawCopy cannot be combined with optimizeImages"), 400
+    try:
+        cover_template = _cover_template(request.json.get('coverTemplate'))
+    except ValueError as e:
+        return jsonify(success=False, message=f"Invalid coverTemplate: {str(e)}"), 400
     output_filename = generate_space_name() + ".pdf"
+    if request.json.get('stream'):
+        return _stream_compile(input_files, output_filename, use_cover_pages, cover_pages, page_selections, dedup,
+                               cover_template)
     output_path = os.path.join("output", output_filename)
+    trace = bool(request.json.get('trace', False))
     
     try:
-        compile_pdfs(pdf_files, output_path, use_cover_pages, cover_pages)
-        return jsonify(success=True, message=f"PDFs compiled successfully as {output_filename}", files=pdf_files, useCoverPages=use_cover_pages, coverPages=cover_pages)
+        job = job_manager.submit(input_files, output_path, use_cover_pages=use_cover_pages, cover_pages=cover_pages,
+                                 page_selections=page_selections, dedup=dedup, optimize_images=optimize_images, cover_template=cover_template,
+                                 trace=trace, raw_copy=raw_copy)
+    except JobQueueFull as e:
+        return jsonify(success=False, message=str(e)), 429
+    return jsonify(success=True, message=f"Compilation queued as {output_filename}", jobId=job.id, statusUrl=f"/jobs/{job.id}", files=job.input_files, useCoverPages=use_cover_pages, coverPages=cover_pages), 202
+
+def _stream_compile(input_files, output_filename, use_cover_pages, cover_pages, page_selections, dedup,
+                    cover_template):
+    # The PDF is sent with chunked transfer encoding as it is produced; nothing is written to disk.
+    # Errors after the first chunk can only abort the response, so check inputs up front.
+    missing = [path for path in input_files if not os.path.exists(path)]
+    if missing:
+        return jsonify(success=False, message=f"PDF not found: {missing[0]}"), 404
+    try:
+        plan = CompilePlan.from_files(input_files, cover_pages, page_selections)
+    except PageRangeError as e:
+        return jsonify(success=False, message=f"Invalid page range: {str(e)}"), 400
+    if not stream_slots.acquire(blocking=False):
+        return jsonify(success=False, message="Too many streaming compilations in progress"), 429
+    chunks = iter_compiled_pdf(plan, use_cover_pages, dedup=dedup, cover_template=cover_template)
+    try:
+        first = next(chunks, b"")
     except Exception as e:
-        return jsonify(success=False, message=f"Error compiling PDFs: {str(e)}")
+        stream_slots.release()
+        record_error('compile')
+        return jsonify(success=False, message=f"Error compiling PDFs: {str(e)}"), 500
+
+    def body():
+        yield first
+        yield from chunks
+
+    response = Response(body(), mimetype='application/pdf')
+    response.headers['Content-Disposition'] = f'attachment; filename="{output_filename}"'
+    response.call_on_close(chunks.close)
+    response.call_on_close(stream_slots.release)
+    return response
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify(success=False, message="Job not found"), 404
+    return jsonify(success=True, job=job.to_dict())
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    if job_manager.cancel(job_id):
+        return jsonify(success=True, message="Cancellation requested")
+    return jsonify(success=False, message="Job not found or already finished"), 404
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify(success=False, message="Job not found"), 404
+    if job.status != "done":
+        return jsonify(success=False, message=f"Job is {job.status}", job=job.to_dict()), 409
+    if not os.path.exists(job.output_path):
+        return jsonify(success=False, message="Result has expired"), 410
+    return send_file(os.path.abspath(job.output_path), mimetype='application/pdf', as_attachment=True,
+                     download_name=os.path.basename(job.output_path))
+
+@app.route('/jobs/<job_id>/trace', methods=['GET'])
+def job_trace(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify(success=False, message="Job not found"), 404
+    if job.trace is None:
+        return jsonify(success=False, message="No trace recorded; submit the job with \"trace\": true"), 404
+    return jsonify(success=True, trace=job.trace)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    if request.args.get('format') == 'json':
+        return jsonify(metrics_json())
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/get_pdfs', methods=['GET'])
 def get_pdfs():
-    return jsonify(pdf_files)
+    return jsonify(_workspace().names())
 
 @app.route('/reorder_pdfs', methods=['POST'])
 def reorder_pdfs():
     old_index = request.json.get('oldIndex')
     new_index = request.json.get('newIndex')
     
-    if old_index is not None and new_index is not None:
-        pdf_files.insert(new_index, pdf_files.pop(old_index))
+    workspace = _workspace()
+    if old_index is not None and new_index is not None and workspace.move_index(old_index, new_index):
+        workspace_store.save(workspace)
         return jsonify(success=True, message="PDF order updated successfully")
     return jsonify(success=False, message="Invalid indices provided")
 
+def _thumbnail_response(key):
+    response = Response(mimetype=MIMETYPES[key.fmt])
+    response.set_etag(key.etag)
+    response.last_modified = last_modified(key)
+    response.cache_control.no_cache = True
+    # Revalidation is answered from the key alone, without rendering.
+    response.make_conditional(request)
+    if response.status_code != 304:
+        response.set_data(thumbnail_cache.get(key))
+    return response
+
+def _preview_batch_response(keys, fmt, layout):
+    response = Response()
+    response.set_etag(batch_etag(keys))
+    response.last_modified = last_modified(keys[0])
+    response.cache_control.no_cache = True
+    response.make_conditional(request)
+    if response.status_code == 304:
+        return response
+    content_type, headers, body = preview_batch(keys, fmt, layout)
+    response.content_type = content_type
+    response.headers.update(headers)
+    response.set_data(body)
+    return response
+
+@app.route('/search', methods=['GET'])
+def search():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify(success=False, message="Missing search query"), 400
+    limit = request.args.get('limit', 50, type=int)
+    order = request.args.get('order', 'page')
+    if order not in ('page', 'rank'):
+        return jsonify(success=False, message=f"Unsupported order: {order}"), 400
+    names = _workspace().names()
+    index = get_search_index()
+    # Files that are new or changed since they were indexed are picked up in
+    # the background; their hits appear once indexing finishes.
+    pending = index.schedule(names)
+    try:
+        hits = index.search(query, names, limit=limit, order=order)
+    except Exception as e:
+        record_error('search')
+        return jsonify(success=False, message=f"Error searching PDFs: {str(e)}"), 400
+    relative = {os.path.abspath(name): name for name in names}
+    for hit in hits:
+        hit['file'] = relative.get(hit['file'], hit['file'])
+    return jsonify(success=True, query=query, hits=hits, pending=[relative.get(p, p) for p in pending])
+
 @app.route('/preview_pdf/<pdf_name>')
 def preview_pdf(pdf_name):
-    if pdf_name in pdf_files:
+    if pdf_name in _workspace():
+        fmt = request.args.get('format', 'png')
+        width = request.args.get('width', type=int)
+        if fmt not in ('png', 'jpeg', 'webp'):
+            return jsonify(success=False, message=f"Unsupported format: {fmt}"), 400
+        if width is not None and not 0 < width <= PREVIEW_MAX_WIDTH:
+            return jsonify(success=False, message=f"Width must be between 1 and {PREVIEW_MAX_WIDTH}"), 400
         try:
-            # Open the PDF file
-            pdf_document = fitz.open(pdf_name)
-            
-            # Get the first page
-            page = pdf_document[0]
-            
-            # Render the page as a PNG image
-            pix = page.get_pixmap()
-            img_bytes = pix.tobytes("png")
-            
-            # Close the PDF document
-            pdf_document.close()
-            
-            # Send the image as a response
-            return send_file(
-                BytesIO(img_bytes),
-                mimetype='image/png'
-            )
+            if 'pages' not in request.args:
+                return _thumbnail_response(thumbnail_key(pdf_name, 0, fmt=fmt, width=width))
+            try:
+                pages = PageRangeSet.parse(request.args['pages'], page_count(pdf_name))
+            except PageRangeError as e:
+                return jsonify(success=False, message=f"Invalid page range: {str(e)}"), 400
+            if not pages or len(pages) > PREVIEW_MAX_PAGES:
+                return jsonify(success=False, message=f"Request between 1 and {PREVIEW_MAX_PAGES} existing pages"), 400
+            keys = [thumbnail_key(pdf_name, page - 1, fmt=fmt, width=width) for page in pages]
+            return _preview_batch_response(keys, fmt, request.args.get('layout', 'multipart'))
         except Exception as e:
+            record_error('preview')
             return jsonify(success=False, message=f"Error generating preview: {str(e)}")
     return jsonify(success=False, message="PDF not found")
 
 @app.route('/pdf_info/<pdf_name>')
 def pdf_info(pdf_name):
-    if pdf_name in pdf_files:
+    if pdf_name in _workspace():
         try:
-            info = get_pdf_info(pdf_name)
+            info = cached_pdf_info(pdf_name)
             return jsonify(info)
         except Exception as e:
+            record_error('pdf_info')
             return jsonify(success=False, message=f"Error fetching PDF info: {str(e)}")
     return jsonify(success=False, message="PDF not found")
 
 if __name__ == '__main__':
-    if not os.path.exists("output"):
-        os.makedirs("output")
     app.run(host='0.0.0.0', port=8080, debug=True)
@@ -0,0 +1,344 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Seconds; from a cached cover render up to a multi-minute compile
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+PAGES_PER_SECOND_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000)
+# Spans kept per trace; stage totals keep counting past the limit
+MAX_TRACE_SPANS = int(os.environ.get("MAX_TRACE_SPANS", "10000"))
+
+def _label_text(labelnames, key):
+    if not labelnames:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(labelnames, key)) + "}"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_label_text(self.labelnames, key)} {_format(value)}" for key, value in values]
+
+    def to_dict(self):
+        with self._lock:
+            return [{'labels': dict(zip(self.labelnames, key)), 'value': value} for key, value in sorted(self._values.items())]
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Per label set: [per-bucket counts (last one is +Inf), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        with self._lock:
+            values = sorted((key, [list(entry[0]), entry[1], entry[2]]) for key, entry in self._values.items())
+        lines = []
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                labels = _label_text(self.labelnames + ("le",), key + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _label_text(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+    def to_dict(self):
+        with self._lock:
+            return [{'labels': dict(zip(self.labelnames, key)), 'count': entry[2], 'sum': entry[1],
+                     'mean': entry[1] / entry[2] if entry[2] else 0.0}
+                    for key, entry in sorted(self._values.items())]
+
+class Registry:
+    """Metrics of this process, rendered in the Prometheus text format.
+
+    Collectors are called at scrape time for values other modules already
+    keep (cache hit and miss counts), so nothing is recorded twice.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        """``collector()`` returns (name, kind, help, labels dict, value) samples."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def _collected(self):
+        with self._lock:
+            collectors = list(self._collectors)
+        samples = []
+        for collector in collectors:
+            try:
+                samples.extend(collector())
+            except Exception as e:
+                print(f"Error collecting metrics: {str(e)}")
+        return samples
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        described = set()
+        for name, kind, help, labels, value in sorted(self._collected(), key=lambda sample: sample[0]):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name}{_label_text(tuple(labels), tuple(labels.values()))} {_format(value)}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        data = {metric.name: metric.to_dict() for metric in metrics}
+        for name, kind, help, labels, value in self._collected():
+            data.setdefault(name, []).append({'labels': labels, 'value': value})
+        return data
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "pdf_stage_seconds", "Time spent in each pipeline stage", ["stage"]))
+COMPILES = registry.register(Counter(
+    "pdf_compiles_total", "Compilations by outcome", ["status"]))
+COMPILE_SECONDS = registry.register(Histogram(
+    "pdf_compile_seconds", "Wall time of successful compilations"))
+COMPILE_PAGES_PER_SECOND = registry.register(Histogram(
+    "pdf_compile_pages_per_second", "Pages written per second by successful compilations",
+    buckets=PAGES_PER_SECOND_BUCKETS))
+PAGES_WRITTEN = registry.register(Counter(
+    "pdf_pages_written_total", "Pages written to compiled PDFs"))
+BYTES_READ = registry.register(Counter(
+    "pdf_bytes_read_total", "Bytes of source files opened for parsing or rendering"))
+BYTES_WRITTEN = registry.register(Counter(
+    "pdf_bytes_written_total", "Bytes written by compilations, including intermediate chunk files"))
+ERRORS = registry.register(Counter(
+    "pdf_errors_total", "Errors by operation", ["operation"]))
+
+_TRACE_COUNTERS = {'bytes_read': BYTES_READ, 'bytes_written': BYTES_WRITTEN}
+
+class Trace:
+    """Stage timings and byte counts of one compilation.
+
+    While a trace is active on a thread, ``stage`` and ``count`` add to it
+    instead of the registry; ``record_trace`` publishes the whole trace
+    once the compilation finishes. Traces are plain dicts on the wire, so
+    work done in worker processes is merged into the parent's trace.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.spans = []
+        self.counters = {}
+        self.dropped_spans = 0
+
+    def add(self, stage, seconds, start=None, **attrs):
+        totals = self.stages.setdefault(stage, {'count': 0, 'seconds': 0.0})
+        totals['count'] += 1
+        totals['seconds'] += seconds
+        if len(self.spans) >= MAX_TRACE_SPANS:
+            self.dropped_spans += 1
+            return
+        offset = (start if start is not None else time.perf_counter() - seconds) - self.started
+        self.spans.append(dict(attrs, stage=stage, start=round(offset, 6), seconds=round(seconds, 6)))
+
+    def count(self, name, amount):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def merge(self, data, offset=0.0):
+        """Fold a child trace (``to_dict`` output) into this one; its spans start at ``offset``."""
+        for span in data['spans']:
+            span = dict(span)
+            stage, seconds, start = span.pop('stage'), span.pop('seconds'), span.pop('start')
+            self.add(stage, seconds, self.started + offset + start, **span)
+        self.dropped_spans += data.get('dropped_spans', 0)
+        for stage, totals in data['stages'].items():
+            # Dropped child spans still count toward the stage totals.
+            kept = [span for span in data['spans'] if span['stage'] == stage]
+            extra = totals['count'] - len(kept)
+            if extra > 0:
+                mine = self.stages.setdefault(stage, {'count': 0, 'seconds': 0.0})
+                mine['count'] += extra
+                mine['seconds'] += totals['seconds'] - sum(span['seconds'] for span in kept)
+        for name, amount in data['counters'].items():
+            self.count(name, amount)
+
+    def to_dict(self):
+        return {
+            'seconds': round(time.perf_counter() - self.started, 6),
+            'stages': {stage: {'count': totals['count'], 'seconds': round(totals['seconds'], 6)}
+                       for stage, totals in self.stages.items()},
+            'counters': dict(self.counters),
+            'spans': list(self.spans),
+            'dropped_spans': self.dropped_spans,
+        }
+
+_local = threading.local()
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+@contextmanager
+def tracing(trace):
+    """Make ``trace`` the active trace of this thread."""
+    previous = current_trace()
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+def observe(stage_name, seconds, **attrs):
+    trace = current_trace()
+    if trace is not None:
+        trace.add(stage_name, seconds, **attrs)
+    else:
+        STAGE_SECONDS.observe(seconds, stage=stage_name)
+
+@contextmanager
+def stage(stage_name, **attrs):
+    """Time the enclosed block as ``stage_name`` (exceptions included)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        trace = current_trace()
+        if trace is not None:
+            trace.add(stage_name, seconds, start, **attrs)
+        else:
+            STAGE_SECONDS.observe(seconds, stage=stage_name)
+
+def count(name, amount):
+    """Add ``amount`` to ``bytes_read`` or ``bytes_written``."""
+    trace = current_trace()
+    if trace is not None:
+        trace.count(name, amount)
+    else:
+        _TRACE_COUNTERS[name].inc(amount)
+
+def record_spans(data):
+    """Publish the stage timings and byte counts of a trace (``to_dict`` output)."""
+    for span in data['spans']:
+        STAGE_SECONDS.observe(span['seconds'], stage=span['stage'])
+    for name, amount in data['counters'].items():
+        if name in _TRACE_COUNTERS:
+            _TRACE_COUNTERS[name].inc(amount)
+
+def record_trace(data, pages=0):
+    """Publish a finished compilation's trace (``to_dict`` output) to the registry."""
+    record_spans(data)
+    COMPILES.inc(status="done")
+    COMPILE_SECONDS.observe(data['seconds'])
+    PAGES_WRITTEN.inc(pages)
+    if data['seconds'] > 0:
+        COMPILE_PAGES_PER_SECOND.observe(pages / data['seconds'])
+
+def record_error(operation):
+    ERRORS.inc(operation=operation)
+
+_cache_sources = {}
+
+def register_cache(cache_name, stats):
+    """Export ``stats()['hits']``/``['misses']`` (and ``disk_hits``) of a cache as counters.
+
+    Registering a name again adds ``stats`` to it and the values are summed,
+    e.g. the preview server's front end adds its renderer processes' caches.
+    """
+    if cache_name in _cache_sources:
+        _cache_sources[cache_name].append(stats)
+        return
+    _cache_sources[cache_name] = [stats]
+
+    def collect():
+        values = {}
+        for source in _cache_sources[cache_name]:
+            for key, value in source().items():
+                values[key] = values.get(key, 0) + value
+        samples = [("pdf_cache_hits_total", "counter", "Cache lookups answered from the cache",
+                    {'cache': cache_name}, values.get('hits', 0) + values.get('disk_hits', 0)),
+                   ("pdf_cache_misses_total", "counter", "Cache lookups that had to do the work",
+                    {'cache': cache_name}, values.get('misses', 0))]
+        if 'size' in values:
+            samples.append(("pdf_cache_entries", "gauge", "Entries currently cached", {'cache': cache_name}, values['size']))
+        return samples
+    registry.register_collector(collect)
+
+def render_metrics():
+    return registry.render()
+
+def metrics_json():
+    data = registry.to_dict()
+    # Hit rates are derived here for JSON readers; Prometheus computes its own.
+    hits = {sample['labels']['cache']: sample['value'] for sample in data.get('pdf_cache_hits_total', [])}
+    misses = {sample['labels']['cache']: sample['value'] for sample in data.get('pdf_cache_misses_total', [])}
+    data['cache_hit_rates'] = {name: hits[name] / (hits[name] + misses.get(name, 0))
+                               for name in hits if hits[name] + misses.get(name, 0)}
+    return data
+
+def write_trace(data, path):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+__all__ = ['Counter', 'Histogram', 'Registry', 'Trace', 'registry', 'stage', 'observe', 'count', 'tracing',
+           'current_trace', 'record_spans', 'record_trace', 'record_error', 'register_cache', 'render_metrics', 'metrics_json',
+           'write_trace']
@@ -0,0 +1,198 @@
+import heapq
+import re
+from math import lcm
+
+try:
+    import numpy as np
+except ImportError:  # Only needed for PageRangeSet.to_numpy()
+    np = None
+
+_ITEM = re.compile(r"^(?P<start>-?\d+)(?:\s*(?P<dash>-)\s*(?P<stop>-?\d+)?)?(?:\s*:\s*(?P<step>\d+))?$")
+
+class PageRangeError(ValueError):
+    pass
+
+def _length(start, stop, step):
+    return (stop - start) // step + 1 if stop >= start else 0
+
+def _subtract(piece, cut):
+    # ``piece`` minus ``cut``, both (start, stop, step) progressions whose
+    # stop lies on the progression. Returns at most 2 + lcm/step pieces.
+    a, b, s = piece
+    c, d, k = cut
+    lo, hi = max(a, c), min(b, d)
+    if lo > hi:
+        return [piece]
+    first = a + -(-(lo - a) // s) * s
+    last = a + (hi - a) // s * s
+    if first > last:
+        return [piece]
+    out = []
+    if first > a:
+        out.append((a, first - s, s))
+    if last < b:
+        out.append((last + s, b, s))
+    period = lcm(s, k)
+    for x in range(first, min(last, first + period - s) + 1, s):
+        # x and every x + n*period in [first, last] are all in or all out of ``cut``.
+        if (x - c) % k:
+            out.append((x, x + (last - x) // period * period, period))
+    return out
+
+def _normalize(pieces):
+    # Sort, give single pages step 1 and join touching step-1 intervals.
+    pieces = sorted((a, b, s if b > a else 1) for a, b, s in pieces if b >= a)
+    merged = []
+    for a, b, s in pieces:
+        if merged and s == 1 and merged[-1][2] == 1 and a <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], b), 1)
+        else:
+            merged.append((a, b, s))
+    return merged
+
+class PageRangeSet:
+    """A sorted set of 1-based page numbers stored as disjoint progressions.
+
+    Memory grows with the number of ranges, not pages: "1-1000000" is one
+    (start, stop, step) triple. Pages are produced lazily by iteration,
+    ``indices()`` (0-based) or ``to_numpy()``.
+    """
+
+    def __init__(self, pieces=()):
+        self._pieces = _normalize(pieces)
+
+    @classmethod
+    def parse(cls, text, num_pages):
+        """Parse a comma-separated page selection for a document of ``num_pages`` pages.
+
+        Items are ``5``, ``3-7``, open-ended ``10-``, negative pages counted
+        from the end (``-1`` is the last page, ``-5--1`` the last five) and an
+        optional step (``1-:2`` for odd pages). Items starting with ``!`` are
+        excluded from the result; a selection of only exclusions starts from
+        every page. Pages past the end are dropped; malformed items, page 0,
+        zero steps and ranges that end before they start raise
+        ``PageRangeError``.
+        """
+        items = [item.strip() for item in (text or "").split(',')]
+        if not any(items):
+            raise PageRangeError("Empty page selection")
+        include, exclude = [], []
+        for item in items:
+            if not item:
+                raise PageRangeError(f"Empty item in page selection: {text!r}")
+            negate = item.startswith('!')
+            body = item[1:].strip() if negate else item
+            match = _ITEM.match(body)
+            if not match:
+                raise PageRangeError(f"Invalid page range: {item!r}")
+            piece = cls._resolve(item, match, num_pages)
+            if piece is not None:
+                (exclude if negate else include).append(piece)
+        if not include and all(item.startswith('!') for item in items):
+            include.append((1, num_pages, 1))
+        if all(step == 1 for _, _, step in include):
+            # Plain ranges and single pages: sorting and joining is the union.
+            result = cls(include)
+        else:
+            result = cls()
+            for piece in include:
+                result._add(piece)
+        for cut in exclude:
+            result._pieces = _normalize(p for piece in result._pieces for p in _subtract(piece, cut))
+        return result
+
+    @staticmethod
+    def _resolve(item, match, num_pages):
+        def page(value):
+            number = int(value)
+            if number == 0:
+                raise PageRangeError(f"Page numbers start at 1: {item!r}")
+            return number if number > 0 else num_pages + 1 + number
+
+        start = page(match['start'])
+        if not match['dash']:
+            stop = start
+        elif match['stop'] is None:
+            stop = num_pages
+        else:
+            stop = page(match['stop'])
+        step = int(match['step'] or 1)
+        if step == 0:
+            raise PageRangeError(f"Step must be at least 1: {item!r}")
+        if stop < start and match['stop'] is not None:
+            raise PageRangeError(f"Range ends before it starts: {item!r}")
+        if start < 1:
+            start += -(-(1 - start) // step) * step
+        stop = min(stop, num_pages)
+        stop = start + (stop - start) // step * step if stop >= start else stop
+        return (start, stop, step) if stop >= start else None
+
+    def _add(self, piece):
+        pieces = [piece]
+        for existing in self._pieces:
+            pieces = [p for q in pieces for p in _subtract(q, existing)]
+        self._pieces = _normalize(self._pieces + pieces)
+
+    @property
+    def intervals(self):
+        """The disjoint (start, stop, step) progressions, stop inclusive."""
+        return list(self._pieces)
+
+    def __iter__(self):
+        ranges = [range(a, b + 1, s) for a, b, s in self._pieces]
+        if all(s == 1 for _, _, s in self._pieces):
+            for r in ranges:
+                yield from r
+        else:
+            yield from heapq.merge(*ranges)
+
+    def indices(self):
+        """0-based page indices, in order."""
+        for page in self:
+            yield page - 1
+
+    def __len__(self):
+        return sum(_length(a, b, s) for a, b, s in self._pieces)
+
+    def __bool__(self):
+        return bool(self._pieces)
+
+    def __contains__(self, page):
+        return any(a <= page <= b and (page - a) % s == 0 for a, b, s in self._pieces)
+
+    def __eq__(self, other):
+        return isinstance(other, PageRangeSet) and list(self) == list(other)
+
+    def to_list(self):
+        return list(self)
+
+    def to_numpy(self, zero_based=False):
+        """The pages as a sorted NumPy ``int64`` array (0-based with ``zero_based=True``)."""
+        if np is None:
+            raise ImportError("NumPy is required for PageRangeSet.to_numpy()")
+        offset = 1 if zero_based else 0
+        parts = [np.arange(a - offset, b - offset + 1, s, dtype=np.int64) for a, b, s in self._pieces]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        array = np.concatenate(parts)
+        if any(s != 1 for _, _, s in self._pieces):
+            array.sort()
+        return array
+
+    def __str__(self):
+        parts = []
+        for a, b, s in self._pieces:
+            if a == b:
+                parts.append(str(a))
+            else:
+                parts.append(f"{a}-{b}" + (f":{s}" if s != 1 else ""))
+        return ",".join(parts)
+
+    def __repr__(self):
+        return f"PageRangeSet({str(self)!r})"
+
+def parse_page_range(page_range_str, max_pages):
+    """Sorted list of the 1-based pages selected by ``page_range_str``; see ``PageRangeSet.parse``."""
+    return PageRangeSet.parse(page_range_str, max_pages).to_list()
+
+__all__ = ['PageRangeSet', 'PageRangeError', 'parse_page_range']
@@ -0,0 +1,92 @@
+from bisect import bisect_right
+from PyPDF2 import PageObject
+from PyPDF2.generic import IndirectObject, NameObject
+
+# Attributes a page inherits from its ancestors when it does not set them
+INHERITABLE_ATTRIBUTES = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+def tree_page_count(reader):
+    # /Count on the root /Pages node, without flattening the page tree.
+    # Values that cannot be right for this file fall back to a full walk.
+    try:
+        root = reader.trailer['/Root'].get_object()
+        count = int(root['/Pages'].get_object()['/Count'].get_object())
+        num_objects = sum(len(entries) for entries in reader.xref.values()) + len(reader.xref_objStm)
+        if 0 <= count <= num_objects:
+            return count
+    except Exception:
+        pass
+    return len(reader.pages)
+
+def _is_page_tree_node(node):
+    return node.get("/Type") == "/Pages" or ("/Kids" in node and node.get("/Type") != "/Page")
+
+def _kid_for_index(reader, node, kids, index):
+    # (kid position, index within that kid) for page ``index`` under ``node``.
+    # Kid page counts are summed only as far as needed and remembered per
+    # node, so later lookups in the same (pooled) reader bisect instead of
+    # resolving the same siblings again.
+    ref = node.indirect_reference
+    key = (ref.idnum, ref.generation) if ref is not None else None
+    cache = reader.__dict__.setdefault('_page_tree_starts', {})
+    state = cache.get(key) if key is not None else None
+    if state is None:
+        # First page number of each non-empty kid, its position, kids scanned, pages seen.
+        state = [[], [], 0, 0]
+        if key is not None:
+            cache[key] = state
+    starts, positions = state[0], state[1]
+    while state[3] <= index and state[2] < len(kids):
+        kid = kids[state[2]].get_object()
+        count = int(kid['/Count']) if _is_page_tree_node(kid) else 1
+        if count > 0:
+            starts.append(state[3])
+            positions.append(state[2])
+            state[3] += count
+        state[2] += 1
+    if index >= state[3]:
+        raise IndexError("page index out of range")
+    i = bisect_right(starts, index) - 1
+    return positions[i], index - starts[i]
+
+def _find_page(reader, index):
+    node = reader.trailer['/Root'].get_object()['/Pages'].get_object()
+    inherited = {}
+    while True:
+        for key in INHERITABLE_ATTRIBUTES:
+            if key in node:
+                inherited[key] = node[key]
+        kids = node['/Kids'].get_object()
+        # Kids can hold any number of pages (including none), so the kid is
+        # found from the summed /Count of the ones before it.
+        position, index = _kid_for_index(reader, node, kids, index)
+        ref = kids[position]
+        kid = ref.get_object()
+        if not _is_page_tree_node(kid):
+            return ref, kid, inherited
+        node = kid
+
+def page_at(reader, index):
+    """Page ``index`` (0-based) found by descending the page tree by /Count.
+
+    Unlike ``reader.pages[index]`` this does not flatten the whole tree, so
+    only the nodes on the way to the page are parsed. Inherited attributes
+    are applied to the returned page, not to the source object. Trees
+    whose counts do not add up fall back to ``reader.pages``.
+    """
+    if reader.flattened_pages is not None:
+        return reader.pages[index]
+    if index < 0:
+        index += tree_page_count(reader)
+    try:
+        ref, leaf, inherited = _find_page(reader, index)
+    except Exception:
+        return reader.pages[index]
+    page = PageObject(reader, ref if isinstance(ref, IndirectObject) else None)
+    page.update(leaf)
+    for key, value in inherited.items():
+        if key not in page:
+            page[NameObject(key)] = value
+    return page
+
+__all__ = ['page_at', 'tree_page_count', 'INHERITABLE_ATTRIBUTES']
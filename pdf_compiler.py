@@ -1,68 +1,662 @@
+import io
+import mmap
 import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from PyPDF2 import PdfReader, PdfWriter
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-
-def create_cover_page(output_path, title):
-    c = canvas.Canvas(output_path, pagesize=letter)
-    width, height = letter
-    c.setFont("Helvetica-Bold", 24)
-    c.drawCentredString(width / 2, height / 2, title)
-    c.save()
-
-def compile_pdfs(input_files, output_file, use_cover_pages=False, cover_pages=None):
-    writer = PdfWriter()
-    
-    if use_cover_pages:
-        cover_page_path = "cover_page.pdf"
-        create_cover_page(cover_page_path, "Compiled PDF")
-        writer.append(cover_page_path)
-
-    for input_file in input_files:
-        reader = PdfReader(input_file)
-        if cover_pages and input_file == input_files[0]:
-            for page_num in parse_page_range(cover_pages, len(reader.pages)):
-                writer.add_page(reader.pages[page_num - 1])
+from PyPDF2.generic import StreamObject
+from stream_writer import StreamingPdfWriter
+from image_optimizer import optimize_pdf_images
+from covers import render_cover, cover_from_template, template_page_count
+from compile_plan import CompilePlan
+from page_tree import page_at, tree_page_count
+from page_ranges import parse_page_range
+from io import BytesIO
+import metrics
+
+READER_POOL_SIZE = int(os.environ.get("PDF_READER_POOL_SIZE", "32"))
+STREAM_CHUNK_BYTES = 64 * 1024
+# Chunks buffered between the compiling thread and a slow reader.
+STREAM_QUEUE_CHUNKS = 16
+# Minimum seconds between progress callbacks while a run's pages are copied
+PROGRESS_INTERVAL = 0.1
+# Sources are memory-mapped rather than read into memory; set PDF_MMAP=0 to
+# turn this off. Off by default on Windows, where a mapped file cannot be
+# replaced or deleted.
+PDF_MMAP = os.environ.get("PDF_MMAP", "0" if os.name == "nt" else "1") == "1"
+
+class _PoolEntry:
+    def __init__(self, obj):
+        self.obj = obj
+        self.lock = threading.RLock()
+        self.users = 0
+        self.evicted = False
+
+class ReaderPool:
+    """Bounded LRU of open documents keyed by (path, mtime, size).
+
+    A file that changes on disk gets a new key, so stale readers are never
+    handed out. Each entry carries its own lock because PyPDF2 readers and
+    fitz documents share a single stream position and are not thread-safe.
+    ``trim`` is called with the lock still held at the end of every use.
+    """
+
+    def __init__(self, opener, max_size=READER_POOL_SIZE, closer=None, stage="parse", trim=None):
+        self._opener = opener
+        self._closer = closer
+        self._trim = trim
+        self.stage = stage
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_for(path):
+        st = os.stat(path)
+        return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+    @contextmanager
+    def open(self, path):
+        key = self.key_for(path)
+        entry = self._acquire(key)
+        if entry is None:
+            with metrics.stage(self.stage):
+                obj = self._opener(path)
+            metrics.count('bytes_read', key[2])
+            entry = self._insert(key, _PoolEntry(obj))
+        try:
+            with entry.lock:
+                try:
+                    yield entry.obj
+                finally:
+                    if self._trim is not None:
+                        self._trim(entry.obj)
+        finally:
+            self._release(entry)
+
+    def _acquire(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            entry.users += 1
+            return entry
+
+    def _insert(self, key, entry):
+        to_close = []
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None:
+                # Another thread opened the same file while we were parsing.
+                existing.users += 1
+                to_close.append(entry)
+                entry = existing
+            else:
+                for stale_key in [k for k in self._entries if k[0] == key[0]]:
+                    to_close.extend(self._evict(stale_key))
+                self._entries[key] = entry
+                entry.users += 1
+                while len(self._entries) > self.max_size:
+                    to_close.extend(self._evict(next(iter(self._entries))))
+        for stale in to_close:
+            self._close(stale)
+        return entry
+
+    def _evict(self, key):
+        entry = self._entries.pop(key)
+        entry.evicted = True
+        return [entry] if entry.users == 0 else []
+
+    def _release(self, entry):
+        with self._lock:
+            entry.users -= 1
+            close_now = entry.evicted and entry.users == 0
+        if close_now:
+            self._close(entry)
+
+    def _close(self, entry):
+        if self._closer is not None:
+            try:
+                self._closer(entry.obj)
+            except Exception:
+                pass
+
+    def clear(self):
+        with self._lock:
+            to_close = []
+            for key in list(self._entries):
+                to_close.extend(self._evict(key))
+        for entry in to_close:
+            self._close(entry)
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+def open_pdf(path):
+    """``PdfReader`` over a read-only memory map of ``path``.
+
+    Given a path, PyPDF2 first reads the whole file into memory. Over a map
+    only the objects that are parsed are read, straight from the page
+    cache. The map is released when the reader is garbage collected.
+
+    A mapped file must not be truncated or rewritten in place while the
+    reader is in use: touching a page that no longer exists raises SIGBUS
+    and kills the process. Replacing the file (a new inode, as
+    ``os.replace`` does) is safe. Only readers used for one compile are
+    mapped; pooled readers use ``open_pooled_pdf``.
+    """
+    if PDF_MMAP:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                return PdfReader(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    return PdfReader(path)
+
+def open_pooled_pdf(path):
+    """``PdfReader`` over a buffered file handle of ``path``, for the reader pool.
+
+    Pooled readers outlive any one compile, so they are not memory-mapped:
+    a source rewritten in place meanwhile makes a read fail with a parse
+    error instead of SIGBUS. Objects are still read lazily. The handle is
+    closed when the pool drops the reader.
+    """
+    if not PDF_MMAP:
+        return PdfReader(path)
+    f = open(path, 'rb')
+    try:
+        return PdfReader(f)
+    except Exception:
+        f.close()
+        raise
+
+def _close_reader(reader):
+    if hasattr(reader.stream, 'close'):
+        reader.stream.close()
+
+def drop_cached_streams(reader):
+    # A reader caches every object it parses, including the data of every
+    # content stream and image copied out of it. Pooled readers keep the
+    # small objects (page tree, resources) and re-read streams when needed.
+    cache = reader.resolved_objects
+    for key in [key for key, obj in cache.items() if isinstance(obj, StreamObject)]:
+        del cache[key]
+
+reader_pool = ReaderPool(open_pooled_pdf, closer=_close_reader, trim=drop_cached_streams)
+metrics.register_cache('reader_pool', reader_pool.stats)
+
+class CompileCancelled(Exception):
+    pass
+
+def _cover_pdf(plan, use_cover_pages, cover_template):
+    if not (cover_template or use_cover_pages):
+        return None
+    with metrics.stage('cover_render'):
+        if cover_template:
+            # The table of contents lists what each run contributes.
+            entries = [(os.path.basename(path), len(indices)) for path, indices in plan]
+            return cover_from_template(cover_template, entries)
+        return render_cover()
+
+def cover_page_count(plan, use_cover_pages=False, cover_template=None):
+    """Pages the generated cover adds in front of ``plan``'s pages."""
+    if cover_template:
+        return template_page_count(cover_template, len(plan))
+    return 1 if use_cover_pages else 0
+
+@contextmanager
+def _open_source(path, pooled=True):
+    if pooled:
+        with reader_pool.open(path) as reader:
+            yield reader
+    else:
+        # Streaming compiles keep at most one source parsed at a time.
+        with metrics.stage('parse'):
+            reader = open_pdf(path)
+        metrics.count('bytes_read', os.path.getsize(path))
+        yield reader
+
+class _MeteredFile(io.RawIOBase):
+    """Counts the bytes written to ``f`` and the time spent writing them.
+
+    Used under an ``io.BufferedWriter``: PyPDF2 issues a write per token,
+    so only the buffer's block flushes reach (and are timed by) this class.
+    """
+
+    def __init__(self, f):
+        super().__init__()
+        self._f = f
+        try:
+            self._start = f.tell()
+        except (AttributeError, OSError):
+            self._start = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        start = time.perf_counter()
+        self._f.write(data)
+        self.seconds += time.perf_counter() - start
+        self.bytes += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._start + self.bytes
+
+class _PdfWriter(PdfWriter):
+    # PdfWriter.append adds a document's pages one by one through add_page;
+    # page_done, while set, is called after each of them.
+    page_done = None
+
+    def add_page(self, page, excluded_keys=()):
+        page = super().add_page(page, excluded_keys)
+        if self.page_done is not None:
+            self.page_done()
+        return page
+
+@contextmanager
+def _output_writer(output_file, streaming=False, dedup=False, splice_index=None):
+    if hasattr(output_file, "write"):
+        f, close_file = output_file, False
+    else:
+        f, close_file = open(output_file, "wb"), True
+    metered = _MeteredFile(f)
+    buffered = io.BufferedWriter(metered, buffer_size=STREAM_CHUNK_BYTES)
+    try:
+        # "serialize" includes the time spent in file writes, which is also
+        # reported on its own as "write".
+        if streaming:
+            writer = StreamingPdfWriter(buffered, dedup=dedup, splice_index=splice_index)
+            yield writer
+            with metrics.stage('serialize'):
+                writer.close()
         else:
-            writer.append(input_file)
+            writer = _PdfWriter()
+            yield writer
+            with metrics.stage('serialize'):
+                writer.write(buffered)
+        buffered.flush()
+    finally:
+        if close_file:
+            f.close()
+        metrics.observe('write', metered.seconds)
+        metrics.count('bytes_written', metered.bytes)
 
-    with open(output_file, "wb") as f:
-        writer.write(f)
+def _append_run(writer, reader, indices, page_done=None):
+    whole_file = len(indices) == tree_page_count(reader) and list(indices) == list(range(len(indices)))
+    if isinstance(writer, StreamingPdfWriter):
+        writer.append(reader, None if whole_file else indices, page_done)
+    elif whole_file:
+        writer.page_done = page_done
+        try:
+            writer.append(reader)
+        finally:
+            writer.page_done = None
+    else:
+        for index in indices:
+            writer.add_page(page_at(reader, index))
+            if page_done is not None:
+                page_done()
 
-    if use_cover_pages:
-        os.remove(cover_page_path)
+def _append_runs(writer, runs, progress=None, cancel_event=None, pooled=True):
+    runs_done = 0
+    last_report = time.monotonic()
 
-def parse_page_range(page_range_str, max_pages):
-    pages = set()
-    ranges = page_range_str.split(',')
-    for r in ranges:
-        if '-' in r:
-            start, end = map(int, r.split('-'))
-            pages.update(range(start, min(end + 1, max_pages + 1)))
+    def page_done():
+        # Called after every page copied: cancellation is noticed mid-run
+        # and progress is reported at most every PROGRESS_INTERVAL.
+        nonlocal last_report
+        if cancel_event is not None and cancel_event.is_set():
+            raise CompileCancelled("Compilation cancelled")
+        if progress is not None and time.monotonic() - last_report >= PROGRESS_INTERVAL:
+            last_report = time.monotonic()
+            progress(len(writer.pages), runs_done, len(runs))
+
+    appended = set()
+    for path, indices in runs:
+        if cancel_event is not None and cancel_event.is_set():
+            raise CompileCancelled("Compilation cancelled")
+        # Each source is parsed once (or not at all on a pool hit) and only
+        # the selected pages are looked up in its page tree. PdfWriter maps a
+        # reader's pages once per writer, so a source appended again gets its
+        # own reader; otherwise its outline would point at the first copy.
+        fresh = not isinstance(writer, StreamingPdfWriter) and path in appended
+        appended.add(path)
+        with _open_source(path, pooled and not fresh) as reader, \
+                metrics.stage('page_copy', file=os.path.basename(path), pages=len(indices)):
+            _append_run(writer, reader, indices, page_done)
+        runs_done += 1
+        if progress is not None:
+            last_report = time.monotonic()
+            progress(len(writer.pages), runs_done, len(runs))
+
+def _writer_stats(writer):
+    if isinstance(writer, StreamingPdfWriter):
+        return writer.stats()
+    return {'pages': len(writer.pages)}
+
+def _compile_chunk(runs, chunk_path, dedup=False):
+    # Runs in a worker process: its stages go back to the parent's trace.
+    # The chunk and its splice index let the parent copy it without parsing.
+    trace = metrics.Trace()
+    with metrics.tracing(trace):
+        with _output_writer(chunk_path, True, dedup, splice_index=chunk_path + ".splice") as writer:
+            _append_runs(writer, runs, pooled=False)
+    stats = _writer_stats(writer)
+    stats['trace'] = trace.to_dict()
+    return stats
+
+def _split_chunks(items, weights, num_chunks):
+    # Contiguous chunks of roughly equal weight so the final join keeps
+    # the input order and workers get similar amounts of work.
+    target = sum(weights) / num_chunks
+    chunks, current, current_weight = [], [], 0
+    for item, weight in zip(items, weights):
+        remaining_items = len(items) - sum(len(chunk) for chunk in chunks) - len(current)
+        remaining_chunks = num_chunks - len(chunks)
+        if current and (current_weight >= target or remaining_items < remaining_chunks):
+            chunks.append(current)
+            current, current_weight = [], 0
+        current.append(item)
+        current_weight += weight
+    chunks.append(current)
+    return chunks
+
+def _compile_parallel(writer, runs, workers, tmp_dir, progress, cancel_event, dedup):
+    chunks = _split_chunks(runs, [len(indices) for _, indices in runs], min(workers, len(runs)))
+    chunk_paths = [os.path.join(tmp_dir, f"chunk_{i:04d}.pdf") for i in range(len(chunks))]
+    chunk_stats = {'dedup_objects': 0, 'dedup_bytes_saved': 0, 'streams_copied': 0, 'stream_bytes_copied': 0}
+    trace = metrics.current_trace()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        submitted = time.perf_counter() - trace.started if trace is not None else 0.0
+        futures = [executor.submit(_compile_chunk, chunk, path, dedup)
+                   for chunk, path in zip(chunks, chunk_paths)]
+        pages_written = runs_done = 0
+        for chunk, future in zip(chunks, futures):
+            if cancel_event is not None and cancel_event.is_set():
+                for pending in futures:
+                    pending.cancel()
+                raise CompileCancelled("Compilation cancelled")
+            stats = future.result()
+            chunk_trace = stats.pop('trace')
+            if trace is not None:
+                trace.merge(chunk_trace, offset=submitted)
+            pages_written += stats['pages']
+            for key in chunk_stats:
+                chunk_stats[key] += stats.get(key, 0)
+            runs_done += len(chunk)
+            if progress is not None:
+                progress(pages_written, runs_done, len(runs))
+    # Chunk objects are copied into the output as raw bytes with their
+    # object numbers shifted; nothing is parsed again.
+    for path in chunk_paths:
+        with metrics.stage('join_chunk', file=os.path.basename(path)):
+            writer.splice(path, path + ".splice")
+    return chunk_stats
+
+def compile_pdfs(input_files, output_file, use_cover_pages=False, cover_pages=None,
+                 progress=None, cancel_event=None, workers=1, streaming=False, dedup=False,
+                 optimize_images=None, cover_template=None, trace=False, raw_copy=False):
+    """Merge ``input_files`` into ``output_file`` and return output statistics.
+
+    ``input_files`` is a list of paths or a ``CompilePlan``. A list is
+    planned with ``CompilePlan.from_files``: every page of every file,
+    except that ``cover_pages`` (e.g. "1,3-5") selects the pages taken from
+    the first file. ``progress(pages_written, runs_done, runs_total)`` is called
+    after every plan run and, while a run's pages are copied, at
+    most every ``PROGRESS_INTERVAL`` seconds.
+
+    ``output_file`` is a path or, with ``streaming=True``, anything with a
+    ``write`` method. Streaming mode serializes objects as each source is
+    copied, so peak memory is bounded by the largest input rather than the
+    size of the merged document. ``dedup=True`` (which implies streaming)
+    writes identical fonts, images and other streams once; the returned
+    stats include ``dedup_bytes_saved``.
+
+    ``workers > 1`` merges contiguous chunks of the plan in worker
+    processes with the streaming writer; their objects are then copied
+    into the output as raw bytes, in order, without being parsed again.
+    With dedup, each chunk records the content keys of its streams and the
+    join skips those an earlier chunk already wrote, as a serial compile
+    would.
+
+    ``optimize_images`` (True or a dict of ``optimize_pdf_images`` options)
+    runs the image downsampling/recompression stage on the finished file;
+    it needs ``output_file`` to be a path.
+
+    ``raw_copy=True`` (which implies streaming) guarantees that every
+    content stream, image and font of the inputs reaches the output as its
+    original encoded bytes, with its filters, and is never decoded. Dedup
+    compares encoded bytes and is allowed; image optimization re-encodes
+    and raises ``ValueError``. The stats report ``streams_copied`` and
+    ``stream_bytes_copied``.
+
+    ``use_cover_pages`` puts a generated title page first; ``cover_template``
+    (True or {"title", "date", "toc"}) generates a cover with the date and
+    a table of contents of the inputs instead. Covers are rendered in
+    memory and never written to disk.
+
+    Stage timings (parse, page copy, cover render, serialize, write) are
+    returned under ``stats['timings']['stages']`` and published to the
+    metrics registry; ``trace=True`` also returns the full per-run trace
+    as ``stats['trace']``.
+    """
+    if optimize_images and hasattr(output_file, "write"):
+        raise ValueError("Image optimization needs an output path, not a stream")
+    if optimize_images and raw_copy:
+        raise ValueError("Image optimization re-encodes images and cannot be combined with raw copy")
+    compile_trace = metrics.Trace()
+    try:
+        with metrics.tracing(compile_trace):
+            plan = input_files
+            if not isinstance(plan, CompilePlan):
+                with metrics.stage('plan'):
+                    plan = CompilePlan.from_files(input_files, cover_pages)
+            stats = _compile(plan, output_file, use_cover_pages, progress, cancel_event, workers,
+                             streaming or dedup or raw_copy, dedup, optimize_images, cover_template)
+    except CompileCancelled:
+        metrics.COMPILES.inc(status="cancelled")
+        raise
+    except Exception:
+        metrics.COMPILES.inc(status="failed")
+        raise
+    trace_data = compile_trace.to_dict()
+    metrics.record_trace(trace_data, stats['pages'])
+    stats['timings']['stages'] = trace_data['stages']
+    if trace:
+        stats['trace'] = trace_data
+    return stats
+
+def _compile(plan, output_file, use_cover_pages, progress, cancel_event, workers, streaming, dedup,
+             optimize_images, cover_template):
+    runs = list(plan)
+    chunk_stats = {}
+    merge_start = time.perf_counter()
+    cover = _cover_pdf(plan, use_cover_pages, cover_template)
+
+    parallel = workers > 1 and len(runs) > 1
+    # Parallel chunks are spliced into a streaming writer.
+    with _output_writer(output_file, streaming or parallel, dedup) as writer:
+        if cover is not None:
+            writer.append(PdfReader(BytesIO(cover)))
+
+        if parallel:
+            tmp_parent = None if hasattr(output_file, "write") else os.path.dirname(os.path.abspath(output_file))
+            tmp_dir = tempfile.mkdtemp(prefix=".chunks_", dir=tmp_parent)
+            try:
+                chunk_stats = _compile_parallel(writer, runs, workers, tmp_dir, progress, cancel_event, dedup)
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
         else:
-            page = int(r)
-            if page <= max_pages:
-                pages.add(page)
-    return sorted(pages)
+            _append_runs(writer, runs, progress, cancel_event, pooled=not streaming)
+
+    stats = _writer_stats(writer)
+    for key, value in chunk_stats.items():
+        stats[key] = stats.get(key, 0) + value
+    stats['timings'] = {'merge': time.perf_counter() - merge_start}
+    if not hasattr(output_file, "write"):
+        stats['bytes_written'] = os.path.getsize(output_file)
+    if optimize_images:
+        if cancel_event is not None and cancel_event.is_set():
+            raise CompileCancelled("Compilation cancelled")
+        options = optimize_images if isinstance(optimize_images, dict) else {}
+        optimize_start = time.perf_counter()
+        with metrics.stage('optimize_images'):
+            stats['image_optimization'] = optimize_pdf_images(output_file, **options)
+        stats['timings']['optimize_images'] = time.perf_counter() - optimize_start
+        stats['bytes_written'] = stats['image_optimization']['bytes_after']
+    return stats
+
+class PDFCompiler:
+    """Entry points used by the desktop GUI."""
+
+    @staticmethod
+    def compile_pdfs(input_files, page_selections, output_file, use_cover_pages=False, cover_pages=None,
+                     **options):
+        """Compile the GUI's per-file page selections; returns True on success.
+
+        A ``progress`` option is called as ``progress(pages_written, pages_total)``.
+        """
+        try:
+            plan = CompilePlan.from_selections(input_files, page_selections or {},
+                                               cover_pages if use_cover_pages else None)
+            report = options.pop('progress', None)
+            if report is not None:
+                # The generated cover is written before the plan's pages.
+                pages_total = plan.total_pages + cover_page_count(plan, use_cover_pages, options.get('cover_template'))
+                options['progress'] = lambda pages_written, runs_done, runs_total: report(pages_written, pages_total)
+            compile_pdfs(plan, output_file, use_cover_pages=use_cover_pages, **options)
+            return True
+        except Exception as e:
+            print(f"Error compiling PDFs: {str(e)}")
+            return False
+
+class _ChunkQueue:
+    """Write target that hands output to a consumer thread in fixed-size chunks."""
+
+    def __init__(self, chunk_size=STREAM_CHUNK_BYTES, max_chunks=STREAM_QUEUE_CHUNKS):
+        self._queue = queue.Queue(maxsize=max_chunks)
+        self._buffer = bytearray()
+        self._chunk_size = chunk_size
+        self.abandoned = threading.Event()
+
+    def _put(self, item):
+        # Blocks while the consumer is behind, but gives up once it has gone away.
+        while not self.abandoned.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def write(self, data):
+        self._buffer += data
+        if len(self._buffer) >= self._chunk_size:
+            if not self._put(bytes(self._buffer)):
+                raise CompileCancelled("Output stream closed")
+            self._buffer.clear()
+
+    def finish(self, error=None):
+        if error is None and self._buffer:
+            self._put(bytes(self._buffer))
+        self._put(error)
+
+    def get(self):
+        return self._queue.get()
+
+def iter_compiled_pdf(input_files, use_cover_pages=False, cover_pages=None, dedup=False, cover_template=None,
+                      chunk_size=STREAM_CHUNK_BYTES):
+    """Yield the merged PDF in chunks while it is being compiled.
+
+    Compilation runs in streaming mode on a background thread and nothing
+    touches the disk. Closing the generator (e.g. when an HTTP client
+    disconnects) cancels the compile. An error raised before the first
+    chunk means no output was produced.
+    """
+    out = _ChunkQueue(chunk_size)
+    cancel_event = threading.Event()
+
+    def produce():
+        try:
+            compile_pdfs(input_files, out, use_cover_pages, cover_pages, cancel_event=cancel_event,
+                         streaming=True, dedup=dedup, cover_template=cover_template)
+        except CompileCancelled:
+            return
+        except Exception as e:
+            out.finish(e)
+        else:
+            out.finish()
+
+    threading.Thread(target=produce, name="compile-stream", daemon=True).start()
+    try:
+        while True:
+            item = out.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        cancel_event.set()
+        out.abandoned.set()
+
+def _format_date(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value else "N/A"
+
+def pooled_page_count(path):
+    """Page count of ``path`` through the reader pool, so planning a compile
+    does not parse its sources a second time."""
+    with reader_pool.open(path) as reader:
+        return tree_page_count(reader)
+
+def probe_pdf(file_path):
+    """Page count and metadata read from the xref, trailer and page tree root only.
+
+    The reader comes from the reader pool, so a file that is compiled or
+    probed again is not re-parsed. Pooled readers are lazy: only the bytes
+    of the objects actually touched are read.
+    """
+    file_size = os.path.getsize(file_path)
+    with reader_pool.open(file_path) as reader:
+        num_pages = tree_page_count(reader)
+        info = reader.metadata
+        created, modified = (info.creation_date, info.modification_date) if info else (None, None)
+    return {
+        'filename': os.path.basename(file_path),
+        'num_pages': num_pages,
+        'file_size_bytes': file_size,
+        'created_date': _format_date(created),
+        'modified_date': _format_date(modified),
+    }
 
 def get_pdf_info(file_path):
     try:
-        with open(file_path, 'rb') as file:
-            pdf = PdfReader(file)
-            info = pdf.metadata
-            num_pages = len(pdf.pages)
-            file_size = os.path.getsize(file_path)
-            
-            return {
-                'filename': os.path.basename(file_path),
-                'num_pages': num_pages,
-                'file_size': f"{file_size / 1024:.2f} KB",
-                'created_date': info.creation_date.strftime('%Y-%m-%d %H:%M:%S') if info.creation_date else "N/A",
-                'modified_date': info.modification_date.strftime('%Y-%m-%d %H:%M:%S') if info.modification_date else "N/A"
-            }
+        info = probe_pdf(file_path)
+        return {
+            'filename': info['filename'],
+            'num_pages': info['num_pages'],
+            'file_size': f"{info['file_size_bytes'] / 1024:.2f} KB",
+            'created_date': info['created_date'],
+            'modified_date': info['modified_date'],
+        }
     except Exception as e:
+        metrics.record_error('pdf_info')
         print(f"Error getting PDF info: {str(e)}")
         return None
 
 # Explicitly export the functions
-__all__ = ['compile_pdfs', 'get_pdf_info', 'parse_page_range']
+__all__ = ['compile_pdfs', 'iter_compiled_pdf', 'CompileCancelled', 'CompilePlan', 'PDFCompiler', 'get_pdf_info', 'probe_pdf', 'pooled_page_count', 'tree_page_count', 'parse_page_range', 'ReaderPool', 'reader_pool', 'open_pdf', 'open_pooled_pdf', 'cover_page_count']
@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pdf_compiler import reader_pool
+import metrics
+
+PDF_INDEX_PATH = os.environ.get("PDF_INDEX_PATH", os.path.join(".cache", "pdf_index.sqlite3"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pdf_metadata (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    num_pages INTEGER NOT NULL,
+    page_sizes TEXT NOT NULL,
+    created_date TEXT NOT NULL,
+    modified_date TEXT NOT NULL,
+    encrypted INTEGER NOT NULL,
+    has_outline INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pdf_metadata_hash ON pdf_metadata (content_hash);
+"""
+
+COLUMNS = ('num_pages', 'page_sizes', 'created_date', 'modified_date', 'encrypted', 'has_outline')
+
+def file_hash(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _format_date(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value else "N/A"
+
+def read_pdf_metadata(path):
+    """Parse ``path`` once and return the fields stored in the index."""
+    with reader_pool.open(path) as reader:
+        encrypted = reader.is_encrypted
+        info = reader.metadata
+        # Consecutive pages of the same size are stored as [width, height, count] runs.
+        page_sizes = []
+        for page in reader.pages:
+            if '/MediaBox' in page:
+                size = [round(float(page.mediabox.width), 2), round(float(page.mediabox.height), 2)]
+            else:
+                size = [None, None]
+            if page_sizes and page_sizes[-1][:2] == size:
+                page_sizes[-1][2] += 1
+            else:
+                page_sizes.append(size + [1])
+        return {
+            'num_pages': len(reader.pages),
+            'page_sizes': json.dumps(page_sizes),
+            'created_date': _format_date(info.creation_date if info else None),
+            'modified_date': _format_date(info.modification_date if info else None),
+            'encrypted': int(encrypted),
+            'has_outline': int('/Outlines' in reader.trailer['/Root']),
+        }
+
+def _index_worker(path):
+    return read_pdf_metadata(path), file_hash(path)
+
+class PdfIndex:
+    """SQLite-backed metadata store so listing files does not re-parse them.
+
+    A row is reused while the file's size and mtime are unchanged. When
+    they differ, the content hash decides whether the file really changed
+    (e.g. it was only touched or copied) before falling back to a parse.
+    """
+
+    def __init__(self, db_path=PDF_INDEX_PATH):
+        self.db_path = db_path
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+        self.hits = 0
+        self.parses = 0
+
+    def _row(self, path):
+        with self._lock:
+            return self._conn.execute("SELECT * FROM pdf_metadata WHERE path = ?", (path,)).fetchone()
+
+    def _row_by_hash(self, content_hash):
+        with self._lock:
+            return self._conn.execute("SELECT * FROM pdf_metadata WHERE content_hash = ? LIMIT 1",
+                                      (content_hash,)).fetchone()
+
+    def _store(self, path, st, content_hash, fields):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pdf_metadata (path, size, mtime_ns, content_hash, num_pages, page_sizes, "
+                "created_date, modified_date, encrypted, has_outline, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime_ns, content_hash) + tuple(fields[c] for c in COLUMNS) + (time.time(),))
+
+    def lookup(self, file_path, fields=None):
+        """Return the metadata row for ``file_path``, parsing only if the file changed."""
+        path = os.path.abspath(file_path)
+        st = os.stat(path)
+        row = self._row(path)
+        if row is not None and row['size'] == st.st_size and row['mtime_ns'] == st.st_mtime_ns:
+            self.hits += 1
+            return row
+        if fields is None:
+            content_hash = file_hash(path)
+            known = row if row is not None and row['content_hash'] == content_hash else self._row_by_hash(content_hash)
+            if known is not None:
+                self.hits += 1
+                fields = {c: known[c] for c in COLUMNS}
+            else:
+                self.parses += 1
+                fields = read_pdf_metadata(path)
+        else:
+            content_hash = fields.pop('content_hash')
+        self._store(path, st, content_hash, fields)
+        return self._row(path)
+
+    def get_info(self, file_path):
+        """Same shape as ``get_pdf_info`` plus page sizes, encryption and outline flags."""
+        try:
+            row = self.lookup(file_path)
+        except Exception as e:
+            metrics.record_error('pdf_info')
+            print(f"Error getting PDF info: {str(e)}")
+            return None
+        return {
+            'filename': os.path.basename(file_path),
+            'num_pages': row['num_pages'],
+            'file_size': f"{row['size'] / 1024:.2f} KB",
+            'created_date': row['created_date'],
+            'modified_date': row['modified_date'],
+            'page_sizes': json.loads(row['page_sizes']),
+            'encrypted': bool(row['encrypted']),
+            'has_outline': bool(row['has_outline']),
+            'content_hash': row['content_hash'],
+        }
+
+    def index_paths(self, paths, workers=None):
+        """Bulk-fill the index; only new or changed files are parsed, in a process pool."""
+        stale = []
+        for path in paths:
+            path = os.path.abspath(path)
+            st = os.stat(path)
+            row = self._row(path)
+            if row is None or row['size'] != st.st_size or row['mtime_ns'] != st.st_mtime_ns:
+                stale.append(path)
+        failed = {}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {path: executor.submit(_index_worker, path) for path in stale}
+            for path, future in futures.items():
+                try:
+                    fields, content_hash = future.result()
+                except Exception as e:
+                    failed[path] = str(e)
+                    continue
+                fields['content_hash'] = content_hash
+                self.parses += 1
+                self.lookup(path, fields)
+        return len(stale) - len(failed), failed
+
+    def prune(self):
+        """Drop rows for files that no longer exist."""
+        with self._lock:
+            paths = [row[0] for row in self._conn.execute("SELECT path FROM pdf_metadata")]
+        missing = [path for path in paths if not os.path.exists(path)]
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM pdf_metadata WHERE path = ?", [(path,) for path in missing])
+        return len(missing)
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+def get_index():
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = PdfIndex()
+            index = _default_index
+            metrics.register_cache('pdf_index', lambda: {'hits': index.hits, 'misses': index.parses})
+        return _default_index
+
+def cached_pdf_info(file_path):
+    return get_index().get_info(file_path)
+
+__all__ = ['PdfIndex', 'get_index', 'cached_pdf_info', 'read_pdf_metadata', 'file_hash']
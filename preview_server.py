@@ -0,0 +1,422 @@
+"""Production server: an ASGI front end with a pool of renderer processes.
+
+Preview requests are answered on the event loop and rendered in renderer
+processes that each keep their own fitz documents and thumbnail cache
+open. A document is always sent to the same renderer, unless that one is
+backed up, so its pages are rendered from an already open document.
+Every other route is the Flask app from ``main``, run on a thread pool.
+
+Run with ``python preview_server.py --port 8080`` (needs ``uvicorn``) or
+under any ASGI server as ``preview_server:app``; serve one front-end
+process, since jobs and workspaces live in its memory.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import weakref
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from email.utils import format_datetime
+from urllib.parse import parse_qs, unquote
+
+import metrics
+from page_ranges import PageRangeSet, PageRangeError
+from thumbnails import (thumbnail_key, last_modified, page_count, cached_preview, preview_batch, batch_etag, MIMETYPES,
+                        thumbnail_cache, document_pool)
+from workspaces import workspace_store
+
+PREVIEW_WORKERS = int(os.environ.get("PREVIEW_WORKERS", "0")) or os.cpu_count() or 1
+# Previews being rendered or waiting for a renderer at once; later ones wait
+PREVIEW_CONCURRENCY = int(os.environ.get("PREVIEW_CONCURRENCY", "64"))
+# Seconds a preview request may wait and render before it gets a 504
+PREVIEW_TIMEOUT = float(os.environ.get("PREVIEW_TIMEOUT", "30"))
+# Requests queued on a document's renderer before its work goes to the least busy one
+PREVIEW_SPILL = int(os.environ.get("PREVIEW_SPILL", "4"))
+# Threads running the Flask routes
+BRIDGE_THREADS = int(os.environ.get("BRIDGE_THREADS", "16"))
+# Documents whose page count the front end remembers
+PAGE_COUNT_CACHE_SIZE = 1024
+# Request bodies larger than this are spooled to disk before Flask reads them
+BODY_SPOOL_BYTES = 1024 * 1024
+
+PREVIEW_PREFIX = "/preview_pdf/"
+
+def _in_renderer(func, *args):
+    # Runs in a renderer process, whose own registry is never scraped: its
+    # stage timings and cache stats go back to the front end with the result.
+    trace = metrics.Trace()
+    with metrics.tracing(trace):
+        result = func(*args)
+    return result, trace.to_dict(), {'thumbnails': thumbnail_cache.stats(), 'document_pool': document_pool.stats()}
+
+def _init_renderer(disk_bytes):
+    # Renderers share one cache directory; each evicts down to its share of
+    # the disk budget, so together they stay within THUMBNAIL_DISK_BYTES.
+    thumbnail_cache.disk_bytes = disk_bytes
+
+class RendererPool:
+    """Renderer processes with work routed by document path.
+
+    Each renderer is a single-process executor, so its fitz documents and
+    thumbnail cache stay warm for the documents routed to it. Renderers
+    are started with "spawn": forking the threaded front end could copy
+    held locks into the child. They share the thumbnail cache directory,
+    and each gets an equal share of its disk budget.
+
+    Render stage timings are published in this process as results come
+    back, and the latest cache stats of each renderer are kept for
+    ``cache_stats``.
+    """
+
+    def __init__(self, workers=PREVIEW_WORKERS, spill=PREVIEW_SPILL):
+        self._context = multiprocessing.get_context("spawn")
+        self._disk_bytes = max(1, thumbnail_cache.disk_bytes // workers)
+        self._executors = [self._new_executor() for _ in range(workers)]
+        self._inflight = [0] * workers
+        self._cache_stats = [{} for _ in range(workers)]
+        self.spill = spill
+        _renderer_pools.add(self)
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=1, mp_context=self._context,
+                                   initializer=_init_renderer, initargs=(self._disk_bytes,))
+
+    def route(self, path):
+        home = zlib.crc32(path.encode()) % len(self._executors)
+        if self._inflight[home] < self.spill:
+            return home
+        least = min(range(len(self._executors)), key=self._inflight.__getitem__)
+        return least if self._inflight[least] < self._inflight[home] else home
+
+    async def run(self, path, func, *args):
+        index = self.route(path)
+        executor = self._executors[index]
+        self._inflight[index] += 1
+        try:
+            result, trace, caches = await asyncio.wrap_future(executor.submit(_in_renderer, func, *args))
+        except BrokenProcessPool:
+            # A renderer died (e.g. on a corrupt file); start a new one for later requests.
+            if self._executors[index] is executor:
+                self._executors[index] = self._new_executor()
+                self._cache_stats[index] = {}
+            raise
+        finally:
+            self._inflight[index] -= 1
+        if self._executors[index] is executor:
+            self._cache_stats[index] = caches
+        metrics.record_spans(trace)
+        return result
+
+    def cache_stats(self, name):
+        """The ``name`` cache stats last reported by each renderer, summed."""
+        totals = {}
+        for caches in self._cache_stats:
+            for key, value in caches.get(name, {}).items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def stats(self):
+        return {'workers': len(self._executors), 'inflight': sum(self._inflight)}
+
+    def shutdown(self):
+        for executor in self._executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+_renderer_pools = weakref.WeakSet()
+
+def _renderer_cache_stats(name):
+    totals = {}
+    for pool in list(_renderer_pools):
+        for key, value in pool.cache_stats(name).items():
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+def _collect_renderers():
+    stats = [pool.stats() for pool in list(_renderer_pools)]
+    return [("preview_renderers", "gauge", "Renderer processes", {}, sum(s['workers'] for s in stats)),
+            ("preview_renders_inflight", "gauge", "Renderer calls submitted and not yet answered", {},
+             sum(s['inflight'] for s in stats))]
+
+# Previews are rendered in the renderer processes, so their caches are the
+# ones that count; this process's own thumbnail cache and document pool
+# stay empty and are summed in unchanged.
+for _name in ('thumbnails', 'document_pool'):
+    metrics.register_cache(_name, lambda name=_name: _renderer_cache_stats(name))
+metrics.registry.register_collector(_collect_renderers)
+
+def _headers(scope):
+    headers = {}
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1').lower(), value.decode('latin-1')
+        headers[name] = f"{headers[name]}, {value}" if name in headers else value
+    return headers
+
+def _cookies(header):
+    cookies = {}
+    for item in header.split(';'):
+        name, _, value = item.strip().partition('=')
+        if name:
+            cookies[name] = value
+    return cookies
+
+def _environ(scope, body, headers):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        # The whole body has been received, so it can be read to EOF.
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in headers.items():
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'content-length':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+    return environ
+
+class PreviewServer:
+    """ASGI application: previews from a ``RendererPool``, everything else from Flask."""
+
+    def __init__(self, workers=PREVIEW_WORKERS, concurrency=PREVIEW_CONCURRENCY, timeout=PREVIEW_TIMEOUT,
+                 bridge_threads=BRIDGE_THREADS):
+        self.renderers = RendererPool(workers)
+        self.timeout = timeout
+        self._concurrency = concurrency
+        self._slots = None
+        self._bridge = ThreadPoolExecutor(max_workers=bridge_threads, thread_name_prefix="wsgi")
+        self._flask = None
+        self._page_counts = {}
+
+    @property
+    def flask(self):
+        # Imported on first use: renderer processes import this module too.
+        if self._flask is None:
+            import main
+            self._flask = main
+        return self._flask
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            if scope['method'] == 'GET' and scope['path'].startswith(PREVIEW_PREFIX):
+                await self._preview(scope, send)
+            else:
+                await self._call_flask(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.flask
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.renderers.shutdown()
+                self._bridge.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _send(self, send, status, body=b"", content_type=None, headers=()):
+        raw = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        if content_type is not None:
+            raw.append((b'content-type', content_type.encode('latin-1')))
+        raw.append((b'content-length', str(len(body)).encode()))
+        await send({'type': 'http.response.start', 'status': status, 'headers': raw})
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    def _json(message, status=200):
+        return status, json.dumps({'message': message, 'success': False}, separators=(',', ':')).encode(), 'application/json'
+
+    def _workspace(self, headers):
+        # Same identities as main._workspace: X-API-Token, or the workspace id
+        # in Flask's signed session cookie. Previews never create a workspace.
+        token = headers.get('x-api-token')
+        if not token:
+            app = self.flask.app
+            cookie = _cookies(headers.get('cookie', '')).get(app.config['SESSION_COOKIE_NAME'])
+            serializer = app.session_interface.get_signing_serializer(app)
+            try:
+                token = serializer.loads(cookie).get('workspace') if cookie else None
+            except Exception:
+                token = None
+        return workspace_store.get(workspace_store.key_for(token)) if token else None
+
+    async def _preview(self, scope, send):
+        # The response is only sent once it is complete, so a timeout can
+        # never follow a response that has already started.
+        start = time.perf_counter()
+        try:
+            await self._send(send, *await self._preview_response(scope))
+        finally:
+            metrics.observe('preview_request', time.perf_counter() - start)
+
+    async def _preview_response(self, scope):
+        """(status, body, content type, headers) for a preview request."""
+        headers = _headers(scope)
+        pdf_name = unquote(scope['path'][len(PREVIEW_PREFIX):])
+        workspace = self._workspace(headers)
+        if workspace is None or pdf_name not in workspace:
+            return self._json("PDF not found")
+        args = {name: values[-1] for name, values in parse_qs(scope['query_string'].decode('latin-1')).items()}
+        fmt = args.get('format', 'png')
+        try:
+            width = int(args['width']) if 'width' in args else None
+        except ValueError:
+            width = None
+        if fmt not in ('png', 'jpeg', 'webp'):
+            return self._json(f"Unsupported format: {fmt}", 400)
+        max_width = self.flask.PREVIEW_MAX_WIDTH
+        if width is not None and not 0 < width <= max_width:
+            return self._json(f"Width must be between 1 and {max_width}", 400)
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._concurrency)
+        deadline = asyncio.get_running_loop().time() + self.timeout
+        try:
+            return await self._render(headers, pdf_name, args, fmt, width, deadline)
+        except asyncio.TimeoutError:
+            metrics.record_error('preview_timeout')
+            return self._json(f"Preview not ready within {self.timeout:g} seconds", 504)
+        except Exception as e:
+            metrics.record_error('preview')
+            return self._json(f"Error generating preview: {str(e)}")
+
+    async def _run_renderer(self, deadline, path, func, *args):
+        # Only waiting for a slot and rendering count toward the timeout. A
+        # render that has started still finishes and is cached, so a retry
+        # is usually answered from the cache.
+        async def run():
+            async with self._slots:
+                return await self.renderers.run(path, func, *args)
+        return await asyncio.wait_for(run(), max(deadline - asyncio.get_running_loop().time(), 0))
+
+    async def _render(self, headers, pdf_name, args, fmt, width, deadline):
+        path = os.path.abspath(pdf_name)
+        if 'pages' not in args:
+            key = thumbnail_key(pdf_name, 0, fmt=fmt, width=width)
+            if self._not_modified(headers, key.etag):
+                return 304, b"", None, self._cache_headers(key.etag, key)
+            data = await self._run_renderer(deadline, path, cached_preview, key)
+            return 200, data, MIMETYPES[fmt], self._cache_headers(key.etag, key)
+
+        count = await self._page_count(path, pdf_name, deadline)
+        try:
+            pages = PageRangeSet.parse(args['pages'], count)
+        except PageRangeError as e:
+            return self._json(f"Invalid page range: {str(e)}", 400)
+        max_pages = self.flask.PREVIEW_MAX_PAGES
+        if not pages or len(pages) > max_pages:
+            return self._json(f"Request between 1 and {max_pages} existing pages", 400)
+        keys = [thumbnail_key(pdf_name, page - 1, fmt=fmt, width=width) for page in pages]
+        etag = batch_etag(keys)
+        if self._not_modified(headers, etag):
+            return 304, b"", None, self._cache_headers(etag, keys[0])
+        content_type, extra, body = await self._run_renderer(deadline, path, preview_batch, keys, fmt,
+                                                             args.get('layout', 'multipart'))
+        return 200, body, content_type, self._cache_headers(etag, keys[0]) + list(extra.items())
+
+    async def _page_count(self, path, pdf_name, deadline):
+        # Kept here so page selections do not queue behind renders just to be parsed.
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        if key not in self._page_counts:
+            count = await self._run_renderer(deadline, path, page_count, pdf_name)
+            if len(self._page_counts) >= PAGE_COUNT_CACHE_SIZE:
+                self._page_counts.clear()
+            self._page_counts[key] = count
+        return self._page_counts[key]
+
+    @staticmethod
+    def _not_modified(headers, etag):
+        tags = [tag.strip().removeprefix('W/') for tag in headers.get('if-none-match', '').split(',')]
+        return f'"{etag}"' in tags or '*' in tags
+
+    @staticmethod
+    def _cache_headers(etag, key):
+        return [('etag', f'"{etag}"'), ('last-modified', format_datetime(last_modified(key), usegmt=True)),
+                ('cache-control', 'no-cache')]
+
+    async def _call_flask(self, scope, receive, send):
+        body = tempfile.SpooledTemporaryFile(max_size=BODY_SPOOL_BYTES)
+        more = True
+        while more:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return
+            body.write(message.get('body', b''))
+            more = message.get('more_body', False)
+        body.seek(0)
+        environ = _environ(scope, body, _headers(scope))
+        loop = asyncio.get_running_loop()
+
+        def respond():
+            # Runs on a bridge thread; the response goes back through the loop
+            # chunk by chunk, so streamed compiles are not buffered.
+            response = {}
+
+            def start_response(status, response_headers, exc_info=None):
+                response['start'] = {'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                                     'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                                 for name, value in response_headers]}
+
+            def forward(message):
+                asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+            result = self.flask.app(environ, start_response)
+            try:
+                for chunk in result:
+                    if chunk:
+                        if 'start' in response:
+                            forward(response.pop('start'))
+                        forward({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                if 'start' in response:
+                    forward(response.pop('start'))
+                forward({'type': 'http.response.body', 'body': b''})
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+                body.close()
+
+        await loop.run_in_executor(self._bridge, respond)
+
+app = PreviewServer()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the web app with a renderer process pool")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    try:
+        import uvicorn
+    except ImportError:
+        print("The preview server runs on uvicorn: pip install uvicorn", file=sys.stderr)
+        return 1
+    uvicorn.run(app, host=args.host, port=args.port)
+    return 0
+
+__all__ = ['PreviewServer', 'RendererPool', 'app']
+
+if __name__ == "__main__":
+    sys.exit(main())
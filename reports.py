@@ -0,0 +1,24 @@
+import json
+
+REPORTS_FILE = 'reports.json'
+
+class Report:
+    def __init__(self, name, file_paths, page_selections, use_cover_pages=False, cover_pages=None):
+        self.name = name
+        self.file_paths = file_paths
+        self.page_selections = page_selections
+        self.use_cover_pages = use_cover_pages
+        self.cover_pages = cover_pages
+
+def load_reports(path=REPORTS_FILE):
+    with open(path, 'r') as f:
+        return [Report(**data) for data in json.load(f)]
+
+def save_reports(reports, path=REPORTS_FILE):
+    with open(path, 'w') as f:
+        json.dump([report.__dict__ for report in reports], f)
+
+def find_report(reports, name):
+    return next((report for report in reports if report.name == name), None)
+
+__all__ = ['Report', 'load_reports', 'save_reports', 'find_report', 'REPORTS_FILE']
@@ -0,0 +1,254 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from thumbnails import document_pool
+
+SEARCH_INDEX_PATH = os.environ.get("SEARCH_INDEX_PATH", os.path.join(".cache", "search_index.sqlite3"))
+# Pages extracted per process-pool task; large files are split across workers
+SEARCH_BATCH_PAGES = int(os.environ.get("SEARCH_BATCH_PAGES", "200"))
+SEARCH_WORKERS = int(os.environ.get("SEARCH_WORKERS", "0")) or None
+SEARCH_MAX_RESULTS = 200
+
+# FTS rowids are (document id << PAGE_BITS) | page, so a document's pages
+# are one contiguous rowid range that can be replaced without a table scan.
+PAGE_BITS = 20
+MAX_PAGES = 1 << PAGE_BITS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    num_pages INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS page_text USING fts5(text, tokenize='unicode61 remove_diacritics 2');
+"""
+
+_TERM = re.compile(r'"([^"]*)"|(\S+)')
+
+def fts_query(text):
+    """Turn free text into an FTS5 query: every word or "quoted phrase" must match.
+
+    Terms are quoted so FTS operators and punctuation in user input are taken
+    literally; a trailing ``*`` keeps its prefix-match meaning.
+    """
+    terms = []
+    for phrase, word in _TERM.findall(text or ""):
+        term = phrase if phrase else word
+        prefix = not phrase and term.endswith('*')
+        term = term.rstrip('*') if prefix else term
+        if term.strip():
+            terms.append('"' + term.replace('"', '""') + '"' + ('*' if prefix else ''))
+    return " ".join(terms)
+
+def extract_pages(path, start, stop):
+    """Text of pages ``start`` to ``stop`` (0-based, exclusive) of ``path``."""
+    with document_pool.open(path) as doc:
+        return [doc[i].get_text() for i in range(start, min(stop, len(doc)))]
+
+def _count_pages(path):
+    with document_pool.open(path) as doc:
+        return len(doc)
+
+class SearchIndex:
+    """SQLite FTS5 index of the text of every page of the loaded PDFs.
+
+    Text is extracted with PyMuPDF in a process pool, in batches of
+    ``SEARCH_BATCH_PAGES`` pages so one large file uses every worker. A
+    file is re-extracted only when its size or mtime changed. ``schedule``
+    queues files for a background indexer so requests never wait on it.
+    """
+
+    def __init__(self, db_path=SEARCH_INDEX_PATH, workers=SEARCH_WORKERS, batch_pages=SEARCH_BATCH_PAGES):
+        self.db_path = db_path
+        self.workers = workers
+        self.batch_pages = batch_pages
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+        self._background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search-index")
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self.pages_indexed = 0
+
+    def _document(self, path):
+        with self._lock:
+            return self._conn.execute("SELECT * FROM documents WHERE path = ?", (path,)).fetchone()
+
+    def is_current(self, path):
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        row = self._document(path)
+        return row is not None and row['size'] == st.st_size and row['mtime_ns'] == st.st_mtime_ns
+
+    def stale_paths(self, paths):
+        return [os.path.abspath(path) for path in paths if os.path.exists(path) and not self.is_current(path)]
+
+    def _store(self, path, st, pages):
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT id FROM documents WHERE path = ?", (path,)).fetchone()
+            if row is not None:
+                doc_id = row['id']
+                self._conn.execute("DELETE FROM page_text WHERE rowid BETWEEN ? AND ?",
+                                   (doc_id << PAGE_BITS, ((doc_id + 1) << PAGE_BITS) - 1))
+                self._conn.execute("UPDATE documents SET size = ?, mtime_ns = ?, num_pages = ?, indexed_at = ? "
+                                   "WHERE id = ?", (st.st_size, st.st_mtime_ns, len(pages), time.time(), doc_id))
+            else:
+                doc_id = self._conn.execute(
+                    "INSERT INTO documents (path, size, mtime_ns, num_pages, indexed_at) VALUES (?, ?, ?, ?, ?)",
+                    (path, st.st_size, st.st_mtime_ns, len(pages), time.time())).lastrowid
+            self._conn.executemany("INSERT INTO page_text (rowid, text) VALUES (?, ?)",
+                                   (((doc_id << PAGE_BITS) | i, text) for i, text in enumerate(pages) if text.strip()))
+        self.pages_indexed += len(pages)
+
+    def index_paths(self, paths, workers=None):
+        """Extract and store the text of new or changed files; returns (indexed, failed)."""
+        stale = self.stale_paths(paths)
+        if not stale:
+            return 0, {}
+        failed = {}
+        with ProcessPoolExecutor(max_workers=workers or self.workers) as executor:
+            counts = {path: executor.submit(_count_pages, path) for path in stale}
+            batches = {}
+            for path, future in counts.items():
+                try:
+                    num_pages = future.result()
+                except Exception as e:
+                    failed[path] = str(e)
+                    continue
+                if num_pages > MAX_PAGES:
+                    failed[path] = f"More than {MAX_PAGES} pages"
+                    continue
+                # Stat before extracting so a file changed meanwhile is picked up next time.
+                batches[path] = (os.stat(path), [executor.submit(extract_pages, path, start, start + self.batch_pages)
+                                                 for start in range(0, num_pages, self.batch_pages)])
+            for path, (st, futures) in batches.items():
+                try:
+                    pages = [text for future in futures for text in future.result()]
+                except Exception as e:
+                    failed[path] = str(e)
+                    continue
+                self._store(path, st, pages)
+        for path, error in failed.items():
+            print(f"Error indexing {path}: {error}")
+        return len(stale) - len(failed), failed
+
+    def schedule(self, paths):
+        """Index ``paths`` in the background; returns the files still waiting to be indexed."""
+        paths = self.stale_paths(paths)
+        with self._pending_lock:
+            new = [path for path in paths if path not in self._pending]
+            self._pending.update(new)
+        if new:
+            self._background.submit(self._index_pending, new)
+        return self.pending(paths)
+
+    def _index_pending(self, paths):
+        try:
+            self.index_paths(paths)
+        except Exception as e:
+            print(f"Error indexing PDFs: {str(e)}")
+        finally:
+            with self._pending_lock:
+                self._pending.difference_update(paths)
+
+    def pending(self, paths=None):
+        with self._pending_lock:
+            if paths is None:
+                return sorted(self._pending)
+            return [path for path in paths if path in self._pending]
+
+    def _document_ids(self, paths):
+        with self._lock:
+            if paths is None:
+                return [(row[0], row[1]) for row in self._conn.execute("SELECT id, path FROM documents ORDER BY path")]
+            ids = []
+            for path in paths:
+                row = self._conn.execute("SELECT id, path FROM documents WHERE path = ?", (os.path.abspath(path),)).fetchone()
+                if row is not None:
+                    ids.append((row[0], row[1]))
+            return ids
+
+    def search(self, query, paths=None, limit=50, order='page'):
+        """(file, page, snippet) hits for ``query``; pages are 1-based.
+
+        ``paths`` restricts the search to those files. With ``order='page'``
+        hits come file by file in the order of ``paths`` (or by path) and page
+        by page, reading each file's rowid range and stopping at ``limit``;
+        ``order='rank'`` sorts every match by BM25 relevance, which costs time
+        proportional to the number of matching pages. Snippets mark the
+        matched terms with ``[`` and ``]``.
+        """
+        match = fts_query(query)
+        if not match:
+            return []
+        limit = min(limit, SEARCH_MAX_RESULTS)
+        documents = self._document_ids(paths)
+        select = "SELECT rowid, snippet(page_text, 0, '[', ']', '…', 12) AS snippet FROM page_text WHERE page_text MATCH ?"
+        hits = []
+        with self._lock:
+            if order == 'rank':
+                paths_by_id = dict(documents)
+                sql = select
+                params = [match]
+                if paths is not None:
+                    if not documents:
+                        return []
+                    sql += " AND (rowid >> ?) IN (%s)" % ",".join("?" * len(documents))
+                    params += [PAGE_BITS] + list(paths_by_id)
+                rows = self._conn.execute(sql + " ORDER BY rank LIMIT ?", params + [limit]).fetchall()
+                hits = [(paths_by_id.get(row['rowid'] >> PAGE_BITS), row) for row in rows]
+            elif order == 'page':
+                for doc_id, path in documents:
+                    rows = self._conn.execute(select + " AND rowid BETWEEN ? AND ? ORDER BY rowid LIMIT ?",
+                                              (match, doc_id << PAGE_BITS, ((doc_id + 1) << PAGE_BITS) - 1,
+                                               limit - len(hits))).fetchall()
+                    hits.extend((path, row) for row in rows)
+                    if len(hits) >= limit:
+                        break
+            else:
+                raise ValueError(f"Unknown search order: {order}")
+        return [{'file': path, 'page': (row['rowid'] & (MAX_PAGES - 1)) + 1, 'snippet': row['snippet']}
+                for path, row in hits if path is not None]
+
+    def prune(self):
+        """Drop documents whose files no longer exist."""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, path FROM documents").fetchall()
+        missing = [row['id'] for row in rows if not os.path.exists(row['path'])]
+        with self._lock, self._conn:
+            for doc_id in missing:
+                self._conn.execute("DELETE FROM page_text WHERE rowid BETWEEN ? AND ?",
+                                   (doc_id << PAGE_BITS, ((doc_id + 1) << PAGE_BITS) - 1))
+                self._conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+        return len(missing)
+
+    def stats(self):
+        with self._lock:
+            documents, pages = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(num_pages), 0) FROM documents").fetchone()
+        return {'documents': documents, 'pages': pages, 'pending': len(self.pending())}
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+def get_search_index():
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = SearchIndex()
+        return _default_index
+
+__all__ = ['SearchIndex', 'get_search_index', 'fts_query', 'extract_pages']
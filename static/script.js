@@ -192,13 +192,32 @@ compilePdfButton.addEventListener('click', () => {
     .then(response => response.json())
     .then(data => {
         if (data.success) {
-            alert(`PDFs compiled successfully! Output file: ${data.message}`);
+            pollCompileJob(data.jobId);
         } else {
             alert(`Error: ${data.message}`);
         }
     });
 });
 
+function pollCompileJob(jobId) {
+    fetch(`/jobs/${jobId}`)
+        .then(response => response.json())
+        .then(data => {
+            const job = data.job;
+            if (!data.success) {
+                alert(`Error: ${data.message}`);
+            } else if (job.status === 'done') {
+                alert(`PDFs compiled successfully! Output file: ${job.output_file}`);
+                window.location.href = `/jobs/${jobId}/result`;
+            } else if (job.status === 'failed' || job.status === 'cancelled') {
+                alert(`Error: compilation ${job.status}${job.error ? ` - ${job.error}` : ''}`);
+            } else {
+                console.log(`Compiling: ${job.files_done}/${job.files_total} files, ${job.pages_written}/${job.pages_total ?? '?'} pages`);
+                setTimeout(() => pollCompileJob(jobId), 1000);
+            }
+        });
+}
+
 selectOutputFolderButton.addEventListener('click', () => {
     alert('Output folder selection is not implemented in this prototype. Files are saved in the "output" folder.');
 });
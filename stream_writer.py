@@ -0,0 +1,518 @@
+import hashlib
+import mmap
+from array import array
+from collections import deque
+from io import BytesIO
+from PyPDF2.generic import (
+    ArrayObject,
+    BooleanObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NullObject,
+    NumberObject,
+    StreamObject,
+    TextStringObject,
+    read_object,
+)
+from page_tree import page_at
+
+PDF_HEADER = b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n"
+
+# Keys that tie a page to its source document's structure; the page is
+# re-parented under our own page tree instead.
+_PAGE_EXCLUDED_KEYS = ("/Parent", "/StructParents", "/B")
+
+# How far a stream's dictionary references are followed when hashing it
+# for deduplication (e.g. image -> /SMask -> /ColorSpace -> ICC profile).
+_DEDUP_MAX_DEPTH = 8
+
+SPLICE_INDEX_MAGIC = b"%PDF-SPLICE-1\n"
+
+def _forget(obj):
+    # Drop a parsed object from its source reader's cache, so the data of a
+    # stream that has been written out is not kept until the run ends.
+    ref = obj.indirect_reference
+    if ref is not None and ref.pdf is not None:
+        ref.pdf.resolved_objects.pop((ref.generation, ref.idnum), None)
+
+class _CountingStream:
+    def __init__(self, stream):
+        self._stream = stream
+        self.offset = 0
+        # (offset, object number) of every reference written, while a
+        # splice index is being recorded.
+        self.refs = None
+
+    def write(self, data):
+        self._stream.write(data)
+        self.offset += len(data)
+
+class _Reference(IndirectObject):
+    # A reference to an output object; notes where it was written so that
+    # splice() can renumber it without parsing.
+    def __init__(self, num):
+        super().__init__(num, 0, None)
+
+    def write_to_stream(self, stream, encryption_key=None):
+        refs = getattr(stream, "refs", None)
+        if refs is not None:
+            refs.extend((stream.offset, self.idnum))
+        stream.write(b"%d 0 R" % self.idnum)
+
+def _renumbered(obj, renumber):
+    if isinstance(obj, IndirectObject):
+        return _Reference(renumber(obj.idnum))
+    if isinstance(obj, DictionaryObject):
+        return DictionaryObject({key: _renumbered(value, renumber) for key, value in obj.items()})
+    if isinstance(obj, ArrayObject):
+        return ArrayObject(_renumbered(item, renumber) for item in obj)
+    return obj
+
+def _outline_array(entries):
+    return ArrayObject(ArrayObject([entry, _outline_array(children), BooleanObject(closed)])
+                       for entry, children, closed in entries)
+
+def _outline_entries(array_obj, renumber):
+    return [[_renumbered(entry, renumber), _outline_entries(children, renumber), closed.value]
+            for entry, children, closed in array_obj]
+
+class StreamingPdfWriter:
+    """Writes a merged PDF object by object as pages are added.
+
+    Objects reachable from each added page are serialized immediately and
+    only the xref offsets are kept, so memory does not grow with the size of
+    the output. The target only needs a ``write`` method; offsets are counted
+    here, so sockets and HTTP response streams work as well as files.
+    Stream data is copied in its encoded form and is never inflated, and
+    is dropped from the source reader's cache once written.
+
+    With ``dedup=True`` stream objects (fonts, images, form XObjects, ICC
+    profiles) are keyed by a hash of their encoded bytes and everything
+    they reference; a stream already written for an earlier source is
+    reused instead of being copied again.
+
+    Stream bytes are never decoded here: ``streams_copied`` and
+    ``stream_bytes_copied`` count what went to the output unchanged.
+
+    Outline items and named destinations of documents appended whole are
+    kept, as ``PdfWriter.append`` does; they are small and held until
+    ``close`` writes them.
+
+    With ``splice_index`` (a path), ``close`` also writes an index of where
+    each copied object and each reference in it lies in the output, and
+    with ``dedup`` the content key of each stream. Another writer's
+    ``splice`` then copies the whole document as raw bytes, only rewriting
+    object numbers, without parsing it.
+    """
+
+    def __init__(self, stream, dedup=False, splice_index=None):
+        self._out = _CountingStream(stream)
+        self._splice_index = splice_index
+        # (number, body start, body end) of every object written before close().
+        self._spans = array('q') if splice_index else None
+        if splice_index:
+            self._out.refs = array('q')
+        self._dedup = {} if dedup else None
+        # Content key of every deduplicable object written, by number, for
+        # the splice index.
+        self._keys = {} if dedup and splice_index else None
+        self.dedup_objects = 0
+        self.dedup_bytes_saved = 0
+        self.streams_copied = 0
+        self.stream_bytes_copied = 0
+        self._offsets = {}
+        self._next_num = 1
+        self._pages_num = self._reserve()
+        self._catalog_num = self._reserve()
+        self.pages = []
+        # Top-level outline items as [item dict, children, closed] and named
+        # destinations by name; written by close().
+        self._outline = []
+        self._named_dests = {}
+        self._closed = False
+        self._out.write(PDF_HEADER)
+
+    def _reserve(self):
+        num = self._next_num
+        self._next_num += 1
+        return num
+
+    def _write_object(self, num, obj):
+        self._offsets[num] = self._out.offset
+        self._out.write(b"%d 0 obj\n" % num)
+        start = self._out.offset
+        obj.write_to_stream(self._out, None)
+        if self._spans is not None:
+            self._spans.extend((num, start, self._out.offset))
+        self._out.write(b"\nendobj\n")
+
+    def append(self, reader, pages=None, page_done=None):
+        """Copy ``pages`` (0-based indices, default all) of ``reader``.
+
+        Selected pages are looked up through the page tree, so only they
+        (and not every page of a large source) are parsed. Appending the
+        whole document also copies its outline and named destinations.
+        ``page_done()`` is called after each page is written.
+        """
+        if pages is None:
+            source_pages = list(reader.pages)
+        else:
+            source_pages = [page_at(reader, i) for i in pages]
+        self._copy_pages(source_pages, reader if pages is None else None, page_done)
+        return len(source_pages)
+
+    def add_page(self, page):
+        self._copy_pages([page])
+
+    def _content_key(self, obj, memo):
+        digest = hashlib.sha1()
+        if not self._feed_key(digest, obj, memo, 0, frozenset()):
+            return None
+        return digest.digest()
+
+    def _feed_key(self, digest, obj, memo, depth, visiting):
+        if isinstance(obj, IndirectObject):
+            key = (obj.idnum, obj.generation)
+            if key in memo:
+                if memo[key] is None:
+                    return False
+                digest.update(b"R" + memo[key])
+                return True
+            if depth >= _DEDUP_MAX_DEPTH or key in visiting:
+                return False
+            target = obj.get_object()
+            if isinstance(target, DictionaryObject) and target.get("/Type") in ("/Page", "/Pages"):
+                memo[key] = None
+                return False
+            sub = hashlib.sha1()
+            ok = self._feed_key(sub, target, memo, depth + 1, visiting | {key})
+            memo[key] = sub.digest() if ok else None
+            if ok:
+                digest.update(b"R" + memo[key])
+            return ok
+        if isinstance(obj, DictionaryObject):
+            digest.update(b"S" if isinstance(obj, StreamObject) else b"D")
+            for key in sorted(obj):
+                digest.update(key.encode() + b"\0")
+                if not self._feed_key(digest, obj[key], memo, depth, visiting):
+                    return False
+            if isinstance(obj, StreamObject):
+                digest.update(b"%d:" % len(obj._data))
+                digest.update(obj._data)
+            return True
+        if isinstance(obj, ArrayObject):
+            digest.update(b"A%d" % len(obj))
+            for item in obj:
+                if not self._feed_key(digest, item, memo, depth, visiting):
+                    return False
+            return True
+        buf = BytesIO()
+        obj.write_to_stream(buf, None)
+        digest.update(type(obj).__name__.encode() + b":" + buf.getvalue() + b"\0")
+        return True
+
+    def stats(self):
+        return {
+            'pages': len(self.pages),
+            'bytes_written': self._out.offset,
+            'dedup_objects': self.dedup_objects,
+            'dedup_bytes_saved': self.dedup_bytes_saved,
+            'streams_copied': self.streams_copied,
+            'stream_bytes_copied': self.stream_bytes_copied,
+        }
+
+    def _copy_pages(self, source_pages, navigation_source=None, page_done=None):
+        remap = {}
+        queue = deque()
+        key_memo = {}
+        page_nums = []
+        for page in source_pages:
+            ref = page.indirect_reference
+            num = self._reserve()
+            if ref is not None:
+                key = (ref.idnum, ref.generation)
+                # The same page selected twice gets its own copy each time.
+                if key not in remap:
+                    remap[key] = num
+            page_nums.append(num)
+
+        def reference(indirect):
+            key = (indirect.idnum, indirect.generation)
+            if key not in remap:
+                target = indirect.get_object()
+                # Links into pages or page-tree nodes that are not part of the
+                # output would drag in the whole source document.
+                if isinstance(target, DictionaryObject) and target.get("/Type") in ("/Page", "/Pages"):
+                    return NullObject()
+                content_key = None
+                if self._dedup is not None and isinstance(target, StreamObject):
+                    content_key = self._content_key(indirect, key_memo)
+                    shared = self._dedup.get(content_key)
+                    if shared is not None:
+                        remap[key] = shared
+                        self.dedup_objects += 1
+                        self.dedup_bytes_saved += len(target._data)
+                        return _Reference(shared)
+                remap[key] = self._reserve()
+                if content_key is not None:
+                    self._dedup[content_key] = remap[key]
+                    if self._keys is not None:
+                        self._keys[remap[key]] = content_key
+                queue.append((remap[key], target, False))
+            return _Reference(remap[key])
+
+        def translate(obj):
+            if isinstance(obj, IndirectObject):
+                return reference(obj)
+            if isinstance(obj, StreamObject):
+                # The encoded bytes as read from the source, filters and all.
+                copy = obj.__class__()
+                copy._data = obj._data
+                self.streams_copied += 1
+                self.stream_bytes_copied += len(obj._data)
+                for key, value in obj.items():
+                    copy[key] = translate(value)
+                return copy
+            if isinstance(obj, DictionaryObject):
+                copy = DictionaryObject()
+                for key, value in obj.items():
+                    copy[key] = translate(value)
+                return copy
+            if isinstance(obj, ArrayObject):
+                return ArrayObject(translate(item) for item in obj)
+            return obj
+
+        def drain():
+            while queue:
+                num, obj, is_page = queue.popleft()
+                if is_page:
+                    copy = DictionaryObject()
+                    for key, value in obj.items():
+                        if key not in _PAGE_EXCLUDED_KEYS:
+                            copy[key] = translate(value)
+                    copy[NameObject("/Parent")] = _Reference(self._pages_num)
+                else:
+                    copy = translate(obj)
+                self._write_object(num, copy)
+                if isinstance(obj, StreamObject):
+                    _forget(obj)
+
+        # Each page is written with everything it references before the
+        # next one is read, so only one page's objects are in memory.
+        for page_num, page in zip(page_nums, source_pages):
+            queue.append((page_num, page, True))
+            drain()
+            self.pages.append(_Reference(page_num))
+            if page_done is not None:
+                page_done()
+        if navigation_source is not None:
+            copied = {(page.indirect_reference.idnum, page.indirect_reference.generation)
+                      for page in source_pages if page.indirect_reference is not None}
+            self._import_navigation(navigation_source, translate, copied)
+            drain()
+
+    def _import_navigation(self, reader, translate, copied):
+        # Items pointing at pages that were not copied are dropped (outline
+        # items only if none of their children is kept), as in PdfWriter.
+        def target(dest):
+            page = dest.raw_get("/Page") if "/Page" in dest else None
+            if isinstance(page, IndirectObject) and (page.idnum, page.generation) in copied:
+                return page
+            return None
+
+        def items(outline):
+            entries = []
+            for item in outline:
+                if isinstance(item, list):
+                    # A nested list holds the children of the item before it.
+                    if entries:
+                        entries[-1][1].extend(items(item))
+                    continue
+                node = item.node if item.node is not None else DictionaryObject()
+                entry = DictionaryObject({NameObject("/Title"): TextStringObject(item["/Title"])})
+                if target(item) is not None:
+                    if "/A" in node:
+                        entry[NameObject("/A")] = translate(node.raw_get("/A"))
+                    else:
+                        entry[NameObject("/Dest")] = translate(item.dest_array)
+                for key in ("/C", "/F"):
+                    if key in node:
+                        entry[NameObject(key)] = translate(node.raw_get(key))
+                entries.append([entry, [], node.get("/Count", 0) < 0])
+            return [entry for entry in entries if "/Dest" in entry[0] or "/A" in entry[0] or entry[1]]
+
+        try:
+            outline, named = reader.outline, reader.named_destinations
+        except Exception as e:
+            print(f"Skipping unreadable outline: {str(e)}")
+            return
+        self._outline.extend(items(outline))
+        for name, dest in named.items():
+            if name not in self._named_dests and target(dest) is not None:
+                self._named_dests[name] = translate(dest.dest_array)
+
+    def _write_outline_level(self, entries, parent_num):
+        # Returns the first and last item numbers and how many items are visible.
+        nums = [self._reserve() for _ in entries]
+        visible = 0
+        for i, (entry, children, closed) in enumerate(entries):
+            entry[NameObject("/Parent")] = _Reference(parent_num)
+            if i > 0:
+                entry[NameObject("/Prev")] = _Reference(nums[i - 1])
+            if i + 1 < len(nums):
+                entry[NameObject("/Next")] = _Reference(nums[i + 1])
+            visible += 1
+            if children:
+                first, last, count = self._write_outline_level(children, nums[i])
+                entry[NameObject("/First")] = _Reference(first)
+                entry[NameObject("/Last")] = _Reference(last)
+                entry[NameObject("/Count")] = NumberObject(-count if closed else count)
+                if not closed:
+                    visible += count
+            self._write_object(nums[i], entry)
+        return nums[0], nums[-1], visible
+
+    def splice(self, pdf_path, index_path):
+        """Copy every page of ``pdf_path``, written with ``splice_index=index_path``.
+
+        Object bodies are copied byte for byte from the file; only the object
+        numbers in headers and references are rewritten, so nothing is
+        parsed or re-serialized. Its outline and named destinations are kept.
+
+        With ``dedup``, a stream whose content key (recorded when the file
+        was written with ``dedup``) matches one this writer already holds
+        is not copied; references to it point at the existing object.
+        Objects only that stream referenced are still copied.
+        """
+        with open(index_path, "rb") as f:
+            if f.read(len(SPLICE_INDEX_MAGIC)) != SPLICE_INDEX_MAGIC:
+                raise ValueError(f"{index_path} is not a splice index")
+            header = array('q')
+            header.fromfile(f, 5)
+            num_objects, num_spans, num_refs, num_pages, meta_size = header
+            spans, refs, page_nums = array('q'), array('q'), array('q')
+            spans.fromfile(f, num_spans)
+            refs.fromfile(f, num_refs)
+            page_nums.fromfile(f, num_pages)
+            meta = f.read(meta_size)
+            key_nums = array('q')
+            count = f.read(8)
+            if count:
+                key_nums.fromfile(f, array('q', count)[0])
+                digests = f.read()
+
+        # The fragment's page tree becomes ours; its other objects follow the
+        # ones written so far, unless this writer already holds their stream.
+        numbers = {1: self._pages_num}
+        new_keys = {}
+        if self._dedup is not None:
+            for i, num in enumerate(key_nums):
+                key = digests[i * 20:(i + 1) * 20]
+                if key in self._dedup:
+                    numbers[num] = self._dedup[key]
+                else:
+                    new_keys[num] = key
+        shared = set(numbers)
+        for i in range(0, len(spans), 3):
+            if spans[i] not in numbers:
+                numbers[spans[i]] = self._reserve()
+        for num, key in new_keys.items():
+            self._dedup.setdefault(key, numbers[num])
+        renumber = numbers.__getitem__
+
+        with open(pdf_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            ref = 0
+            for i in range(0, len(spans), 3):
+                num, pos, end = spans[i], spans[i + 1], spans[i + 2]
+                if num in shared:
+                    while ref < len(refs) and refs[ref] < end:
+                        ref += 2
+                    self.dedup_objects += 1
+                    self.dedup_bytes_saved += end - pos
+                    continue
+                self._offsets[renumber(num)] = self._out.offset
+                self._out.write(b"%d 0 obj\n" % renumber(num))
+                while ref < len(refs) and refs[ref] < end:
+                    offset, target = refs[ref], refs[ref + 1]
+                    self._out.write(data[pos:offset])
+                    self._out.write(b"%d 0 R" % renumber(target))
+                    pos = offset + len(b"%d 0 R" % target)
+                    ref += 2
+                self._out.write(data[pos:end])
+                self._out.write(b"\nendobj\n")
+        self.pages.extend(_Reference(renumber(num)) for num in page_nums)
+
+        outline, named = read_object(BytesIO(meta), None)
+        self._outline.extend(_outline_entries(outline, renumber))
+        for i in range(0, len(named), 2):
+            self._named_dests.setdefault(named[i], _renumbered(named[i + 1], renumber))
+        return len(page_nums)
+
+    def _write_splice_index(self):
+        meta = BytesIO()
+        named = ArrayObject()
+        for name in sorted(self._named_dests):
+            named.extend([TextStringObject(name), self._named_dests[name]])
+        ArrayObject([_outline_array(self._outline), named]).write_to_stream(meta, None)
+        header = array('q', [self._next_num - 3, len(self._spans), len(self._out.refs), len(self.pages),
+                             len(meta.getvalue())])
+        with open(self._splice_index, "wb") as f:
+            f.write(SPLICE_INDEX_MAGIC)
+            for values in (header, self._spans, self._out.refs, array('q', (ref.idnum for ref in self.pages))):
+                values.tofile(f)
+            f.write(meta.getvalue())
+            if self._keys:
+                # Optional trailer: count, object numbers, 20-byte content keys.
+                array('q', [len(self._keys)]).tofile(f)
+                array('q', self._keys).tofile(f)
+                f.write(b"".join(self._keys.values()))
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._splice_index:
+            # Only the copied objects are recorded; the page tree, catalog
+            # and outline below are rebuilt by whoever splices this file.
+            self._write_splice_index()
+            self._spans = self._out.refs = None
+        pages = DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Kids"): ArrayObject(self.pages),
+            NameObject("/Count"): NumberObject(len(self.pages)),
+        })
+        self._write_object(self._pages_num, pages)
+        catalog = DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): _Reference(self._pages_num),
+        })
+        if self._outline:
+            outline_num = self._reserve()
+            first, last, count = self._write_outline_level(self._outline, outline_num)
+            self._write_object(outline_num, DictionaryObject({
+                NameObject("/Type"): NameObject("/Outlines"),
+                NameObject("/First"): _Reference(first),
+                NameObject("/Last"): _Reference(last),
+                NameObject("/Count"): NumberObject(count),
+            }))
+            catalog[NameObject("/Outlines")] = _Reference(outline_num)
+        if self._named_dests:
+            names = ArrayObject()
+            for name in sorted(self._named_dests):
+                names.extend([TextStringObject(name), self._named_dests[name]])
+            catalog[NameObject("/Names")] = DictionaryObject({
+                NameObject("/Dests"): DictionaryObject({NameObject("/Names"): names}),
+            })
+        self._write_object(self._catalog_num, catalog)
+
+        xref_offset = self._out.offset
+        size = self._next_num
+        lines = [b"xref\n0 %d\n" % size, b"0000000000 65535 f \n"]
+        for num in range(1, size):
+            lines.append(b"%010d 00000 n \n" % self._offsets[num])
+        self._out.write(b"".join(lines))
+        self._out.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                        % (size, self._catalog_num, xref_offset))
+
+__all__ = ['StreamingPdfWriter']
@@ -0,0 +1,306 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import fitz  # PyMuPDF
+from io import BytesIO
+from PIL import Image
+from pdf_compiler import ReaderPool
+import metrics
+
+THUMBNAIL_CACHE_DIR = os.environ.get("THUMBNAIL_CACHE_DIR", os.path.join(".cache", "thumbnails"))
+THUMBNAIL_MEMORY_BYTES = int(os.environ.get("THUMBNAIL_MEMORY_BYTES", str(64 * 1024 * 1024)))
+THUMBNAIL_DISK_BYTES = int(os.environ.get("THUMBNAIL_DISK_BYTES", str(512 * 1024 * 1024)))
+
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+
+MIMETYPES = {
+    'png': 'image/png',
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+    'ppm': 'image/x-portable-pixmap',
+}
+
+# Open fitz documents shared by every renderer in the process
+document_pool = ReaderPool(fitz.open, closer=lambda doc: doc.close(), stage='open_document')
+metrics.register_cache('document_pool', document_pool.stats)
+
+ThumbnailKey = namedtuple('ThumbnailKey', ['path', 'page', 'scale', 'fmt', 'width', 'etag', 'mtime'])
+
+def thumbnail_key(path, page, scale=1.0, fmt='png', width=None):
+    """Cache key for ``page`` (0-based) rendered at ``scale``, or at ``width`` pixels wide if given."""
+    if fmt not in MIMETYPES:
+        raise ValueError(f"Unsupported image format: {fmt}")
+    _, mtime_ns, size = ReaderPool.key_for(path)
+    path = os.path.abspath(path)
+    raw = f"{path}\0{mtime_ns}\0{size}\0{page}\0{scale}\0{fmt}\0{width}".encode()
+    return ThumbnailKey(path, page, scale, fmt, width, hashlib.sha1(raw).hexdigest(), mtime_ns / 1e9)
+
+def _render(doc, key):
+    with metrics.stage('preview_render'):
+        return _rasterize(doc, key)
+
+def _rasterize(doc, key):
+    page = doc[key.page]
+    # Rasterize directly at the requested size instead of downsampling later.
+    scale = key.width / page.rect.width if key.width else key.scale
+    pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale))
+    if key.fmt == 'jpeg':
+        return pix.tobytes('jpg', jpg_quality=JPEG_QUALITY)
+    if key.fmt == 'webp':
+        img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        buf = BytesIO()
+        img.save(buf, 'WEBP', quality=WEBP_QUALITY)
+        return buf.getvalue()
+    return pix.tobytes(key.fmt)
+
+def render_page(path, page, scale=1.0, fmt='png', width=None):
+    with document_pool.open(path) as doc:
+        return _render(doc, thumbnail_key(path, page, scale, fmt, width))
+
+def page_count(path):
+    with document_pool.open(path) as doc:
+        return len(doc)
+
+class ThumbnailCache:
+    """Two-level (memory, then disk) LRU cache of rendered pages.
+
+    Keys include the source file's mtime and size, so edited files are
+    re-rendered and their old entries age out through normal eviction.
+    """
+
+    def __init__(self, cache_dir=THUMBNAIL_CACHE_DIR, memory_bytes=THUMBNAIL_MEMORY_BYTES,
+                 disk_bytes=THUMBNAIL_DISK_BYTES):
+        self.cache_dir = cache_dir
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._disk = None
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumbnail-prefetch")
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _disk_path(self, etag):
+        return os.path.join(self.cache_dir, etag[:2], etag)
+
+    def _load_disk_index(self):
+        # Called with the lock held
+        self._disk = OrderedDict()
+        if not os.path.isdir(self.cache_dir):
+            return
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                st = os.stat(os.path.join(root, name))
+                files.append((st.st_atime, name, st.st_size))
+        for _, name, size in sorted(files):
+            self._disk[name] = size
+            self._disk_size += size
+
+    def _remember(self, etag, data):
+        # Called with the lock held
+        if etag in self._memory:
+            return
+        self._memory[etag] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _store_disk(self, etag, data):
+        path = self._disk_path(etag)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        evicted = []
+        with self._lock:
+            if etag not in self._disk:
+                self._disk[etag] = len(data)
+                self._disk_size += len(data)
+            while self._disk_size > self.disk_bytes and len(self._disk) > 1:
+                name, size = self._disk.popitem(last=False)
+                self._disk_size -= size
+                evicted.append(name)
+        for name in evicted:
+            try:
+                os.remove(self._disk_path(name))
+            except OSError:
+                pass
+
+    def _read_disk(self, etag):
+        with self._lock:
+            if self._disk is None:
+                self._load_disk_index()
+            if etag not in self._disk:
+                return None
+            self._disk.move_to_end(etag)
+        try:
+            with open(self._disk_path(etag), 'rb') as f:
+                return f.read()
+        except OSError:
+            with self._lock:
+                self._disk_size -= self._disk.pop(etag, 0)
+            return None
+
+    def get(self, key):
+        with self._lock:
+            data = self._memory.get(key.etag)
+            if data is not None:
+                self._memory.move_to_end(key.etag)
+                self.hits += 1
+                return data
+            # Concurrent requests for the same page wait for one render.
+            event = self._inflight.get(key.etag)
+            owner = event is None
+            if owner:
+                event = self._inflight[key.etag] = threading.Event()
+        if not owner:
+            event.wait()
+            return self.get(key)
+        try:
+            data = self._read_disk(key.etag)
+            if data is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key.etag, data)
+                return data
+            with document_pool.open(key.path) as doc:
+                data = _render(doc, key)
+            with self._lock:
+                self.misses += 1
+                self._remember(key.etag, data)
+            self._store_disk(key.etag, data)
+            return data
+        finally:
+            with self._lock:
+                del self._inflight[key.etag]
+            event.set()
+
+    def render(self, path, page, scale=1.0, fmt='png', width=None):
+        return self.get(thumbnail_key(path, page, scale, fmt, width))
+
+    def get_many(self, keys):
+        """Return images for ``keys`` (all from one document), rendering misses with one open document."""
+        results = {}
+        with self._lock:
+            for key in keys:
+                data = self._memory.get(key.etag)
+                if data is not None:
+                    self._memory.move_to_end(key.etag)
+                    self.hits += 1
+                    results[key.etag] = data
+        missing = [key for key in keys if key.etag not in results]
+        for key in list(missing):
+            data = self._read_disk(key.etag)
+            if data is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key.etag, data)
+                results[key.etag] = data
+                missing.remove(key)
+        if missing:
+            rendered = []
+            with document_pool.open(missing[0].path) as doc:
+                for key in missing:
+                    rendered.append((key, _render(doc, key)))
+            for key, data in rendered:
+                with self._lock:
+                    self.misses += 1
+                    self._remember(key.etag, data)
+                self._store_disk(key.etag, data)
+                results[key.etag] = data
+        return [results[key.etag] for key in keys]
+
+    def prefetch(self, path, pages, scale=1.0, fmt='png', width=None):
+        for page in pages:
+            self._prefetcher.submit(self._prefetch_one, path, page, scale, fmt, width)
+
+    def _prefetch_one(self, path, page, scale, fmt, width):
+        try:
+            self.render(path, page, scale, fmt, width)
+        except Exception as e:
+            print(f"Error prefetching page {page} of {path}: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_size,
+                'disk_bytes': self._disk_size,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+            }
+
+def last_modified(key):
+    return datetime.fromtimestamp(int(key.mtime), tz=timezone.utc)
+
+def sprite_sheet(images, fmt='png', columns=None):
+    """Tile ``images`` into one sheet; returns the encoded sheet and each tile's [x, y, w, h]."""
+    tiles = [Image.open(BytesIO(data)) for data in images]
+    columns = columns or max(1, int(len(tiles) ** 0.5 + 0.999))
+    cell_w = max(tile.width for tile in tiles)
+    cell_h = max(tile.height for tile in tiles)
+    rows = (len(tiles) + columns - 1) // columns
+    sheet = Image.new("RGB", (cell_w * columns, cell_h * rows), "white")
+    boxes = []
+    for i, tile in enumerate(tiles):
+        x, y = (i % columns) * cell_w, (i // columns) * cell_h
+        sheet.paste(tile, (x, y))
+        boxes.append([x, y, tile.width, tile.height])
+    buf = BytesIO()
+    if fmt == 'jpeg':
+        sheet.save(buf, 'JPEG', quality=JPEG_QUALITY)
+    elif fmt == 'webp':
+        sheet.save(buf, 'WEBP', quality=WEBP_QUALITY)
+    else:
+        sheet.save(buf, 'PNG')
+    return buf.getvalue(), boxes
+
+thumbnail_cache = ThumbnailCache()
+metrics.register_cache('thumbnails', thumbnail_cache.stats)
+
+def cached_preview(key):
+    """The image for ``key`` from this process's thumbnail cache."""
+    return thumbnail_cache.get(key)
+
+def preview_batch(keys, fmt, layout='multipart'):
+    """Images for ``keys`` (pages of one document) as one response body.
+
+    Returns ``(content_type, headers, body)``: a ``multipart/mixed`` body
+    with one part per page, or with ``layout='sprite'`` one tiled image
+    whose tile boxes are in the ``X-Sprite-Layout`` header.
+    """
+    images = thumbnail_cache.get_many(keys)
+    if layout == 'sprite':
+        sheet, boxes = sprite_sheet(images, fmt)
+        layout_header = json.dumps({str(key.page + 1): box for key, box in zip(keys, boxes)})
+        return MIMETYPES[fmt], {'X-Sprite-Layout': layout_header}, sheet
+    boundary = uuid.uuid4().hex
+    parts = []
+    for key, data in zip(keys, images):
+        parts.append(f"--{boundary}\r\nContent-Type: {MIMETYPES[fmt]}\r\nX-Page: {key.page + 1}\r\n"
+                     f"Content-Length: {len(data)}\r\n\r\n".encode())
+        parts.append(data)
+        parts.append(b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return f"multipart/mixed; boundary={boundary}", {}, b"".join(parts)
+
+def batch_etag(keys):
+    return hashlib.sha1(''.join(key.etag for key in keys).encode()).hexdigest()
+
+__all__ = ['ThumbnailCache', 'thumbnail_cache', 'thumbnail_key', 'render_page', 'page_count',
+           'document_pool', 'last_modified', 'sprite_sheet', 'cached_preview', 'preview_batch', 'batch_etag',
+           'MIMETYPES']
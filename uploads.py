@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "uploads")
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(1024 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 256 * 1024
+
+PDF_MAGIC = b"%PDF-"
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{64}$")
+
+class UploadRejected(Exception):
+    pass
+
+class SpoolFile:
+    """Write-only file that hashes data as it is spooled to disk.
+
+    Used both as a werkzeug ``stream_factory`` target for multipart parts
+    and for raw request bodies, so an upload is never held in memory.
+    """
+
+    def __init__(self, spool_dir, max_bytes=UPLOAD_MAX_BYTES):
+        fd, self.path = tempfile.mkstemp(suffix=".part", dir=spool_dir)
+        self._file = os.fdopen(fd, 'wb')
+        self._digest = hashlib.sha256()
+        self._head = b""
+        self.max_bytes = max_bytes
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadRejected(f"Upload exceeds {self.max_bytes} bytes")
+        if len(self._head) < len(PDF_MAGIC):
+            self._head += data[:len(PDF_MAGIC)]
+        self._digest.update(data)
+        self._file.write(data)
+        return len(data)
+
+    def seek(self, *args):
+        # werkzeug rewinds the container once a part is complete; nothing is read back.
+        return 0
+
+    def read(self, *args):
+        return b""
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+    def is_pdf(self):
+        return self._head.startswith(PDF_MAGIC)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def discard(self):
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+class UploadStore:
+    """Content-addressed store for uploaded PDFs.
+
+    Each upload is spooled in chunks to a temporary file while its SHA-256
+    is computed, then renamed to ``<sha256>.pdf``. The hash is the upload
+    ID, so identical uploads share one file on disk.
+    """
+
+    def __init__(self, upload_dir=UPLOAD_DIR, max_bytes=UPLOAD_MAX_BYTES):
+        self.upload_dir = upload_dir
+        self.spool_dir = os.path.join(upload_dir, "spool")
+        self.max_bytes = max_bytes
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.stored = 0
+        self.deduplicated = 0
+
+    def spool(self):
+        return SpoolFile(self.spool_dir, self.max_bytes)
+
+    def stream_factory(self, total_content_length=None, content_type=None, filename=None, content_length=None):
+        return self.spool()
+
+    def path(self, upload_id):
+        if not _UPLOAD_ID.match(upload_id or ""):
+            raise KeyError(upload_id)
+        path = os.path.join(self.upload_dir, f"{upload_id}.pdf")
+        if not os.path.exists(path):
+            raise KeyError(upload_id)
+        return path
+
+    def _meta_path(self, upload_id):
+        return os.path.join(self.upload_dir, f"{upload_id}.json")
+
+    def info(self, upload_id):
+        self.path(upload_id)
+        with open(self._meta_path(upload_id)) as f:
+            return json.load(f)
+
+    def commit(self, spool, filename=None):
+        """Move a finished spool file into the store; returns its metadata."""
+        spool.close()
+        if not spool.is_pdf():
+            spool.discard()
+            raise UploadRejected(f"{filename or 'Upload'} is not a PDF")
+        upload_id = spool.hexdigest()
+        target = os.path.join(self.upload_dir, f"{upload_id}.pdf")
+        with self._lock:
+            duplicate = os.path.exists(target)
+            if duplicate:
+                spool.discard()
+                self.deduplicated += 1
+            else:
+                os.replace(spool.path, target)
+                self.stored += 1
+                meta = {'id': upload_id, 'filename': os.path.basename(filename or f"{upload_id}.pdf"),
+                        'size': spool.size, 'uploaded_at': time.time()}
+                tmp_meta = f"{self._meta_path(upload_id)}.tmp"
+                with open(tmp_meta, 'w') as f:
+                    json.dump(meta, f)
+                os.replace(tmp_meta, self._meta_path(upload_id))
+        return dict(self.info(upload_id), duplicate=duplicate)
+
+    def store_stream(self, stream, filename=None):
+        """Spool a raw byte stream (e.g. a request body) into the store."""
+        spool = self.spool()
+        try:
+            for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_BYTES), b""):
+                spool.write(chunk)
+        except BaseException:
+            spool.discard()
+            raise
+        return self.commit(spool, filename)
+
+    def clear_spool(self, max_age=24 * 3600):
+        """Remove partial uploads left behind by dropped connections."""
+        removed = 0
+        cutoff = time.time() - max_age
+        for name in os.listdir(self.spool_dir):
+            path = os.path.join(self.spool_dir, name)
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        return removed
+
+    def stats(self):
+        return {'stored': self.stored, 'deduplicated': self.deduplicated}
+
+upload_store = UploadStore()
+
+__all__ = ['UploadStore', 'SpoolFile', 'UploadRejected', 'upload_store', 'UPLOAD_MAX_BYTES']
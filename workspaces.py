@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+WORKSPACE_TTL = float(os.environ.get("WORKSPACE_TTL", str(2 * 3600)))
+# Empty disables persistence; otherwise each workspace is saved as JSON here.
+WORKSPACE_DIR = os.environ.get("WORKSPACE_DIR", "")
+WORKSPACE_SWEEP_INTERVAL = 60
+
+class Workspace:
+    """An ordered set of PDF names belonging to one client.
+
+    Names are kept in a dict-backed doubly linked list, so membership,
+    add, remove and moving a name before another are O(1); moving by
+    position walks from the nearer end of the list. Every method
+    takes the workspace's own lock, so clients never contend with each
+    other.
+    """
+
+    def __init__(self, key, names=()):
+        self.key = key
+        self._lock = threading.RLock()
+        self._links = {}
+        self._head = None
+        self._tail = None
+        self.last_used = time.monotonic()
+        for name in names:
+            self.add(name)
+
+    def __contains__(self, name):
+        return name in self._links
+
+    def __len__(self):
+        return len(self._links)
+
+    def names(self):
+        with self._lock:
+            result = []
+            node = self._head
+            while node is not None:
+                result.append(node)
+                node = self._links[node][1]
+            return result
+
+    def _unlink(self, name):
+        prev, nxt = self._links.pop(name)
+        if prev is None:
+            self._head = nxt
+        else:
+            self._links[prev][1] = nxt
+        if nxt is None:
+            self._tail = prev
+        else:
+            self._links[nxt][0] = prev
+
+    def _link_before(self, name, anchor):
+        if anchor is None:
+            self._links[name] = [self._tail, None]
+            if self._tail is None:
+                self._head = name
+            else:
+                self._links[self._tail][1] = name
+            self._tail = name
+            return
+        prev = self._links[anchor][0]
+        self._links[name] = [prev, anchor]
+        self._links[anchor][0] = name
+        if prev is None:
+            self._head = name
+        else:
+            self._links[prev][1] = name
+
+    def add(self, name):
+        with self._lock:
+            if name in self._links:
+                return False
+            self._link_before(name, None)
+            return True
+
+    def remove(self, name):
+        with self._lock:
+            if name not in self._links:
+                return False
+            self._unlink(name)
+            return True
+
+    def move(self, name, before=None):
+        """Move ``name`` in front of ``before`` (to the end when None)."""
+        with self._lock:
+            if name not in self._links or (before is not None and before not in self._links):
+                return False
+            if name != before:
+                self._unlink(name)
+                self._link_before(name, before)
+            return True
+
+    def _name_at(self, index):
+        # Walk from whichever end is nearer; called with the lock held.
+        if index < len(self._links) // 2:
+            node = self._head
+            for _ in range(index):
+                node = self._links[node][1]
+        else:
+            node = self._tail
+            for _ in range(len(self._links) - 1 - index):
+                node = self._links[node][0]
+        return node
+
+    def move_index(self, old_index, new_index):
+        """Reorder by position, as ``list.insert(new, list.pop(old))`` would.
+
+        Only the nodes up to the two positions are visited; no list of
+        names is built.
+        """
+        with self._lock:
+            size = len(self._links)
+            if not (-size <= old_index < size):
+                return False
+            name = self._name_at(old_index % size)
+            self._unlink(name)
+            # list.insert clamps the position into the shortened list.
+            if new_index < 0:
+                new_index = max(0, new_index + size - 1)
+            new_index = min(new_index, size - 1)
+            self._link_before(name, self._name_at(new_index) if new_index < size - 1 else None)
+            return True
+
+class WorkspaceStore:
+    """Workspaces keyed by session or API token, evicted after ``ttl`` idle seconds.
+
+    With ``persist_dir`` set, workspaces are written to disk after every
+    change and reloaded on first use, so they survive eviction and restarts.
+    """
+
+    def __init__(self, ttl=WORKSPACE_TTL, persist_dir=WORKSPACE_DIR):
+        self.ttl = ttl
+        self.persist_dir = persist_dir or None
+        if self.persist_dir:
+            os.makedirs(self.persist_dir, exist_ok=True)
+        self._workspaces = {}
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + WORKSPACE_SWEEP_INTERVAL
+
+    @staticmethod
+    def key_for(token):
+        # Raw tokens are never used as file names or kept in memory.
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.persist_dir, f"{key}.json")
+
+    def _load(self, key):
+        if self.persist_dir and os.path.exists(self._path(key)):
+            try:
+                with open(self._path(key)) as f:
+                    return Workspace(key, json.load(f)['files'])
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Error loading workspace {key}: {str(e)}")
+        return Workspace(key)
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            workspace = self._workspaces.get(key)
+            if workspace is None:
+                workspace = self._workspaces[key] = self._load(key)
+            workspace.last_used = now
+            return workspace
+
+    def save(self, workspace):
+        if not self.persist_dir:
+            return
+        path = self._path(workspace.key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with workspace._lock:
+            with open(tmp_path, 'w') as f:
+                json.dump({'files': workspace.names()}, f)
+            os.replace(tmp_path, path)
+
+    def _sweep(self, now):
+        # Called with the lock held
+        self._next_sweep = now + WORKSPACE_SWEEP_INTERVAL
+        expired = [key for key, ws in self._workspaces.items() if now - ws.last_used > self.ttl]
+        for key in expired:
+            del self._workspaces[key]
+        return len(expired)
+
+    def evict_idle(self):
+        with self._lock:
+            return self._sweep(time.monotonic())
+
+    def __len__(self):
+        return len(self._workspaces)
+
+workspace_store = WorkspaceStore()
+
+__all__ = ['Workspace', 'WorkspaceStore', 'workspace_store']